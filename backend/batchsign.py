@@ -0,0 +1,344 @@
+from pyccn import ContentObject, Key
+import pyccn
+from ccnxsocket import PeetsClosure
+from threading import RLock
+from hashlib import sha256
+from struct import pack, unpack_from
+from time import time
+from log import Logger
+
+'''
+.. module:: batchsign
+  :platform: Mac OS X, Linux
+  :synopsis: Sign a batch of media Content Objects with one signature over the root of a Merkle tree.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+# first byte of a batch signed payload; RTP/RTCP (10xxxxxx) and STUN (00xxxxxx) never start with it
+batch_tag = 0xF0
+# tag, session, batch number, leaf index, proof length
+header_format = '!BIIHB'
+header_size = 12
+hash_size = 32
+
+# the kinds of the items of the ccnb encoding
+(ccnb_ext, ccnb_tag, ccnb_dtag, ccnb_attr, ccnb_dattr, ccnb_blob, ccnb_udata) = range(7)
+# the dtags of the elements of a Content Object used here
+(dtag_name, dtag_component, dtag_content, dtag_signed_info, dtag_signature, dtag_content_object) = (14, 15, 19, 20, 37, 64)
+
+def get_leaf_hash(name, payload):
+  '''The hash of a packet in the Merkle tree, binding the payload to its name
+
+  Args:
+    name (str): the uri of the Content Object
+    payload (bytes): the packet
+  '''
+  return sha256(pack('!H', len(name)) + name + payload).digest()
+
+def get_parent_hash(left, right):
+  return sha256(left + right).digest()
+
+def get_levels(leaves):
+  '''Build the Merkle tree over the leaves.
+
+  Returns:
+    the list of levels, from the leaves up to the root; an odd node at the end of a level is paired with itself
+  '''
+  levels = [leaves]
+  while len(levels[-1]) > 1:
+    level = levels[-1]
+    if len(level) % 2 == 1:
+      level = level + [level[-1]]
+    levels.append([get_parent_hash(level[i], level[i + 1]) for i in xrange(0, len(level), 2)])
+  return levels
+
+def get_proof(levels, index):
+  '''Get the inclusion proof of a leaf, i.e. the sibling hashes from the leaf level up
+  '''
+  proof = []
+  for level in levels[:-1]:
+    sibling = index ^ 1
+    proof.append(level[sibling] if sibling < len(level) else level[index])
+    index >>= 1
+  return proof
+
+def get_root_from_proof(leaf, index, proof):
+  '''Recompute the root from a leaf and its inclusion proof
+  '''
+  node = leaf
+  for sibling in proof:
+    if index & 1:
+      node = get_parent_hash(sibling, node)
+    else:
+      node = get_parent_hash(node, sibling)
+    index >>= 1
+  return node
+
+def encode_header(value, kind):
+  '''Encode the header of a ccnb item: the value 7 bits per byte, with its 4 lowest bits and the kind in the last byte, which has the top bit set
+  '''
+  header = chr(0x80 | ((value & 0x0F) << 3) | kind)
+  value >>= 4
+  while value:
+    header = chr(value & 0x7F) + header
+    value >>= 7
+  return header
+
+def decode_header(ccnb, offset):
+  '''
+  Returns:
+    (value, kind, offset after the header)
+  '''
+  value = 0
+  while True:
+    byte = ord(ccnb[offset])
+    offset += 1
+    if byte & 0x80:
+      return ((value << 4) | ((byte >> 3) & 0x0F), byte & 0x07, offset)
+    value = (value << 7) | byte
+
+def skip_item(ccnb, offset):
+  '''
+  Returns:
+    the offset after the ccnb item (an element with its attributes and children, a blob or a udata) that starts at offset
+  '''
+  (value, kind, offset) = decode_header(ccnb, offset)
+  if kind in (ccnb_blob, ccnb_udata):
+    return offset + value
+  if kind in (ccnb_tag, ccnb_attr):
+    # the name of the tag or attribute, of value + 1 bytes
+    offset += value + 1
+  if kind in (ccnb_attr, ccnb_dattr):
+    # followed by the udata of its value
+    return skip_item(ccnb, offset)
+  while ccnb[offset] != '\x00':
+    offset = skip_item(ccnb, offset)
+  return offset + 1
+
+def encode_blob_element(dtag, data):
+  '''Encode an element that holds a blob, e.g. a Component or the Content
+  '''
+  if not data:
+    return encode_header(dtag, ccnb_dtag) + '\x00'
+  return encode_header(dtag, ccnb_dtag) + encode_header(len(data), ccnb_blob) + data + '\x00'
+
+def encode_name(components):
+  return encode_header(dtag_name, ccnb_dtag) + ''.join([encode_blob_element(dtag_component, c) for c in components]) + '\x00'
+
+def split_template(ccnb):
+  '''Cut the ccnb of a signed Content Object into the parts that do not depend on its name and content
+
+  Returns:
+    (the start of the Content Object up to and with its Signature, its SignedInfo)
+  '''
+  (value, kind, offset) = decode_header(ccnb, 0)
+  if (value, kind) != (dtag_content_object, ccnb_dtag):
+    raise ValueError('Not a Content Object')
+  parts = {}
+  while ccnb[offset] != '\x00':
+    end = skip_item(ccnb, offset)
+    (value, kind) = decode_header(ccnb, offset)[:2]
+    if kind == ccnb_dtag:
+      parts[value] = (offset, end)
+    offset = end
+  if dtag_signature not in parts or dtag_signed_info not in parts:
+    raise ValueError('No Signature or SignedInfo in the Content Object')
+  (start, end) = parts[dtag_signed_info]
+  return (ccnb[:parts[dtag_signature][1]], ccnb[start:end])
+
+def is_batched(content):
+  '''Whether the content of a Content Object is a batch signed packet
+  '''
+  return len(content) > header_size and ord(content[0]) == batch_tag
+
+def wrap(session, batch, index, proof, payload):
+  return pack(header_format, batch_tag, session, batch, index, len(proof)) + ''.join(proof) + payload
+
+def unwrap(content):
+  '''
+  Returns:
+    (session, batch number, leaf index, proof, payload)
+  '''
+  (tag, session, batch, index, depth) = unpack_from(header_format, content)
+  offset = header_size + depth * hash_size
+  proof = [content[header_size + i * hash_size: header_size + (i + 1) * hash_size] for i in xrange(depth)]
+  return (session, batch, index, proof, content[offset:])
+
+class BatchSigner(object):
+  ''' Publishes media packets in batches with a single signature per batch.
+  Packets are held for up to batch_interval seconds or until batch_size packets are collected. Then a Merkle tree is built over the packets, each packet is published under its own name carrying its inclusion proof, and the root is published under root_prefix/session/batch, signed with the key of the CcnxSocket.
+
+  *Note* that PyCCN can only encode a Content Object together with an RSA signature, so the packets are not signed at all: a template Content Object is signed once per freshness with a throw-away 512-bit key, and the ccnb of every packet is put together from its Signature and SignedInfo and the name and content of the packet. The signature of a packet therefore does not verify; consumers get it as UPCALL_CONTENT_BAD and check the inclusion proof against the signed root instead (see the accept_unverified kwarg of CcnxSocket). That leaves one RSA signature per batch.
+  '''
+
+  __logger = Logger.get_logger('BatchSigner')
+
+  def __init__(self, ccnx_socket, root_prefix, batch_size = 32, batch_interval = 0.02, reactor = None, *args, **kwargs):
+    '''
+    Args:
+      ccnx_socket (CcnxSocket): the socket to publish with
+      root_prefix (str): the prefix for the signed roots of the batches
+
+    Kwargs:
+      batch_size (int): the maximum number of packets in a batch
+      batch_interval (float): the maximum time in seconds a packet waits for its batch to be signed
+      reactor: the Twisted reactor to schedule the flush with; the global reactor is used if not given
+    '''
+    super(BatchSigner, self).__init__()
+    if reactor is None:
+      from twisted.internet import reactor
+    self.reactor = reactor
+    self.ccnx_socket = ccnx_socket
+    self.root_prefix = root_prefix
+    self.batch_size = batch_size
+    self.batch_interval = batch_interval
+    self.session = int(time())
+    self.batch = 0
+    # (PyCCN.Name, payload, freshness)
+    self.pending = []
+    self.flush_call = None
+    self.packet_key = Key()
+    self.packet_key.generateRSA(512)
+    self.packet_key_locator = pyccn.KeyLocator(self.packet_key)
+    self.signed_infos = {}
+    # freshness -> the parts of the template, see split_template
+    self.templates = {}
+
+  def get_signed_info(self, freshness):
+    si = self.signed_infos.get(freshness)
+    if si is None:
+      si = pyccn.SignedInfo()
+      si.publisherPublicKeyDigest = self.packet_key.publicKeyID
+      si.type = pyccn.CONTENT_DATA
+      si.freshnessSeconds = freshness
+      si.keyLocator = self.packet_key_locator
+      self.signed_infos[freshness] = si
+    return si
+
+  def get_template(self, freshness):
+    '''
+    Returns:
+      the parts of the ccnb of a Content Object signed with the throw-away key that the packets of that freshness share, see split_template
+    '''
+    template = self.templates.get(freshness)
+    if template is None:
+      co = ContentObject(self.ccnx_socket.get_pyccn_name(self.root_prefix), '', self.get_signed_info(freshness))
+      co.sign(self.packet_key)
+      template = split_template(co.get_ccnb())
+      self.templates[freshness] = template
+    return template
+
+  def publish_content(self, name, content, freshness = 5):
+    '''Queue a packet for the current batch; same arguments as CcnxSocket.publish_content
+    '''
+    self.pending.append((self.ccnx_socket.get_pyccn_name(name), content, freshness))
+    if len(self.pending) >= self.batch_size:
+      self.flush()
+    elif self.flush_call is None:
+      self.flush_call = self.reactor.callLater(self.batch_interval, self.flush)
+
+  def flush(self):
+    '''Sign and publish the current batch
+    '''
+    if self.flush_call is not None:
+      if self.flush_call.active():
+        self.flush_call.cancel()
+      self.flush_call = None
+    if not self.pending:
+      return
+
+    pending, self.pending = self.pending, []
+    names = [str(name) for (name, content, freshness) in pending]
+    levels = get_levels([get_leaf_hash(names[i], pending[i][1]) for i in xrange(len(pending))])
+    for (index, (name, content, freshness)) in enumerate(pending):
+      wrapped = wrap(self.session, self.batch, index, get_proof(levels, index), content)
+      (head, signed_info) = self.get_template(freshness)
+      ccnb = head + encode_name(name.components) + signed_info + encode_blob_element(dtag_content, wrapped) + '\x00'
+      self.ccnx_socket.put(ContentObject.from_ccnb(ccnb))
+
+    root_name = self.root_prefix + '/' + str(self.session) + '/' + str(self.batch)
+    self.ccnx_socket.publish_content(root_name, levels[-1][0] + pack('!H', len(pending)), max([freshness for (name, content, freshness) in pending]))
+    self.batch += 1
+
+class BatchVerifier(object):
+  ''' Checks batch signed packets against the signed roots of their batches.
+  The root of a batch is fetched the first time a packet of the batch arrives; packets are held until the root comes back and dropped if their inclusion proof does not match it.
+  The signature of the root is checked by PyCCN, which only gives UPCALL_CONTENT for verified Content Objects; the packets themselves come as UPCALL_CONTENT_BAD (see BatchSigner). The payloads are delivered in the reactor thread, or in the thread verify is called from if the root is known already.
+  '''
+
+  __logger = Logger.get_logger('BatchVerifier')
+
+  # the number of roots remembered
+  max_roots = 256
+
+  def __init__(self, ccnx_socket, *args, **kwargs):
+    '''
+    Args:
+      ccnx_socket (CcnxSocket): the socket to fetch the roots with
+    '''
+    super(BatchVerifier, self).__init__()
+    self.ccnx_socket = ccnx_socket
+    self.lock = RLock()
+    # root name -> root hash
+    self.roots = {}
+    self.root_names = []
+    # root name -> [(computed root, payload, deliver)]
+    self.waiting = {}
+    # the packets are delivered from root_callback, so it runs in the reactor thread like the rest of the media path
+    self.root_closure = PeetsClosure(msg_callback = self.root_callback, timeout_callback = self.root_timeout_callback, in_reactor = True)
+    self.verified = 0
+    self.rejected = 0
+
+  def verify(self, root_prefix, name, content, deliver):
+    '''Deliver the payload of a batch signed packet once its inclusion proof is checked
+
+    Args:
+      root_prefix (str): the prefix of the roots of the publisher
+      name (str): the uri of the Content Object
+      content (bytes): the content of the Content Object
+      deliver: called with the payload if the packet is verified
+    '''
+    (session, batch, index, proof, payload) = unwrap(content)
+    computed = get_root_from_proof(get_leaf_hash(name, payload), index, proof)
+    root_name = root_prefix + '/' + str(session) + '/' + str(batch)
+    with self.lock:
+      root = self.roots.get(root_name)
+      if root is None:
+        waiting = self.waiting.get(root_name)
+        if waiting is None:
+          self.waiting[root_name] = [(computed, payload, deliver)]
+          self.ccnx_socket.send_interest(root_name, self.root_closure)
+        else:
+          waiting.append((computed, payload, deliver))
+        return
+    self.check(root, computed, payload, deliver)
+
+  def check(self, root, computed, payload, deliver):
+    if root == computed:
+      self.verified += 1
+      deliver(payload)
+    else:
+      self.rejected += 1
+      self.__class__.__logger.warn('Dropping a packet that does not match the root of its batch')
+
+  def root_callback(self, interest, data):
+    root_name = str(interest.name)
+    root = data.content[:hash_size]
+    with self.lock:
+      self.roots[root_name] = root
+      self.root_names.append(root_name)
+      if len(self.root_names) > self.__class__.max_roots:
+        del self.roots[self.root_names.pop(0)]
+      waiting = self.waiting.pop(root_name, [])
+    for (computed, payload, deliver) in waiting:
+      self.check(root, computed, payload, deliver)
+
+  def root_timeout_callback(self, interest):
+    root_name = str(interest.name)
+    with self.lock:
+      waiting = self.waiting.pop(root_name, [])
+    if waiting:
+      self.__class__.__logger.debug('Root %s timed out, dropping %d packets', root_name, len(waiting))
+    return pyccn.RESULT_OK
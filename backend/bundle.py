@@ -0,0 +1,125 @@
+from struct import pack, unpack_from
+
+'''
+.. module:: bundle
+  :platform: Mac OS X, Linux
+  :synopsis: Pack several RTP packets into the content of one Content Object, and unpack them on the consumer side.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+# first byte of a bundle; like batchsign.batch_tag, neither RTP/RTCP nor STUN starts with it
+bundle_tag = 0xF1
+# tag, number of packets
+header_format = '!BB'
+header_size = 2
+length_format = '!H'
+length_size = 2
+
+def is_bundled(content):
+  '''Whether a payload is a bundle of packets
+  '''
+  return len(content) >= header_size and ord(content[0]) == bundle_tag
+
+def bundle(packets):
+  '''Frame packets into one payload
+
+  Args:
+    packets (list): at most 255 packets, each shorter than 64 KB
+  '''
+  return pack(header_format, bundle_tag, len(packets)) + ''.join([pack(length_format, len(p)) + p for p in packets])
+
+def unbundle(content):
+  '''
+  Returns:
+    the list of packets in a bundle; a payload that is not a bundle is a list of itself. A truncated bundle gives the packets before the first one cut off.
+  '''
+  if not is_bundled(content):
+    return [content]
+  (tag, count) = unpack_from(header_format, content)
+  offset = header_size
+  packets = []
+  for i in xrange(count):
+    if offset + length_size > len(content):
+      break
+    (length,) = unpack_from(length_format, content, offset)
+    offset += length_size
+    if offset + length > len(content):
+      break
+    packets.append(content[offset: offset + length])
+    offset += length
+  return packets
+
+class Bundler(object):
+  ''' Collects the outgoing RTP packets and publishes them in bundles.
+  A bundle is published when the packet that ends a video frame (the one with the RTP marker bit) is added, when the next packet would not fit in max_bytes, or at the latest interval seconds after its first packet.
+  Must be used from the reactor thread.
+  '''
+
+  # the most packets in a bundle, as the count is one byte
+  max_packets = 255
+
+  def __init__(self, publish, interval = 0.01, max_bytes = 8000, reactor = None, *args, **kwargs):
+    '''
+    Args:
+      publish : called with the content of every bundle
+
+    Kwargs:
+      interval (float): the longest time in seconds a packet waits for its bundle
+      max_bytes (int): the largest bundle in bytes, which must fit in a Content Object
+      reactor: the Twisted reactor to schedule the flush with; the global reactor is used if not given
+    '''
+    super(Bundler, self).__init__()
+    if reactor is None:
+      from twisted.internet import reactor
+    self.reactor = reactor
+    self.publish = publish
+    self.interval = interval
+    self.max_bytes = max_bytes
+    self.pending = []
+    self.size = header_size
+    self.flush_call = None
+    self.packets = 0
+    self.bundles = 0
+
+  def add(self, data):
+    '''Queue an outgoing packet
+
+    Args:
+      data (bytes): the RTP packet
+    '''
+    size = length_size + len(data)
+    if self.pending and (self.size + size > self.max_bytes or len(self.pending) >= self.__class__.max_packets):
+      self.flush()
+
+    self.pending.append(data)
+    self.size += size
+    self.packets += 1
+    # the marker bit ends a video frame
+    if len(data) > 1 and ord(data[1]) & 0x80:
+      self.flush()
+    elif self.flush_call is None:
+      self.flush_call = self.reactor.callLater(self.interval, self.flush)
+
+  def flush(self):
+    '''Publish the pending packets as one bundle; a single packet is published as it is
+    '''
+    if self.flush_call is not None:
+      if self.flush_call.active():
+        self.flush_call.cancel()
+      self.flush_call = None
+    if not self.pending:
+      return
+
+    pending, self.pending = self.pending, []
+    self.size = header_size
+    self.bundles += 1
+    self.publish(pending[0] if len(pending) == 1 else bundle(pending))
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the number of packets and of published bundles
+    '''
+    return {'packets': self.packets, 'bundles': self.bundles}
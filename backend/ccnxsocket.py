@@ -1,8 +1,15 @@
 from pyccn import Closure, CCN, Interest, Name, EventLoop, ContentObject
 import pyccn
 from thread import start_new_thread
+from threading import Lock
 import select
+from time import time
 from log import Logger
+from zope.interface import implements
+from twisted.internet.interfaces import IReadWriteDescriptor
+from twisted.internet.task import LoopingCall
+from twisted.python import threadable
+from twisted.internet.defer import Deferred
 '''
 .. module:: ccnxsocket
    : platform: Mac OS X, Linux
@@ -12,6 +19,78 @@ from log import Logger
 
 '''
 
+class ReactorQueue(object):
+  ''' Hands calls from other threads, e.g. the upcalls of a CcnxLoop, to the reactor thread.
+  The calls are queued under a lock and run in order by one drain in the reactor thread; only the call that finds the queue empty goes through callFromThread, so a burst of upcalls costs one wakeup of the reactor instead of one each.
+  '''
+  __logger = Logger.get_logger('ReactorQueue')
+
+  def __init__(self, *args, **kwargs):
+    super(ReactorQueue, self).__init__()
+    self.lock = Lock()
+    # (f, args) to be called in the reactor thread
+    self.calls = []
+    self.handed = 0
+    self.drains = 0
+    self.max_depth = 0
+
+  def call(self, f, *args):
+    '''Queue f to be called in the reactor thread; safe to be called from any thread
+    '''
+    with self.lock:
+      self.calls.append((f, args))
+      self.handed += 1
+      first = len(self.calls) == 1
+    if first:
+      from twisted.internet import reactor
+      reactor.callFromThread(self.drain)
+
+  def drain(self):
+    '''Run the queued calls. Must be called in the reactor thread.
+    '''
+    with self.lock:
+      calls = self.calls
+      self.calls = []
+    self.drains += 1
+    self.max_depth = max(self.max_depth, len(calls))
+    for (f, args) in calls:
+      try:
+        f(*args)
+      except Exception:
+        # the rest of the batch still runs
+        self.__class__.__logger.exception('Call in the reactor failed')
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the number of calls handed over, of drains, and the most calls run by one drain
+    '''
+    return {'handed': self.handed, 'drains': self.drains, 'max_depth': self.max_depth}
+
+reactor_queue = ReactorQueue()
+
+def call_in_reactor(f, *args):
+  '''Call f in the reactor thread: right away if we are in the reactor thread, otherwise through the reactor_queue
+  '''
+  if threadable.isInIOThread():
+    f(*args)
+  else:
+    reactor_queue.call(f, *args)
+
+def is_content(kind, upcallInfo, accept_unverified = None):
+  '''Whether an upcall brings a Content Object to hand on: a verified one, or one PyCCN could not verify (UPCALL_CONTENT_UNVERIFIED or UPCALL_CONTENT_BAD) whose content accept_unverified takes
+  '''
+  if kind == pyccn.UPCALL_CONTENT:
+    return True
+  return accept_unverified is not None and kind in (pyccn.UPCALL_CONTENT_UNVERIFIED, pyccn.UPCALL_CONTENT_BAD) and accept_unverified(upcallInfo.ContentObject.content)
+
+class InterestTimedOut(Exception):
+  ''' The failure of the Deferred returned by CcnxSocket.express when the Interest times out
+  '''
+  def __init__(self, name):
+    super(InterestTimedOut, self).__init__('Interest timed out: %s' % name)
+    self.name = name
+
 class CcnxLoop(object):
   ''' A loop that runs ccn_run
   This is going to be scheduled in a separate thread
@@ -52,36 +131,180 @@ class CcnxLoop(object):
         # to ignore this problem
         pass
 
+  def start(self):
+    '''
+    Run the loop in a new thread
+    '''
+    start_new_thread(self.run, ())
+
+  def notify(self):
+    '''
+    Called after an Interest or Content Object is handed to the handle.
+    Nothing to do here, as the select timeout takes care of pending output.
+    '''
+    pass
+
   def stop(self):
     '''
     Stop the loop
     '''
     self.running = False
+
+class ReactorCcnxLoop(object):
+  ''' A loop that runs ccn_run from the Twisted reactor.
+  The file descriptor of the handle is registered with the reactor as a reader, and also as a writer whenever the handle has pending output, so that incoming and outgoing Interests and Content Objects are processed as soon as the descriptor is ready instead of at the next select timeout.
+  All the upcalls run in the reactor thread.
+  '''
+  implements(IReadWriteDescriptor)
+
+  # ccn_run also expires pending Interests, which does not make the descriptor ready
+  timer_interval = 0.05
+
+  def __init__(self, handle, reactor = None, *args, **kwargs):
+    '''
+    Args:
+      handle (PyCCN.CCN): the handle to be used in the loop
+
+    Kwargs:
+      reactor: the Twisted reactor to register with; the global reactor is used if not given
+    '''
+    super(ReactorCcnxLoop, self).__init__()
+    if reactor is None:
+      from twisted.internet import reactor
+    self.reactor = reactor
+    self.handle = handle
+    self.running = False
+    self.writing = False
+    self.timer = LoopingCall(self.run_once)
+    self.timer.clock = reactor
+
+  def fileno(self):
+    return self.handle.fileno()
+
+  def logPrefix(self):
+    return 'ReactorCcnxLoop'
+
+  def doRead(self):
+    self.run_once()
+
+  def doWrite(self):
+    self.run_once()
+
+  def connectionLost(self, reason):
+    self.stop()
+
+  def run_once(self):
+    '''
+    Runs ccn_run once without blocking, and then watches the descriptor for writing only if the handle still has pending output
+    '''
+    if not self.running:
+      return
+    self.handle.run(0)
+    self.update_writer()
+
+  def update_writer(self):
+    '''
+    Add or remove the descriptor from the writers of the reactor according to whether the handle has pending output
+    '''
+    if not self.running:
+      return
+    pending = self.handle.output_is_pending()
+    if pending and not self.writing:
+      self.reactor.addWriter(self)
+      self.writing = True
+    elif not pending and self.writing:
+      self.reactor.removeWriter(self)
+      self.writing = False
+
+  def run(self):
+    '''
+    Register the handle with the reactor. Must be called in the reactor thread.
+    '''
+    self.running = True
+    self.reactor.addReader(self)
+    self.timer.start(self.timer_interval, now = True)
+
+  def start(self):
+    '''
+    Start the loop; safe to be called from any thread
+    '''
+    self.reactor.callFromThread(self.run)
+
+  def notify(self):
+    '''
+    Called after an Interest or Content Object is handed to the handle, which may leave output pending if the descriptor is not writable right now
+    '''
+    if threadable.isInIOThread():
+      self.update_writer()
+    else:
+      self.reactor.callFromThread(self.update_writer)
+
+  def stop(self):
+    '''
+    Stop the loop and unregister the handle from the reactor
+    '''
+    def unregister():
+      if self.timer.running:
+        self.timer.stop()
+      self.reactor.removeReader(self)
+      if self.writing:
+        self.reactor.removeWriter(self)
+        self.writing = False
+
+    self.running = False
+    if threadable.isInIOThread():
+      unregister()
+    else:
+      self.reactor.callFromThread(unregister)
   
 
 class CcnxSocket(object):
   ''' A socket like handler for ccnx operations.
       Runs a simple event loop and handles set interest filter, send interest,
       and publish data. 
-      Current only one ccnx handle is used, we can use multiple handles if needed,
-      but there is no such need as of now.
+      Only one ccnx handle is used; see CcnxSocketPool for using multiple handles.
   '''
 
   __logger = Logger.get_logger('CcnxSocket')
 
+  (ThreadLoop, ReactorLoop) = ('thread', 'reactor')
+
+  # seconds before a cached SignedInfo is rebuilt
+  signed_info_ttl = 1.0
+
   def __init__(self, *args, **kwargs):
     '''
     Creates a socket. As of now, we try to get the ccnx key from the default location
+
+    Kwargs:
+      loop (str): either CcnxSocket.ThreadLoop (default), which polls the handle in a separate thread, or CcnxSocket.ReactorLoop, which drives the handle from the Twisted reactor
+      handle: the handle to use instead of a new PyCCN.CCN, e.g. a localccn.LocalHandle
+      content_store (contentstore.ContentStore): if given, every Content Object put through this socket is kept there, and Interests under the prefixes passed to serve_prefix are answered from it
+      pit (bool): if True, keep a PendingInterestTable so that an Interest for a name that is already pending is not sent again; defaults to False
+      accept_unverified: a function of the content of a Content Object that fails the signature check, or whose key is unknown; if it returns True, the Deferreds of express and express_many fire with the Content Object all the same, e.g. batchsign.is_batched for the packets that are checked against the root of their batch instead
     '''
     super(CcnxSocket, self).__init__()
     self.ccnx_key = CCN.getDefaultKey()
     self.ccnx_key_locator = pyccn.KeyLocator(self.ccnx_key)
-    self.ccnx_handle = CCN() 
-    self.event_loop = CcnxLoop(self.ccnx_handle)
+    self.ccnx_key_digest = self.ccnx_key.publicKeyID
+    # freshness -> (PyCCN.SignedInfo, time created)
+    self.signed_infos = {}
+    self.ccnx_handle = kwargs.get('handle')
+    if self.ccnx_handle is None:
+      self.ccnx_handle = CCN() 
+    self.content_store = kwargs.get('content_store')
+    self.served_prefixes = set()
+    self.pit = PendingInterestTable() if kwargs.get('pit', False) else None
+    self.accept_unverified = kwargs.get('accept_unverified')
+    if kwargs.get('loop', self.__class__.ThreadLoop) == self.__class__.ReactorLoop:
+      self.event_loop = ReactorCcnxLoop(self.ccnx_handle)
+    else:
+      self.event_loop = CcnxLoop(self.ccnx_handle)
 
   def get_signed_info(self, freshness):
     '''
-    Get signed info to be included in the Content Object
+    Get signed info to be included in the Content Object.
+    The SignedInfo (and the key locator carrying the public key in it) only depends on the freshness, so it is built once per freshness value and reused, together with its ccnb encoding, until it is older than signed_info_ttl. Rebuilding it now and then keeps the timestamp in the SignedInfo roughly current.
 
     Args:
       freshness (int): the freshness of the Content Object in seconds
@@ -90,23 +313,31 @@ class CcnxSocket(object):
       a PyCCN.SignedInfo object 
 
     '''
+    now = time()
+    cached = self.signed_infos.get(freshness)
+    if cached is not None and now - cached[1] < self.__class__.signed_info_ttl:
+      return cached[0]
+
     si = pyccn.SignedInfo()
-    si.publisherPublicKeyDigest = self.ccnx_key.publicKeyID
+    si.publisherPublicKeyDigest = self.ccnx_key_digest
     si.type = pyccn.CONTENT_DATA
     si.freshnessSeconds = freshness
     si.keyLocator = self.ccnx_key_locator
+    self.signed_infos[freshness] = (si, now)
     return si
 
   def get_pyccn_name(self, name):
     '''Get a valid name for PyCCN. This is useful when the name string is encoded as unicode, as is the usual case in Python. However, PyCCN has problem handling unicode names, raising TypeError as a result.
     
     Args:
-      name (str): the name string
+      name (str): the name string; a PyCCN.Name is returned as it is
     
     Returns:
       An ascii encoded name string
     '''
-    if isinstance(name, unicode):
+    if isinstance(name, Name):
+      return name
+    elif isinstance(name, unicode):
       return Name(name.encode('ascii', 'ignore'))
     else:
       return Name(name)
@@ -122,15 +353,53 @@ class CcnxSocket(object):
     Kwargs:
       freshness (int): the freshness in seconds for the Content Object
     '''
-    co =  ContentObject()
-    co.name = self.get_pyccn_name(name)
-    co.content = content
+    self.put(self.sign_content(name, content, freshness))
+
+  def sign_content(self, name, content, freshness = 5):
+    '''Build and sign a Content Object without publishing it. This does not touch the handle, so it can be called from any thread.
+
+    Args:
+      name (str): the name string
+      content (bytes): the data bytes
 
-    si = self.get_signed_info(freshness)
-    co.signedInfo = si
+    Kwargs:
+      freshness (int): the freshness in seconds for the Content Object
 
+    Returns:
+      the signed PyCCN.ContentObject
+    '''
+    co = ContentObject(self.get_pyccn_name(name), content, self.get_signed_info(freshness))
     co.sign(self.ccnx_key)
+    return co
+
+  def put(self, co):
+    '''Put a Content Object that has already been signed
+
+    Args:
+      co (PyCCN.ContentObject): the signed Content Object
+    '''
+    if self.content_store is not None:
+      self.content_store.add(co)
     self.ccnx_handle.put(co)
+    self.event_loop.notify()
+
+  def serve_prefix(self, prefix):
+    '''Answer Interests under the prefix from the content store of this socket. Interests that miss the store are left to be satisfied by the Content Objects published later.
+
+    Args:
+      prefix (str): the prefix name string
+    '''
+    if self.content_store is None or prefix in self.served_prefixes:
+      return
+    self.served_prefixes.add(prefix)
+
+    def answer(interest):
+      co = self.content_store.lookup(str(interest.name), interest.childSelector)
+      if co is not None:
+        self.ccnx_handle.put(co)
+        self.event_loop.notify()
+
+    self.register_prefix(prefix, PeetsClosure(incoming_interest_callback = answer))
 
   def send_interest(self, name, closure, template = None):
     '''Send Interest
@@ -142,9 +411,77 @@ class CcnxSocket(object):
     Kwargs:
       template (PyCCN.Interest): the template for the additional field to be carried in the Interest, such as ChildSelector, Lifetime, AnswerOrigin, etc..
     '''
-    n = self.get_pyccn_name(name)
-    self.ccnx_handle.expressInterest(n, closure, template)
-    
+    self.express_interest(self.get_pyccn_name(name), closure, template)
+    self.event_loop.notify()
+
+  def express_interest(self, name, closure, template):
+    '''Hand an Interest to the handle, unless the pending Interest table already has it pending
+
+    Args:
+      name (PyCCN.Name): the name
+      closure (PyCCN.Closure): the closure
+      template (PyCCN.Interest): the template or None
+    '''
+    if self.pit is not None:
+      closure = self.pit.add(name, closure, template)
+      if closure is None:
+        return
+    self.ccnx_handle.expressInterest(name, closure, template)
+
+  def express(self, name, lifetime = None, template = None):
+    '''Send an Interest and get a Deferred for the result, instead of passing a closure
+
+    Args:
+      name : the name string or PyCCN.Name
+
+    Kwargs:
+      lifetime (float): the Interest lifetime in seconds; the PyCCN default if not given
+      template (PyCCN.Interest): the template for the additional fields of the Interest; its lifetime is overridden by *lifetime*
+
+    Returns:
+      a twisted Deferred that fires in the reactor thread with the PyCCN.ContentObject, or fails with InterestTimedOut
+    '''
+    d = Deferred()
+    self.express_interest(self.get_pyccn_name(name), DeferredClosure(d, self.accept_unverified), self.get_template(lifetime, template))
+    self.event_loop.notify()
+    return d
+
+  def express_many(self, names, lifetime = None, template = None):
+    '''Send a batch of Interests in one call; see express
+
+    Args:
+      names (list): the name strings or PyCCN.Names
+
+    Returns:
+      the list of Deferreds, in the order of the names
+    '''
+    template = self.get_template(lifetime, template)
+    deferreds = []
+    for name in names:
+      d = Deferred()
+      self.express_interest(self.get_pyccn_name(name), DeferredClosure(d, self.accept_unverified), template)
+      deferreds.append(d)
+    self.event_loop.notify()
+    return deferreds
+
+  def get_pit_stats(self):
+    '''
+    Returns:
+      the statistics of the pending Interest table (see PendingInterestTable.get_stats), with the pending count per prefix under 'outstanding'; None if there is no table
+    '''
+    if self.pit is None:
+      return None
+    stats = self.pit.get_stats()
+    stats['outstanding'] = self.pit.get_outstanding()
+    return stats
+
+  def get_template(self, lifetime, template):
+    if lifetime is None:
+      return template
+    if template is None:
+      return Interest(interestLifetime = lifetime)
+    return Interest(childSelector = template.childSelector, interestLifetime = lifetime)
+
   def register_prefix(self, prefix, closure):
     '''Register the prefix under which the user wishes to receive Interests
 
@@ -154,23 +491,313 @@ class CcnxSocket(object):
     '''
     p = self.get_pyccn_name(prefix)
     self.ccnx_handle.setInterestFilter(p, closure)
+    self.event_loop.notify()
 
   def start(self):
     '''Start the CcnxLoop
     '''
-    start_new_thread(self.event_loop.run, ())
+    self.event_loop.start()
 
   def stop(self):
     '''Stop the CcnxLoop
     '''
     self.event_loop.stop()
 
+class CcnxSocketPool(object):
+  ''' Spreads the ccnx operations over several CcnxSockets, each with its own handle and event loop, so that a large conference does not serialize on a single handle.
+  It has the same surface as CcnxSocket. The socket for an operation is picked by a key, which defaults to the name without its last component (i.e. the stream prefix of a packet), so all packets of a stream always go through the same handle.
+  '''
+
+  def __init__(self, size, *args, **kwargs):
+    '''
+    Args:
+      size (int): the number of sockets
+
+    Kwargs:
+      handles (list): the handles to use instead of new PyCCN.CCNs, one per socket; overrides size
+      And the kwargs of CcnxSocket, which are passed to every socket (a content store is shared by all of them).
+    '''
+    super(CcnxSocketPool, self).__init__()
+    handles = kwargs.pop('handles', None)
+    if handles is None:
+      handles = [None] * size
+    self.sockets = [CcnxSocket(handle = handle, *args, **kwargs) for handle in handles]
+    self.content_store = kwargs.get('content_store')
+
+  def get_socket(self, name, key = None):
+    '''Get the socket for a name
+
+    Args:
+      name : the name string or PyCCN.Name
+
+    Kwargs:
+      key : any hashable value to pick the socket by, instead of the prefix of the name
+    '''
+    if key is None:
+      key = tuple(self.get_pyccn_name(name).components[:-1])
+    return self.sockets[hash(key) % len(self.sockets)]
+
+  def get_pyccn_name(self, name):
+    return self.sockets[0].get_pyccn_name(name)
+
+  def sign_content(self, name, content, freshness = 5):
+    return self.sockets[0].sign_content(name, content, freshness)
+
+  def publish_content(self, name, content, freshness = 5, key = None):
+    self.get_socket(name, key).publish_content(name, content, freshness)
+
+  def put(self, co, key = None):
+    self.get_socket(co.name, key).put(co)
+
+  def send_interest(self, name, closure, template = None, key = None):
+    self.get_socket(name, key).send_interest(name, closure, template)
+
+  def express(self, name, lifetime = None, template = None, key = None):
+    return self.get_socket(name, key).express(name, lifetime, template)
+
+  def express_many(self, names, lifetime = None, template = None, key = None):
+    '''Like CcnxSocket.express_many; the names are grouped by their socket, so each socket gets one batch
+    '''
+    batches = {}
+    for (i, name) in enumerate(names):
+      batches.setdefault(self.get_socket(name, key), []).append(i)
+    deferreds = [None] * len(names)
+    for (sock, indices) in batches.items():
+      for (i, d) in zip(indices, sock.express_many([names[i] for i in indices], lifetime, template)):
+        deferreds[i] = d
+    return deferreds
+
+  def get_pit_stats(self):
+    '''The statistics of the pending Interest tables of all sockets added up
+    '''
+    total = None
+    for sock in self.sockets:
+      stats = sock.get_pit_stats()
+      if stats is None:
+        continue
+      if total is None:
+        total = stats
+      else:
+        for k in ('expressed', 'aggregated', 'pending'):
+          total[k] += stats[k]
+        total['outstanding'].update(stats['outstanding'])
+    return total
+
+  def register_prefix(self, prefix, closure, key = None):
+    self.get_socket(prefix, key).register_prefix(prefix, closure)
+
+  def serve_prefix(self, prefix, key = None):
+    self.get_socket(prefix, key).serve_prefix(prefix)
+
+  def start(self):
+    for sock in self.sockets:
+      sock.start()
+
+  def stop(self):
+    for sock in self.sockets:
+      sock.stop()
+
+class PendingInterestTable(object):
+  ''' Tracks the Interests that a CcnxSocket has sent and not yet got back.
+  An Interest for a name (with the same child selector and lifetime) that is already pending is not sent again; its closure is added to the waiters of the pending entry instead. The Data that comes back is handed to every waiter.
+  When the Interest times out, every waiter is asked as usual; the Interest is re-expressed for the waiters that return pyccn.RESULT_REEXPRESS, and the others are dropped.
+  '''
+  def __init__(self, *args, **kwargs):
+    super(PendingInterestTable, self).__init__()
+    self.lock = Lock()
+    # (name components, child selector, lifetime) -> list of closures
+    self.entries = {}
+    # prefix components -> [prefix string, the number of pending names under it]
+    self.outstanding = {}
+    self.expressed = 0
+    self.aggregated = 0
+
+  def add(self, name, closure, template):
+    '''Add a waiter for the name
+
+    Args:
+      name (PyCCN.Name): the name of the Interest
+      closure (PyCCN.Closure): the waiter
+      template (PyCCN.Interest): the template or None
+
+    Returns:
+      the PitClosure to express the Interest with, or None if the Interest is already pending
+    '''
+    components = tuple(name.components)
+    # the lifetime is part of the key, so that a waiter never times out later than it asked for
+    if template is not None:
+      key = (components, template.childSelector, template.interestLifetime)
+    else:
+      key = (components, None, None)
+    with self.lock:
+      waiters = self.entries.get(key)
+      if waiters is not None:
+        waiters.append(closure)
+        self.aggregated += 1
+        return None
+
+      self.entries[key] = [closure]
+      self.expressed += 1
+      prefix = components[:-1]
+      count = self.outstanding.get(prefix)
+      if count is None:
+        self.outstanding[prefix] = ['/' + '/'.join(prefix), 1]
+      else:
+        count[1] += 1
+    return PitClosure(self, key)
+
+  def remove(self, key):
+    '''Remove an entry. Must be called with self.lock held.
+
+    Returns:
+      the waiters of the entry
+    '''
+    waiters = self.entries.pop(key, [])
+    prefix = key[0][:-1]
+    count = self.outstanding.get(prefix)
+    if count is not None:
+      count[1] -= 1
+      if count[1] <= 0:
+        del self.outstanding[prefix]
+    return waiters
+
+  def satisfy(self, key, kind, upcallInfo):
+    '''Hand the Data to all the waiters of the entry
+    '''
+    with self.lock:
+      waiters = self.remove(key)
+    for closure in waiters:
+      closure.upcall(kind, upcallInfo)
+    return pyccn.RESULT_OK
+
+  def time_out(self, key, upcallInfo):
+    '''Ask the waiters of a timed out entry whether they want it re-expressed
+    '''
+    with self.lock:
+      # a copy, as the waiters may add themselves again from their upcalls, e.g. with the reactor loop
+      waiters = list(self.entries.get(key, []))
+    again = [closure for closure in waiters if closure.upcall(pyccn.UPCALL_INTEREST_TIMED_OUT, upcallInfo) == pyccn.RESULT_REEXPRESS]
+    with self.lock:
+      # the waiters added while we were asking have not timed out, and still want the data
+      asked = set([id(closure) for closure in waiters])
+      again.extend([closure for closure in self.entries.get(key, []) if id(closure) not in asked])
+      if again:
+        self.entries[key] = again
+        return pyccn.RESULT_REEXPRESS
+      self.remove(key)
+    return pyccn.RESULT_OK
+
+  def get_outstanding(self, prefix = None):
+    '''Get the number of pending names
+
+    Kwargs:
+      prefix (str): if given, only count the names right under the prefix (i.e. the prefix plus one component)
+
+    Returns:
+      the count for the prefix, or if no prefix is given, a dict of the counts of all prefixes
+    '''
+    with self.lock:
+      if prefix is not None:
+        for (p, count) in self.outstanding.values():
+          if p == prefix:
+            return count
+        return 0
+      return dict(self.outstanding.values())
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the number of Interests expressed, the number of Interests aggregated into pending ones and the number of pending names
+    '''
+    with self.lock:
+      return {'expressed': self.expressed, 'aggregated': self.aggregated, 'pending': len(self.entries)}
+
+class NameCache(object):
+  ''' Keeps the parsed PyCCN.Names of prefixes, each under a key of the caller's choice (e.g. the id of a remote user and the kind of stream).
+  The name of a packet is built by appending the sequence number to the cached prefix instead of parsing the whole uri, and the name of an incoming packet is mapped back to the key of its prefix by its components instead of splitting the uri.
+  '''
+  def __init__(self, *args, **kwargs):
+    super(NameCache, self).__init__()
+    # key -> PyCCN.Name
+    self.prefixes = {}
+    # tuple of prefix components -> key
+    self.keys = {}
+
+  def add_prefix(self, key, prefix):
+    '''Parse and cache a prefix
+
+    Args:
+      key : any hashable value to refer to the prefix
+      prefix (str): the prefix name string
+
+    Returns:
+      the PyCCN.Name for the prefix
+    '''
+    name = self.prefixes.get(key)
+    if name is None:
+      if isinstance(prefix, unicode):
+        prefix = prefix.encode('ascii', 'ignore')
+      name = Name(prefix)
+      self.prefixes[key] = name
+      self.keys[tuple(name.components)] = key
+    return name
+
+  def get_prefix(self, key):
+    '''
+    Returns:
+      the cached PyCCN.Name for the key, or None
+    '''
+    return self.prefixes.get(key)
+
+  def remove_prefix(self, key):
+    name = self.prefixes.pop(key, None)
+    if name is not None:
+      self.keys.pop(tuple(name.components), None)
+
+  def get_name(self, key, seq):
+    '''Get the name of a packet under a cached prefix
+
+    Args:
+      key : the key of the prefix
+      seq (int): the sequence number
+
+    Returns:
+      the PyCCN.Name of the prefix with the sequence number appended
+    '''
+    return self.prefixes[key].append(str(seq))
+
+  def parse(self, name):
+    '''Map the name of a packet back to the key of its prefix
+
+    Args:
+      name (PyCCN.Name): a cached prefix followed by a sequence number
+
+    Returns:
+      (key, seq), or (None, None) if the name is not under a cached prefix
+    '''
+    components = name.components
+    key = self.keys.get(tuple(components[:-1]))
+    if key is None:
+      return None, None
+    try:
+      return key, int(components[-1])
+    except ValueError:
+      return None, None
+
+  def parse_prefix(self, name):
+    '''Map a name that is exactly a cached prefix (e.g. the name of a probe) back to its key
+
+    Returns:
+      the key, or None
+    '''
+    return self.keys.get(tuple(name.components))
+
 class PeetsClosure(Closure):
   ''' A closure for processing PeetsMessage content object
 
   Note: If the subclass of pyccn.Closure is a inner class of some class, it would make ccn_run fail in py-chronos. The reason is unknown. I guess something fishy is happening when the pyccn c code try to call the closure upcall method when the closure class is not resolvable in global name space.
   '''
-  def __init__(self, incoming_interest_callback = None, msg_callback = None, timeout_callback = None):
+  def __init__(self, incoming_interest_callback = None, msg_callback = None, timeout_callback = None, in_reactor = False, accept_unverified = None):
     '''Customize the PyCCN.Closure subclass
 
     Kwargs:
@@ -178,29 +805,78 @@ class PeetsClosure(Closure):
       msg_callback: the callback function to be used by PyCCN when an ContentObject is fetched; takes PyCCN.UpcallInfo.Interest and PyCCN.UpcallInfo.ContentObject as inputs
       timeout_callback: the callback function to be used by PyCCN when the Interest times out; takes PyCCN.UpcallInfo.Interest as the input
     
-    *Note* that *timeout_callback* should return some ccnx upcall return value, e.g. pyccn.UPCALL_REEXPRESS is the user wants the Interest to be re-expressed
+      in_reactor: if True, msg_callback and incoming_interest_callback are called in the reactor thread, through call_in_reactor, rather than in the thread of the upcall
+      accept_unverified: a function of the content of a Content Object that PyCCN could not verify; msg_callback is called with it if the function returns True (see CcnxSocket)
+
+    *Note* that *timeout_callback* should return some ccnx upcall return value, e.g. pyccn.UPCALL_REEXPRESS is the user wants the Interest to be re-expressed; so it is always called in the thread of the upcall
     '''
     super(PeetsClosure, self).__init__()
     self.incoming_interest_callback = incoming_interest_callback
     self.msg_callback = msg_callback
     self.timeout_callback = timeout_callback
+    self.in_reactor = in_reactor
+    self.accept_unverified = accept_unverified
 
   def upcall(self, kind, upcallInfo):
     '''Override the upcall function of the base class
     This function will be used by PyCCN whenever there is an upcall event
     '''
-    if kind == pyccn.UPCALL_CONTENT:
+    if is_content(kind, upcallInfo, self.accept_unverified):
       if self.msg_callback is not None:
-        self.msg_callback(upcallInfo.Interest, upcallInfo.ContentObject)
+        if self.in_reactor:
+          call_in_reactor(self.msg_callback, upcallInfo.Interest, upcallInfo.ContentObject)
+        else:
+          self.msg_callback(upcallInfo.Interest, upcallInfo.ContentObject)
     elif kind == pyccn.UPCALL_INTEREST_TIMED_OUT:
       if self.timeout_callback is not None:
         return self.timeout_callback(upcallInfo.Interest)
     elif kind == pyccn.UPCALL_INTEREST:
       if self.incoming_interest_callback is not None:
-        self.incoming_interest_callback(upcallInfo.Interest)
+        if self.in_reactor:
+          call_in_reactor(self.incoming_interest_callback, upcallInfo.Interest)
+        else:
+          self.incoming_interest_callback(upcallInfo.Interest)
       
     return pyccn.RESULT_OK
 
+class PitClosure(Closure):
+  ''' The closure of an Interest sent through a PendingInterestTable; hands the upcalls to the table
+  '''
+  def __init__(self, pit, key):
+    super(PitClosure, self).__init__()
+    self.pit = pit
+    self.key = key
+
+  def upcall(self, kind, upcallInfo):
+    if kind in (pyccn.UPCALL_CONTENT, pyccn.UPCALL_CONTENT_UNVERIFIED, pyccn.UPCALL_CONTENT_BAD):
+      # the waiters decide whether they take an unverified Content Object
+      return self.pit.satisfy(self.key, kind, upcallInfo)
+    elif kind == pyccn.UPCALL_INTEREST_TIMED_OUT:
+      return self.pit.time_out(self.key, upcallInfo)
+    return pyccn.RESULT_OK
+
+class DeferredClosure(Closure):
+  ''' A closure that fires a Deferred, used by CcnxSocket.express. Like PeetsClosure, it has to live in the global name space.
+  '''
+  def __init__(self, deferred, accept_unverified = None):
+    '''
+    Args:
+      deferred (twisted.internet.defer.Deferred): fired with the PyCCN.ContentObject, or failed with InterestTimedOut
+
+    Kwargs:
+      accept_unverified: see CcnxSocket
+    '''
+    super(DeferredClosure, self).__init__()
+    self.deferred = deferred
+    self.accept_unverified = accept_unverified
+
+  def upcall(self, kind, upcallInfo):
+    if is_content(kind, upcallInfo, self.accept_unverified):
+      call_in_reactor(self.deferred.callback, upcallInfo.ContentObject)
+    elif kind == pyccn.UPCALL_INTEREST_TIMED_OUT:
+      call_in_reactor(self.deferred.errback, InterestTimedOut(str(upcallInfo.Interest.name)))
+    return pyccn.RESULT_OK
+
 #if __name__ == '__main__':
 #  from time import sleep, time
 #  sock1 = CcnxSocket()
@@ -0,0 +1,165 @@
+from threading import Lock
+
+'''
+.. module:: connstate
+  :platform: Mac OS X, Linux
+  :synopsis: An index of the per-peer connection state, looked up by local UDP port or by remote user id on the packet path.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+class Peer(object):
+  ''' The state of a remote user shared by the local users: its media is fetched once and written to the PeerConnection of every local user that has the remote user in its roster
+  '''
+  def __init__(self, cid, *args, **kwargs):
+    '''
+    Args:
+      cid (str): the id of the remote user
+    '''
+    super(Peer, self).__init__()
+    self.cid = cid
+    # the RemoteUser whose streams, fetching window and jitter buffer are used to fetch the media, None until a local user has it in its roster
+    self.remote_user = None
+    # id -> PeetsServerProtocol of the local users that have the remote user in their roster
+    self.clients = {}
+    # the PeerConnections of those local users to the remote user
+    self.connections = []
+
+class PeerConnection(object):
+  ''' The state of the PeerConnection between one local user and one remote user
+  '''
+  def __init__(self, client, cid, port, *args, **kwargs):
+    '''
+    Args:
+      client (PeetsServerProtocol): the local user
+      cid (str): the id of the remote user
+      port (int): the local UDP port of the PeerConnection, where the media and the ctrl packets of the remote user are written to
+    '''
+    super(PeerConnection, self).__init__()
+    self.client = client
+    self.cid = cid
+    self.port = port
+    # the seq of the next local ctrl packet for the remote user
+    self.ctrl_seq = 0
+    # the PyCCN.Name of the prefix of the local ctrl packets for the remote user
+    self.ctrl_prefix = None
+
+class ConnectionIndex(object):
+  ''' Maps the id of a remote user to its Peer, and the local UDP port of a PeerConnection to the PeerConnection.
+  Reads take no lock: the dicts and lists are never changed in place but replaced by updated copies, so a reader always sees a complete one. Writes, which happen only when a connection is set up or torn down, are serialized by a lock.
+  '''
+  def __init__(self, *args, **kwargs):
+    super(ConnectionIndex, self).__init__()
+    self.lock = Lock()
+    # cid -> Peer
+    self.by_cid = {}
+    # local port -> PeerConnection
+    self.by_port = {}
+
+  def get(self, cid):
+    '''
+    Returns:
+      the Peer for the remote user id, or None
+    '''
+    return self.by_cid.get(cid)
+
+  def get_by_port(self, port):
+    '''
+    Returns:
+      the PeerConnection that uses the local port, or None
+    '''
+    return self.by_port.get(port)
+
+  def values(self):
+    '''
+    Returns:
+      the list of Peers
+    '''
+    return self.by_cid.values()
+
+  def subscribe(self, cid, client):
+    '''Record that a local user has the remote user in its roster, creating the Peer if needed
+
+    Args:
+      cid (str): the id of the remote user
+      client (PeetsServerProtocol): the local user
+
+    Returns:
+      the Peer
+    '''
+    with self.lock:
+      peer = self.by_cid.get(cid)
+      if peer is None:
+        peer = Peer(cid)
+        by_cid = dict(self.by_cid)
+        by_cid[cid] = peer
+        self.by_cid = by_cid
+      if client.id not in peer.clients:
+        clients = dict(peer.clients)
+        clients[client.id] = client
+        peer.clients = clients
+        # the PeerConnection may be set up before the remote user is in the roster
+        peer.connections = peer.connections + [conn for conn in self.by_port.itervalues() if conn.cid == cid and conn.client is client]
+    return peer
+
+  def unsubscribe(self, cid, client_id):
+    '''Record that the remote user is no longer in the roster of a local user; the Peer is forgotten when no local user has it
+
+    Returns:
+      the Peer if another local user still has the remote user, otherwise None
+    '''
+    with self.lock:
+      peer = self.by_cid.get(cid)
+      if peer is None:
+        return None
+      peer.clients = dict([(k, c) for (k, c) in peer.clients.iteritems() if k != client_id])
+      peer.connections = [conn for conn in peer.connections if conn.client.id != client_id]
+      if peer.clients:
+        return peer
+      self.by_cid = dict([(k, p) for (k, p) in self.by_cid.iteritems() if k != cid])
+      return None
+
+  def connect(self, client, cid, port):
+    '''Record the PeerConnection of a local user to a remote user
+
+    Returns:
+      the PeerConnection
+    '''
+    with self.lock:
+      conn = self.by_port.get(port)
+      if conn is not None:
+        return conn
+      conn = PeerConnection(client, cid, port)
+      by_port = dict(self.by_port)
+      by_port[port] = conn
+      self.by_port = by_port
+      peer = self.by_cid.get(cid)
+      if peer is not None and client.id in peer.clients:
+        peer.connections = peer.connections + [conn]
+    return conn
+
+  def disconnect(self, client_id):
+    '''Forget the PeerConnections of a local user
+    '''
+    with self.lock:
+      self.by_port = dict([(port, conn) for (port, conn) in self.by_port.iteritems() if conn.client.id != client_id])
+      for peer in self.by_cid.itervalues():
+        peer.connections = [conn for conn in peer.connections if conn.client.id != client_id]
+
+  def remove(self, cid):
+    '''Forget the Peer of a remote user and the PeerConnections to it
+    '''
+    with self.lock:
+      if cid not in self.by_cid:
+        return
+      self.by_cid = dict([(k, p) for (k, p) in self.by_cid.iteritems() if k != cid])
+      self.by_port = dict([(port, conn) for (port, conn) in self.by_port.iteritems() if conn.cid != cid])
+
+  def clear(self):
+    with self.lock:
+      self.by_cid = {}
+      self.by_port = {}
+
+  def __len__(self):
+    return len(self.by_cid)
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+'''
+.. module:: contentstore
+  :platform: Mac OS X, Linux
+  :synopsis: A bounded in-memory store of recently published Content Objects.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+class ContentStore(object):
+  ''' A ring buffer of recently published Content Objects keyed by name, so that late or retransmitted Interests can be answered from memory instead of relying on the cache of ccnd.
+  The oldest objects are evicted when the store grows beyond max_bytes, or when they are older than max_age seconds.
+  The size of an object is approximated by the size of its name and content plus a fixed overhead for the signature and the SignedInfo.
+  '''
+
+  # bytes of signature, SignedInfo and key locator added to the size of each object
+  object_overhead = 400
+
+  def __init__(self, max_bytes = 4 * 1024 * 1024, max_age = 5.0, *args, **kwargs):
+    '''
+    Kwargs:
+      max_bytes (int): the memory cap of the store in bytes
+      max_age (float): the time in seconds an object is kept
+    '''
+    super(ContentStore, self).__init__()
+    self.max_bytes = max_bytes
+    self.max_age = max_age
+    self.lock = Lock()
+    # name string -> (PyCCN.ContentObject, size, time added)
+    self.objects = OrderedDict()
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.evicted = 0
+
+  def add(self, co):
+    '''Store a published Content Object, evicting old ones if needed
+
+    Args:
+      co (PyCCN.ContentObject): a signed Content Object
+    '''
+    name = str(co.name)
+    size = len(name) + len(co.content) + self.__class__.object_overhead
+    now = time()
+    with self.lock:
+      old = self.objects.pop(name, None)
+      if old is not None:
+        self.size -= old[1]
+      self.objects[name] = (co, size, now)
+      self.size += size
+      self.evict(now)
+
+  def evict(self, now):
+    '''Evict the objects that are too old or over the memory cap. Must be called with self.lock held.
+    '''
+    while self.objects:
+      (name, (co, size, added)) = next(self.objects.iteritems())
+      if self.size <= self.max_bytes and now - added < self.max_age:
+        break
+      del self.objects[name]
+      self.size -= size
+      self.evicted += 1
+
+  def lookup(self, name, child_selector = None):
+    '''Find the Content Object for an Interest
+
+    Args:
+      name (str): the name of the Interest
+
+    Kwargs:
+      child_selector (int): if 1, and there is no object with exactly this name, return the most recent object under the name, which is the rightmost child for names ending with an increasing sequence number
+
+    Returns:
+      the PyCCN.ContentObject, or None on a miss
+    '''
+    with self.lock:
+      self.evict(time())
+      entry = self.objects.get(name)
+      if entry is None and child_selector == 1:
+        prefix = name + '/'
+        for (n, e) in reversed(self.objects.items()):
+          if n.startswith(prefix):
+            entry = e
+            break
+
+      if entry is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      return entry[0]
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the number of hits, misses, evictions and stored objects, and the bytes used
+    '''
+    with self.lock:
+      return {'hits': self.hits, 'misses': self.misses, 'evicted': self.evicted, 'objects': len(self.objects), 'bytes': self.size}
+
+  def __len__(self):
+    with self.lock:
+      return len(self.objects)
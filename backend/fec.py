@@ -0,0 +1,203 @@
+from struct import pack, unpack_from
+from threading import Lock
+
+'''
+.. module:: fec
+  :platform: Mac OS X, Linux
+  :synopsis: XOR forward error correction for the published media: one parity Content Object for every group of media packets, from which any one lost packet of the group can be rebuilt.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+# seq of the first packet, number of packets, XOR of their lengths
+header_format = '!IBH'
+header_size = 7
+
+def xor_into(acc, data):
+  '''XOR data into the bytearray acc, growing acc if data is longer
+  '''
+  if len(data) > len(acc):
+    acc.extend('\0' * (len(data) - len(acc)))
+  for (i, b) in enumerate(bytearray(data)):
+    acc[i] ^= b
+
+def encode(first_seq, payloads):
+  '''
+  Args:
+    first_seq (int): the seq of the first payload
+    payloads (list): the payloads of consecutive seqs, at most 255, each shorter than 64 KB
+
+  Returns:
+    the content of the parity object
+  '''
+  acc = bytearray()
+  length = 0
+  for payload in payloads:
+    xor_into(acc, payload)
+    length ^= len(payload)
+  return pack(header_format, first_seq, len(payloads), length) + str(acc)
+
+def decode(parity, payloads):
+  '''Rebuild the one missing payload of a group
+
+  Args:
+    parity (str): the content of the parity object
+    payloads (list): the other payloads of the group
+
+  Returns:
+    the missing payload
+  '''
+  (first_seq, count, length) = unpack_from(header_format, parity)
+  acc = bytearray(parity[header_size:])
+  for payload in payloads:
+    xor_into(acc, payload)
+    length ^= len(payload)
+  return str(acc[:length])
+
+class FecEncoder(object):
+  ''' Collects the payloads of a media stream as they are published and makes a parity object for every group_size of them.
+  Groups are aligned on the seqs, i.e. group g covers the seqs g * group_size to (g + 1) * group_size - 1, so that the fetcher knows which parity to ask for.
+  '''
+  def __init__(self, publish, group_size, *args, **kwargs):
+    '''
+    Args:
+      publish : called with the group number and the content of every parity object
+      group_size (int): the number of media packets covered by a parity object, at most 255
+    '''
+    super(FecEncoder, self).__init__()
+    self.publish = publish
+    self.group_size = group_size
+    self.group = None
+    self.first_seq = None
+    self.payloads = []
+    self.parities = 0
+
+  def add(self, seq, payload):
+    '''Add a published payload
+
+    Args:
+      seq (int): the seq it is published under
+      payload (str): the content
+    '''
+    group = seq // self.group_size
+    if group != self.group or seq != self.first_seq + len(self.payloads):
+      self.flush()
+      self.group = group
+      self.first_seq = seq
+    self.payloads.append(payload)
+    if (seq + 1) % self.group_size == 0:
+      self.flush()
+
+  def flush(self):
+    '''Publish the parity of the packets of the current group, if any
+    '''
+    if self.payloads:
+      self.parities += 1
+      self.publish(self.group, encode(self.first_seq, self.payloads))
+    self.group = None
+    self.first_seq = None
+    self.payloads = []
+
+  def get_stats(self):
+    return {'parities': self.parities}
+
+class FecDecoder(object):
+  ''' Rebuilds the lost packets of a fetched media stream from its parity objects.
+  It remembers the payloads of the last max_packets seqs and the parities whose group is not complete; when a group has its parity and all but one of its packets, the missing one is rebuilt and delivered.
+  May be used from any thread.
+  '''
+
+  max_packets = 1024
+  max_parities = 64
+
+  def __init__(self, deliver, *args, **kwargs):
+    '''
+    Args:
+      deliver : called with the seq and the payload of every rebuilt packet
+    '''
+    super(FecDecoder, self).__init__()
+    self.deliver = deliver
+    self.lock = Lock()
+    # seq -> payload
+    self.payloads = {}
+    # the seqs that have been rebuilt
+    self.recovered_seqs = set()
+    # first seq -> parity content, for the groups that are not complete yet
+    self.parities = {}
+    self.parities_received = 0
+    self.recovered = 0
+    self.duplicates = 0
+
+  def add_data(self, seq, payload):
+    '''Add a fetched payload
+
+    Returns:
+      False if the packet has already been rebuilt, and must not be delivered again
+    '''
+    with self.lock:
+      if seq in self.recovered_seqs:
+        self.duplicates += 1
+        return False
+      self.payloads[seq] = payload
+      if len(self.payloads) > self.__class__.max_packets:
+        self.trim()
+      rebuilt = None
+      for (first_seq, parity) in self.parities.items():
+        if first_seq <= seq < first_seq + ord(parity[4]):
+          rebuilt = self.try_decode(first_seq, parity)
+          break
+    if rebuilt is not None:
+      self.deliver(*rebuilt)
+    return True
+
+  def add_parity(self, parity):
+    '''Add a fetched parity object
+    '''
+    if len(parity) < header_size:
+      return
+    (first_seq, count, length) = unpack_from(header_format, parity)
+    with self.lock:
+      self.parities_received += 1
+      self.parities[first_seq] = parity
+      if len(self.parities) > self.__class__.max_parities:
+        del self.parities[min(self.parities)]
+      rebuilt = self.try_decode(first_seq, parity)
+    if rebuilt is not None:
+      self.deliver(*rebuilt)
+
+  def try_decode(self, first_seq, parity):
+    '''Rebuild the missing packet of a group if there is exactly one. Must be called with self.lock held.
+
+    Returns:
+      (seq, payload) of the rebuilt packet, or None
+    '''
+    seqs = range(first_seq, first_seq + ord(parity[4]))
+    missing = [seq for seq in seqs if seq not in self.payloads]
+    if len(missing) > 1:
+      return None
+    del self.parities[first_seq]
+    if not missing:
+      return None
+    seq = missing[0]
+    payload = decode(parity, [self.payloads[s] for s in seqs if s != seq])
+    self.payloads[seq] = payload
+    self.recovered_seqs.add(seq)
+    self.recovered += 1
+    return (seq, payload)
+
+  def trim(self):
+    '''Forget the oldest half of the payloads. Must be called with self.lock held.
+    '''
+    seqs = sorted(self.payloads)
+    for seq in seqs[: len(seqs) / 2]:
+      del self.payloads[seq]
+    self.recovered_seqs = set([seq for seq in self.recovered_seqs if seq >= seqs[len(seqs) / 2]])
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the number of parity objects received, of packets rebuilt, and of fetched packets dropped because they had been rebuilt already
+    '''
+    with self.lock:
+      return {'parities': self.parities_received, 'recovered': self.recovered, 'duplicates': self.duplicates}
@@ -0,0 +1,107 @@
+from time import time
+
+'''
+.. module:: fetchwindow
+  :platform: Mac OS X, Linux
+  :synopsis: A congestion-controlled window of outstanding Interests, sized from the measured round trip time and the timeouts.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+class FetchWindow(object):
+  ''' The window of outstanding media Interests for a remote user.
+  The window grows by one per Data in slow start and by one per window afterwards, and is halved on a timeout (AIMD). Timeouts of Interests sent before the last decrease do not decrease it again, so a burst of losses only halves the window once. As this goes by the time the Interests were sent, one window can be shared by the streams of a remote user, which have their own seqs.
+  The round trip time from sending an Interest to getting the Data is smoothed as in TCP (RFC 6298), and the retransmission timeout is used as the lifetime of the Interests. Like the window, the timeout is backed off (doubled, up to max_rto) once per burst of timeouts, until the next Data measures the RTT again.
+  '''
+
+  # gains of the smoothed RTT and of the RTT variance
+  alpha = 0.125
+  beta = 0.25
+  # the timer granularity added to the smoothed RTT when the variance is small
+  granularity = 0.05
+  min_rto = 0.1
+  max_rto = 4.0
+  initial_rto = 1.0
+
+  def __init__(self, max_size, initial_size = 4, min_size = 2, *args, **kwargs):
+    '''
+    Args:
+      max_size (int): the largest window
+
+    Kwargs:
+      initial_size (int): the window to start with, in slow start
+      min_size (int): the smallest window
+    '''
+    super(FetchWindow, self).__init__()
+    self.max_size = max_size
+    self.min_size = min(min_size, max_size)
+    self.initial_size = max(self.min_size, min(initial_size, max_size))
+    self.srtt = None
+    self.rttvar = None
+    self.rto = self.__class__.initial_rto
+    self.decreases = 0
+    self.restart()
+
+  def restart(self):
+    '''Go back to slow start with the initial window, e.g. when the remote user is probed again. The RTT estimates are kept.
+    '''
+    self.cwnd = float(self.initial_size)
+    self.ssthresh = float(self.max_size)
+    # the time of the last decrease
+    self.recover_time = 0
+
+  def get_size(self):
+    '''
+    Returns:
+      the number of Interests that may be outstanding
+    '''
+    return int(self.cwnd)
+
+  def get_lifetime(self):
+    '''
+    Returns:
+      the lifetime in seconds for the next Interest
+    '''
+    return self.rto
+
+  def on_data(self, rtt):
+    '''Update the RTT estimates and grow the window when Data comes back
+
+    Args:
+      rtt (float): the time in seconds since the Interest was sent
+    '''
+    if self.srtt is None:
+      self.srtt = rtt
+      self.rttvar = rtt / 2
+    else:
+      self.rttvar += self.__class__.beta * (abs(self.srtt - rtt) - self.rttvar)
+      self.srtt += self.__class__.alpha * (rtt - self.srtt)
+    self.rto = min(self.__class__.max_rto, max(self.__class__.min_rto, self.srtt + max(self.__class__.granularity, 4 * self.rttvar)))
+
+    if self.cwnd < self.ssthresh:
+      self.cwnd += 1
+    else:
+      self.cwnd += 1 / self.cwnd
+    self.cwnd = min(self.cwnd, float(self.max_size))
+
+  def on_timeout(self, sent):
+    '''Halve the window and double the RTO when an Interest times out
+
+    Args:
+      sent (float): the time the Interest that timed out was sent
+    '''
+    if sent <= self.recover_time:
+      return
+    self.ssthresh = max(float(self.min_size), self.cwnd / 2)
+    self.cwnd = self.ssthresh
+    self.rto = min(self.__class__.max_rto, self.rto * 2)
+    self.recover_time = time()
+    self.decreases += 1
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the window, the slow start threshold, the RTT estimates and the RTO in ms, and the number of decreases
+    '''
+    return {'cwnd': round(self.cwnd, 1), 'ssthresh': round(self.ssthresh, 1), 'srtt': round((self.srtt or 0) * 1000, 1), 'rttvar': round((self.rttvar or 0) * 1000, 1), 'rto': round(self.rto * 1000, 1), 'decreases': self.decreases}
@@ -0,0 +1,156 @@
+from heapq import heappush, heappop
+from time import time
+from pktparser import RtpPacket
+from log import Logger
+
+'''
+.. module:: jitterbuffer
+  :platform: Mac OS X, Linux
+  :synopsis: A reorder buffer that releases fetched RTP packets to the browser in RTP order.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+class RtpStream(object):
+  ''' The buffered packets of one SSRC
+  '''
+  def __init__(self, ssrc):
+    super(RtpStream, self).__init__()
+    self.ssrc = ssrc
+    # (extended seq, deadline, data)
+    self.heap = []
+    self.seqs = set()
+    # the extended seq of the next packet to release, None until the first release
+    self.next_seq = None
+    self.highest_seq = None
+    self.release_call = None
+
+  def extend(self, seq):
+    '''Extend a 16-bit RTP seq to the cycle closest to the highest seq seen
+    '''
+    if self.highest_seq is None:
+      return seq
+    ext = (self.highest_seq & ~0xFFFF) | seq
+    if ext - self.highest_seq > 0x8000:
+      ext -= 0x10000
+    elif self.highest_seq - ext > 0x8000:
+      ext += 0x10000
+    return ext
+
+class JitterBuffer(object):
+  ''' Holds the fetched RTP packets of a remote user and releases them in RTP sequence order, per SSRC.
+  A packet is released as soon as all packets before it are released. A missing packet is waited for until the packet after the gap has been held for target_delay seconds; then the gap is skipped. A packet that arrives after its place has been skipped is dropped as late.
+  Packets that are not RTP are released right away.
+
+  The deadline of a packet is taken from its arrival time, not from its RTP timestamp, because the clock rate of the timestamp depends on the payload type negotiated in the SDP.
+  All methods must be called in the reactor thread.
+  '''
+
+  __logger = Logger.get_logger('JitterBuffer')
+
+  # the most packets held per SSRC; beyond that the oldest one is released without waiting
+  max_packets = 512
+
+  def __init__(self, deliver, target_delay = 0.05, reactor = None, *args, **kwargs):
+    '''
+    Args:
+      deliver : called with every released packet
+
+    Kwargs:
+      target_delay (float): the longest time in seconds a packet is held waiting for the packets before it
+      reactor: the Twisted reactor to schedule the releases with; the global reactor is used if not given
+    '''
+    super(JitterBuffer, self).__init__()
+    if reactor is None:
+      from twisted.internet import reactor
+    self.reactor = reactor
+    self.deliver = deliver
+    self.target_delay = target_delay
+    # ssrc -> RtpStream
+    self.streams = {}
+    self.released = 0
+    self.reordered = 0
+    self.max_reorder_depth = 0
+    self.late_drops = 0
+    self.skipped = 0
+
+  def push(self, data):
+    '''Buffer a fetched packet
+
+    Args:
+      data (bytes): the packet
+    '''
+    if len(data) < 12 or ord(data[0]) & 0xC0 != 0x80:
+      self.deliver(data)
+      return
+
+    packet = RtpPacket(data)
+    ssrc = packet.get_ssrc()
+    stream = self.streams.get(ssrc)
+    if stream is None:
+      stream = RtpStream(ssrc)
+      self.streams[ssrc] = stream
+
+    seq = stream.extend(packet.get_seq())
+    if (stream.next_seq is not None and seq < stream.next_seq) or seq in stream.seqs:
+      if seq not in stream.seqs:
+        self.late_drops += 1
+      return
+
+    if stream.highest_seq is None or seq > stream.highest_seq:
+      stream.highest_seq = seq
+    elif seq < stream.highest_seq:
+      self.reordered += 1
+      self.max_reorder_depth = max(self.max_reorder_depth, stream.highest_seq - seq)
+
+    heappush(stream.heap, (seq, time() + self.target_delay, data))
+    stream.seqs.add(seq)
+    self.release(stream)
+
+  def release(self, stream):
+    '''Release the packets of a stream that are in order or past their deadline, and schedule the next check
+    '''
+    now = time()
+    while stream.heap:
+      (seq, deadline, data) = stream.heap[0]
+      if seq != stream.next_seq and deadline > now and len(stream.heap) <= self.__class__.max_packets:
+        break
+      heappop(stream.heap)
+      stream.seqs.discard(seq)
+      if stream.next_seq is not None and seq > stream.next_seq:
+        self.skipped += seq - stream.next_seq
+      stream.next_seq = seq + 1
+      self.released += 1
+      self.deliver(data)
+
+    if stream.release_call is not None and stream.release_call.active():
+      stream.release_call.cancel()
+    stream.release_call = None
+    if stream.heap:
+      stream.release_call = self.reactor.callLater(max(0, stream.heap[0][1] - now), self.release, stream)
+
+  def flush(self):
+    '''Release all the held packets, e.g. when a stream of the remote user starts over from another seq
+    '''
+    for stream in self.streams.values():
+      while stream.heap:
+        (seq, deadline, data) = heappop(stream.heap)
+        self.released += 1
+        self.deliver(data)
+    self.clear()
+
+  def clear(self):
+    '''Drop all the held packets and stop the scheduled releases, e.g. when the remote user has left
+    '''
+    for stream in self.streams.values():
+      if stream.release_call is not None and stream.release_call.active():
+        stream.release_call.cancel()
+    self.streams = {}
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the number of released, reordered, late dropped and skipped packets, and the largest reorder depth seen
+    '''
+    return {'released': self.released, 'reordered': self.reordered, 'max_reorder_depth': self.max_reorder_depth, 'late_drops': self.late_drops, 'skipped': self.skipped}
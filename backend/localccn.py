@@ -0,0 +1,344 @@
+from pyccn import Interest
+import pyccn
+from threading import RLock, Condition, Thread
+from collections import deque, OrderedDict
+from time import time
+from heapq import heappush, heappop
+import random
+import socket
+
+'''
+.. module:: localccn
+  :platform: Mac OS X, Linux
+  :synopsis: An in-process stand-in for ccnd, so that CcnxSocket can be exercised without a real ccnd.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+def get_components(name):
+  '''Get the list of components of a name
+
+  Args:
+    name : PyCCN.Name or name string
+  '''
+  if not isinstance(name, pyccn.Name):
+    name = pyccn.Name(name)
+  return list(name.components)
+
+def canonical_key(component):
+  '''The key for the CCNx canonical ordering of name components: shorter components go first, and components of the same length are compared byte by byte
+  '''
+  return (len(component), component)
+
+class UpcallInfo(object):
+  ''' Mimics the PyCCN.UpcallInfo passed to Closure.upcall
+  '''
+  def __init__(self, interest = None, content_object = None):
+    super(UpcallInfo, self).__init__()
+    self.Interest = interest
+    self.ContentObject = content_object
+
+class Link(object):
+  ''' The link between a LocalHandle and the LocalForwarder. Every Interest and Content Object crossing it, in either direction, is delayed by delay plus a uniformly random jitter, and lost with probability loss.
+  '''
+  def __init__(self, delay = 0.0, jitter = 0.0, loss = 0.0, *args, **kwargs):
+    '''
+    Kwargs:
+      delay (float): the one-way delay in seconds
+      jitter (float): the maximum extra delay in seconds
+      loss (float): the loss rate, between 0 and 1
+    '''
+    super(Link, self).__init__()
+    self.delay = delay
+    self.jitter = jitter
+    self.loss = loss
+
+  def is_lost(self, rand):
+    return self.loss > 0 and rand.random() < self.loss
+
+  def get_delay(self, rand):
+    if self.jitter > 0:
+      return self.delay + rand.uniform(0, self.jitter)
+    return self.delay
+
+class DelayLine(object):
+  ''' A thread that runs the calls scheduled by the LocalForwarder at their due time
+  '''
+  def __init__(self):
+    super(DelayLine, self).__init__()
+    self.condition = Condition()
+    self.heap = []
+    self.counter = 0
+    self.thread = None
+
+  def schedule(self, delay, f, *args):
+    with self.condition:
+      if self.thread is None:
+        self.thread = Thread(target = self.run)
+        self.thread.daemon = True
+        self.thread.start()
+      heappush(self.heap, (time() + delay, self.counter, f, args))
+      self.counter += 1
+      self.condition.notify()
+
+  def run(self):
+    while True:
+      with self.condition:
+        while not self.heap or self.heap[0][0] > time():
+          self.condition.wait(self.heap[0][0] - time() if self.heap else None)
+        (due, counter, f, args) = heappop(self.heap)
+      f(*args)
+
+class PendingInterest(object):
+  ''' An Interest waiting in the LocalForwarder or in a LocalHandle
+  '''
+  def __init__(self, face, interest, expiry, closure = None):
+    super(PendingInterest, self).__init__()
+    self.face = face
+    self.interest = interest
+    self.closure = closure
+    self.components = get_components(interest.name)
+    self.expiry = expiry
+
+  def matches(self, components):
+    '''Whether a Content Object with the name components satisfies this Interest
+    '''
+    return components[:len(self.components)] == self.components
+
+class LocalForwarder(object):
+  ''' A tiny forwarder that connects LocalHandles in the same process, so that several CcnxSockets (and several proxies) can talk to each other without ccnd.
+  It keeps a content store of what has been put, a pending Interest table and the Interest filters of the handles. Every handle is attached through a Link, which may add delay, jitter and loss.
+  Like ccnd, the pending Interests of a handle are not satisfied by the Content Objects put by the same handle.
+  '''
+
+  default_lifetime = 4.0
+
+  def __init__(self, cache_size = None, seed = None, *args, **kwargs):
+    '''
+    Kwargs:
+      cache_size (int): the number of Content Objects kept in the content store, None for no limit, 0 for no caching
+      seed: the seed for the random loss and jitter
+    '''
+    super(LocalForwarder, self).__init__()
+    self.lock = RLock()
+    self.cache_size = cache_size
+    # name components (tuple) -> Content Object
+    self.content_store = OrderedDict()
+    self.pit = []
+    # (face, prefix components)
+    self.filters = []
+    self.random = random.Random(seed)
+    self.delay_line = DelayLine()
+    self.interests = 0
+    self.cache_hits = 0
+    self.lost = 0
+
+  def transmit(self, link, f, *args):
+    '''Call f after the packet crosses the link, unless it is lost on the way
+    '''
+    with self.lock:
+      if link.is_lost(self.random):
+        self.lost += 1
+        return
+      delay = link.get_delay(self.random)
+    if delay > 0:
+      self.delay_line.schedule(delay, f, *args)
+    else:
+      f(*args)
+
+  def lookup(self, components, child_selector):
+    '''Look up the content store for a Content Object under the name
+
+    Args:
+      components (list): the name components of the Interest
+      child_selector (int): 1 for the rightmost child, otherwise the leftmost
+    '''
+    co = self.content_store.get(tuple(components))
+    if co is not None and child_selector != 1:
+      return co
+    n = len(components)
+    found = [k for k in self.content_store.keys() if list(k[:n]) == components]
+    if not found:
+      return None
+    if len(found) > 1:
+      found.sort(key = lambda k: map(canonical_key, k[n:]))
+    key = found[-1] if child_selector == 1 else found[0]
+    return self.content_store[key]
+
+  def express(self, face, interest):
+    '''An Interest expressed by a LocalHandle; it reaches the forwarder after crossing the link of the handle
+    '''
+    self.transmit(face.link, self.receive_interest, face, interest)
+
+  def receive_interest(self, face, interest):
+    components = get_components(interest.name)
+    now = time()
+    lifetime = interest.interestLifetime or self.__class__.default_lifetime
+    with self.lock:
+      self.interests += 1
+      co = self.lookup(components, interest.childSelector)
+      if co is not None:
+        self.cache_hits += 1
+        self.transmit(face.link, face.enqueue_content, co)
+        return
+
+      self.pit = [p for p in self.pit if p.expiry > now]
+      self.pit.append(PendingInterest(face, interest, now + lifetime))
+      targets = [f for (f, prefix) in self.filters if f is not face and components[:len(prefix)] == prefix]
+    for f in targets:
+      self.transmit(f.link, f.enqueue_interest, interest)
+
+  def put(self, face, co):
+    '''A Content Object put by a LocalHandle; it reaches the forwarder after crossing the link of the handle
+    '''
+    self.transmit(face.link, self.receive_content, face, co)
+
+  def receive_content(self, face, co):
+    components = get_components(co.name)
+    now = time()
+    with self.lock:
+      if self.cache_size != 0:
+        key = tuple(components)
+        self.content_store.pop(key, None)
+        self.content_store[key] = co
+        if self.cache_size is not None and len(self.content_store) > self.cache_size:
+          self.content_store.popitem(last = False)
+      satisfied = [p for p in self.pit if p.face is not face and p.expiry > now and p.matches(components)]
+      self.pit = [p for p in self.pit if p not in satisfied and p.expiry > now]
+    for f in set([p.face for p in satisfied]):
+      self.transmit(f.link, f.enqueue_content, co)
+
+  def set_filter(self, face, prefix):
+    '''An Interest filter set by a LocalHandle
+    '''
+    with self.lock:
+      self.filters.append((face, get_components(prefix)))
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the number of Interests received, content store hits and packets lost on the links
+    '''
+    with self.lock:
+      return {'interests': self.interests, 'cache_hits': self.cache_hits, 'lost': self.lost, 'cached': len(self.content_store)}
+
+class LocalHandle(object):
+  ''' A stand-in for PyCCN.CCN that talks to a LocalForwarder over a Link.
+  Like the ccn library, it keeps its own pending Interests and times them out, and dispatches incoming Interests to its Interest filters.
+  Upcalls are queued and run in run(), i.e. in whatever event loop drives the handle; the file descriptor becomes readable whenever upcalls are queued.
+  Like the ccn library, it also holds the Interests and Content Objects handed to it until run() and reports them from output_is_pending, so an event loop that does not watch for output delays them the way it would with ccnd.
+  '''
+  def __init__(self, forwarder, link = None, *args, **kwargs):
+    '''
+    Args:
+      forwarder (LocalForwarder): the forwarder to talk to
+
+    Kwargs:
+      link (Link): the link to the forwarder; a link without delay or loss if not given
+    '''
+    super(LocalHandle, self).__init__()
+    self.forwarder = forwarder
+    self.link = link if link is not None else Link()
+    self.events = deque()
+    self.pending = []
+    self.filters = []
+    # (method of the forwarder, packet) to hand over in the next run()
+    self.outbox = deque()
+    self.lock = RLock()
+    self.signalled = False
+    self.reader, self.writer = socket.socketpair()
+    self.reader.setblocking(False)
+
+  def fileno(self):
+    return self.reader.fileno()
+
+  def output_is_pending(self):
+    with self.lock:
+      return len(self.outbox) > 0
+
+  def flush(self):
+    '''Hand the held Interests and Content Objects to the forwarder
+    '''
+    with self.lock:
+      outbox = list(self.outbox)
+      self.outbox.clear()
+    for (send, packet) in outbox:
+      send(self, packet)
+
+  def enqueue(self, event):
+    '''Queue an event and wake up the event loop
+    '''
+    with self.lock:
+      self.events.append(event)
+      if not self.signalled:
+        self.signalled = True
+        self.writer.send('x')
+
+  def enqueue_interest(self, interest):
+    self.enqueue((pyccn.UPCALL_INTEREST, interest))
+
+  def enqueue_content(self, co):
+    self.enqueue((pyccn.UPCALL_CONTENT, co))
+
+  def run(self, timeout = 0):
+    '''Run the upcalls for the queued events and time out the expired Interests
+    '''
+    with self.lock:
+      if self.signalled:
+        self.signalled = False
+        try:
+          self.reader.recv(4096)
+        except socket.error:
+          pass
+      events = list(self.events)
+      self.events.clear()
+    self.flush()
+
+    for (kind, obj) in events:
+      if kind == pyccn.UPCALL_CONTENT:
+        components = get_components(obj.name)
+        with self.lock:
+          satisfied = [p for p in self.pending if p.matches(components)]
+          self.pending = [p for p in self.pending if p not in satisfied]
+        for p in satisfied:
+          p.closure.upcall(pyccn.UPCALL_CONTENT, UpcallInfo(p.interest, obj))
+      else:
+        components = get_components(obj.name)
+        for (prefix, closure) in self.filters:
+          if components[:len(prefix)] == prefix:
+            closure.upcall(pyccn.UPCALL_INTEREST, UpcallInfo(obj))
+
+    now = time()
+    with self.lock:
+      expired = [p for p in self.pending if p.expiry <= now]
+      self.pending = [p for p in self.pending if p.expiry > now]
+    for p in expired:
+      result = p.closure.upcall(pyccn.UPCALL_INTEREST_TIMED_OUT, UpcallInfo(p.interest))
+      if result == pyccn.RESULT_REEXPRESS:
+        self.send(p.interest, p.closure)
+    # what the upcalls sent goes out in this run, as ccn_run does
+    self.flush()
+    return 0
+
+  def send(self, interest, closure):
+    lifetime = interest.interestLifetime or LocalForwarder.default_lifetime
+    with self.lock:
+      self.pending.append(PendingInterest(self, interest, time() + lifetime, closure))
+      self.outbox.append((self.forwarder.express, interest))
+
+  def expressInterest(self, name, closure, template = None):
+    interest = Interest(name = name)
+    if template is not None:
+      interest.childSelector = template.childSelector
+      interest.interestLifetime = template.interestLifetime
+    self.send(interest, closure)
+
+  def put(self, co):
+    with self.lock:
+      self.outbox.append((self.forwarder.put, co))
+
+  def setInterestFilter(self, name, closure):
+    with self.lock:
+      self.filters.append((get_components(name), closure))
+    self.forwarder.set_filter(self, name)
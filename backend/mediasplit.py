@@ -0,0 +1,67 @@
+from pktparser import RtpPacket
+
+'''
+.. module:: mediasplit
+  :platform: Mac OS X, Linux
+  :synopsis: Tell the audio RTP packets of the local user from the video ones, so that they can be published under separate prefixes.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+class MediaClassifier(object):
+  ''' Classifies RTP packets as audio or video by their SSRC.
+  The SSRCs and payload types of the audio are taken from the "m=audio" section of the sdp offer of the local user if there is one; a packet with an unknown SSRC is classified by its payload type, and the SSRC remembered, so that every later packet of the same source costs one dict lookup.
+  '''
+
+  # the static audio payload types and the dynamic ones the WebRTC frontend offers for audio (ISAC, opus, CN, telephone-event), used when there is no sdp
+  default_audio_types = frozenset([0, 8, 9, 13, 103, 104, 105, 106, 111, 126])
+
+  def __init__(self, sdp = None, *args, **kwargs):
+    '''
+    Kwargs:
+      sdp (str): the sdp offer of the local user
+    '''
+    super(MediaClassifier, self).__init__()
+    self.audio_types = self.__class__.default_audio_types
+    # ssrc -> True for audio, False for video
+    self.ssrcs = {}
+    if sdp is not None:
+      self.learn_sdp(sdp)
+
+  def learn_sdp(self, sdp):
+    '''Take the audio payload types and the SSRCs of the audio and the video from an sdp
+
+    Args:
+      sdp (str): the sdp description
+    '''
+    audio_types = set()
+    section = None
+    for line in sdp.splitlines():
+      if line.startswith('m='):
+        fields = line[2:].split()
+        section = fields[0] if fields else None
+        if section == 'audio':
+          audio_types.update([int(pt) for pt in fields[3:] if pt.isdigit()])
+      elif line.startswith('a=ssrc:') and section in ('audio', 'video'):
+        ssrc = line[len('a=ssrc:'):].split(' ', 1)[0]
+        if ssrc.isdigit():
+          self.ssrcs[int(ssrc)] = section == 'audio'
+    if audio_types:
+      self.audio_types = frozenset(audio_types)
+
+  def is_audio(self, data):
+    '''
+    Args:
+      data (bytes): an RTP packet
+
+    Returns:
+      whether the packet carries audio
+    '''
+    packet = RtpPacket(data)
+    ssrc = packet.get_ssrc()
+    audio = self.ssrcs.get(ssrc)
+    if audio is None:
+      audio = packet.get_pt() in self.audio_types
+      self.ssrcs[ssrc] = audio
+    return audio
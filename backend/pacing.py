@@ -0,0 +1,116 @@
+from collections import deque
+from pktparser import RtpPacket
+import bundle
+import batchsign
+
+'''
+.. module:: pacing
+  :platform: Mac OS X, Linux
+  :synopsis: Estimates when a remote media stream produces its seqs from the RTP timestamps of the fetched packets, so that the Interests for them can be sent just in time.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+def get_timestamp(content):
+  '''
+  Args:
+    content (bytes): the content of a fetched media Content Object, batch signed or not, holding a packet or a bundle
+
+  Returns:
+    (ssrc, RTP timestamp) of the first packet, or None if it is not an RTP packet
+  '''
+  if batchsign.is_batched(content):
+    content = batchsign.unwrap(content)[4]
+  packet = bundle.unbundle(content)[0]
+  if len(packet) < 12 or ord(packet[0]) & 0xC0 != 0x80:
+    return None
+  rtp = RtpPacket(packet)
+  return (rtp.get_ssrc(), rtp.get_timestamp())
+
+class StreamClock(object):
+  ''' The production schedule of a remote media stream.
+  The RTP timestamps of the fetched packets give the media time of every seq once the clock rate is known, which is measured against the arrival times and rounded to the closest usual rate. The smallest difference between the arrival time and the media time of recent packets is the offset of the packets that waited at the publisher for their Interests, i.e. that were fetched as they were produced. The send time of the Interest for a seq is then its extrapolated media time plus that offset, less a round trip time and a margin.
+  An Interest sent too late comes back with a smaller difference, which lowers the offset; so a stream that is fetched from caches, behind the live edge, catches up in a few packets.
+  Only the packets of the first SSRC seen are used, so a stream that carries audio and video is timed by its audio.
+  '''
+
+  standard_rates = (8000, 16000, 32000, 48000, 90000)
+  # the shortest time over which the clock rate is measured
+  min_span = 0.5
+  # the number of recent samples the offset and the round trip time are the minimum of
+  history = 64
+  gain = 0.125
+  # how early the Interest should reach the publisher
+  margin = 0.02
+
+  def __init__(self, *args, **kwargs):
+    super(StreamClock, self).__init__()
+    self.ssrc = None
+    self.clock_rate = None
+    # (extended timestamp, arrival time) of the first packet, for measuring the clock rate
+    self.first = None
+    # (seq, extended timestamp) of the highest seq
+    self.last = None
+    self.last_timestamp = None
+    self.ticks_per_seq = None
+    self.offsets = deque(maxlen = self.__class__.history)
+    self.rtts = deque(maxlen = self.__class__.history)
+
+  def extend(self, timestamp):
+    '''Extend a 32-bit RTP timestamp to the cycle closest to the last one
+    '''
+    if self.last is None:
+      return timestamp
+    delta = (timestamp - self.last_timestamp) & 0xFFFFFFFF
+    if delta >= 0x80000000:
+      delta -= 0x100000000
+    return self.last[1] + delta
+
+  def on_data(self, seq, content, arrival, rtt):
+    '''Learn from a fetched packet
+
+    Args:
+      seq (int): its seq
+      content (bytes): the content of the Content Object
+      arrival (float): the time it came back
+      rtt (float): the time since its Interest was sent
+    '''
+    self.rtts.append(rtt)
+    stamp = get_timestamp(content)
+    if stamp is None:
+      return
+    (ssrc, timestamp) = stamp
+    if self.ssrc is None:
+      self.ssrc = ssrc
+    elif ssrc != self.ssrc:
+      return
+    ext = self.extend(timestamp)
+    if self.first is None:
+      self.first = (ext, arrival)
+    if self.last is None or seq > self.last[0]:
+      if self.last is not None:
+        sample = float(ext - self.last[1]) / (seq - self.last[0])
+        if self.ticks_per_seq is None:
+          self.ticks_per_seq = sample
+        else:
+          self.ticks_per_seq += self.__class__.gain * (sample - self.ticks_per_seq)
+      self.last = (seq, ext)
+      self.last_timestamp = timestamp
+    if self.clock_rate is None:
+      span = arrival - self.first[1]
+      if span < self.__class__.min_span or ext <= self.first[0]:
+        return
+      measured = (ext - self.first[0]) / span
+      self.clock_rate = min(self.__class__.standard_rates, key = lambda rate: abs(rate - measured))
+    self.offsets.append(arrival - float(ext) / self.clock_rate)
+
+  def get_send_time(self, seq):
+    '''
+    Returns:
+      the time to send the Interest for a seq, or None if the schedule is not known yet
+    '''
+    if not self.offsets or self.ticks_per_seq is None:
+      return None
+    ext = self.last[1] + (seq - self.last[0]) * self.ticks_per_seq
+    return min(self.offsets) + ext / self.clock_rate - min(self.rtts) - self.__class__.margin
@@ -136,7 +136,7 @@ class RtpPacket(object):
     return self.byte_array[1] & mask
 
   def get_seq(self):
-    return self.byte_array[2] * 255 + self.byte_array[3]
+    return self.byte_array[2] * 256 + self.byte_array[3]
 
   def get_timestamp(self):
     return self.unpack_int32(self.byte_array[4:8])
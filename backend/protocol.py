@@ -1,18 +1,33 @@
 from autobahn.websocket import WebSocketServerProtocol, WebSocketServerFactory
 from twisted.internet.protocol import DatagramProtocol
+from twisted.internet import reactor
 from message import RTCMessage, RTCData, Candidate, PeetsMessage
-from user import User, RemoteUser
+from user import User, RemoteUser, CtrlState
 from roster import Roster
 from log import Logger
 import random, string
-from ccnxsocket import CcnxSocket, PeetsClosure
+from ccnxsocket import CcnxSocket, CcnxSocketPool, PeetsClosure, NameCache, InterestTimedOut, call_in_reactor
 from pyccn import Interest, Closure
 import pyccn
 from apscheduler.scheduler import Scheduler
 import operator
-from time import sleep
+from time import sleep, time
+from struct import pack, unpack
 from pktparser import StunPacket, RtpPacket, RtcpPacket
 from softstate import StateObject
+from batchsign import BatchSigner, BatchVerifier
+from publisher import PublishPipeline
+from contentstore import ContentStore
+from fetchwindow import FetchWindow
+from jitterbuffer import JitterBuffer
+from bundle import Bundler
+from connstate import ConnectionIndex
+from mediasplit import MediaClassifier
+from fec import FecEncoder, FecDecoder
+from pacing import StreamClock
+from speakers import SpeakerRanking, get_audio_level_id, default_audio_level_id
+import bundle
+import batchsign
 
 '''
 .. module:: protocol
@@ -55,7 +70,8 @@ class PeetsServerProtocol(WebSocketServerProtocol):
     self.media_source_port = None
     self.media_source_sdp = None
     self.ip = None
-    self.local_seq = 0
+    # stream kind -> the seq of the next local media packet of that stream
+    self.local_seqs = {}
     self.ctrl_seqs = {}
     self.remote_cids = {}
 
@@ -89,7 +105,7 @@ class PeetsServerProtocol(WebSocketServerProtocol):
 
 class PeetsServerFactory(WebSocketServerFactory):
   '''A factory class that does housing keeping job. This is needed when we use the proxy for multiple local users (each of the user would prompts the creation of a PeetsServerProtocol instance).
-  Although the current usage does not support multiple local user, it's here due to historical reason and potential future needs.
+  Every local user joins the chatroom as a participant of its own, with its own roster; the PeetsMediaTranslator fetches the media of a remote user once for all of them.
   '''
 
   __logger = Logger.get_logger('PeetsServerFactory')
@@ -113,94 +129,140 @@ class PeetsServerFactory(WebSocketServerFactory):
     # apparently WebSocketServerFactory is old style class
     WebSocketServerFactory.__init__(self, url = url, protocols = protocols, debug = debug, debugCodePaths = debugCodePaths)
     self.handlers = {'join_room' : self.handle_join, 'send_ice_candidate' : self.handle_ice_candidate, 'send_offer' : self.handle_offer, 'media_ready' : self.handle_media_ready, 'chat_msg': self.handle_chat}
-    # keep the list of local clients, first, we deal with the case where there is only one local client
-    self.client = None
-    # keep the list of remote users
-    self.roster = None
+    # id -> PeetsServerProtocol of the local users that have media ready
+    self.clients = {}
+    # id of the local user -> the roster of its remote users
+    self.rosters = {}
     self.listen_port = udp_port
     self.__class__.__logger.debug('UDP-PORT=%s', str(udp_port))
     self.ccnx_socket = CcnxSocket()
     self.ccnx_socket.start()
     self.local_status_callback = lambda status: 0
+    self.client_status_callback = lambda client, status: 0
+    self.remote_status_callback = lambda client, remote_user, status: 0
+    self.offer_callback = lambda client, sdp: 0
     self.nick = nick
     self.prefix = prefix
     self.chatroom = chatroom
 
   def set_local_status_callback(self, callback):
+    '''
+    Args:
+      callback : called with 'Running' when the first local user has media ready, and with 'Stopped' when the last one quits
+    '''
     self.local_status_callback = callback
 
-  def sdp_callback(self, interest, data):
+  def set_client_status_callback(self, callback):
+    '''
+    Args:
+      callback : called with the PeetsServerProtocol and either 'Joined' or 'Left' when a local user has media ready or quits
+    '''
+    self.client_status_callback = callback
+
+  def set_remote_status_callback(self, callback):
+    '''
+    Args:
+      callback : called with the PeetsServerProtocol of a local user, the RemoteUser and either 'Joined' or 'Left' when a remote user joins or leaves the roster of the local user
+    '''
+    self.remote_status_callback = callback
+
+  def set_offer_callback(self, callback):
+    '''
+    Args:
+      callback : called with the PeetsServerProtocol of a local user and its sdp when the offer of the local user comes, which is after it has 'Joined'
+    '''
+    self.offer_callback = callback
+
+  def get_roster(self, client):
+    '''
+    Returns:
+      the roster of the remote users of a local user, or None if the local user has not joined
+    '''
+    return self.rosters.get(client.id)
+
+  def sdp_callback(self, client, data):
     '''A callback function for incoming sdp description from remote users.
 
     Args:
-      interest : PyCCN.UpcallInfo.Interest
+      client (PeetsServerProtocol) : the local user that asked for the sdp
       data : PyCCN.UpcallInfo.ContentObject
 
     Send the sdp to the frontend. If we already received the ICE candidate for the same remote user, then we also send out this ICE candidate.
     '''
+    roster = self.get_roster(client)
+    if roster is None:
+      return
     content = data.content
     offer_msg = RTCMessage.from_string(content)
-    d = RTCData(socketId = self.client.id, sdp = offer_msg.data.sdp)
     # this is the answer to the local user
     answer_msg = RTCMessage('receive_answer', offer_msg.data)
-    self.client.sendMessage(str(answer_msg))
-    remote_user = self.roster[offer_msg.data.socketId]
+    client.sendMessage(str(answer_msg))
+    remote_user = roster[offer_msg.data.socketId]
     remote_user.set_sdp_sent()
     # we received ice candidate before sending answer
     if remote_user.ice_candidate_msg is not None:
-      self.client.sendMessage(str(remote_user.ice_candidate_msg))
+      client.sendMessage(str(remote_user.ice_candidate_msg))
 
-  def peets_msg_callback(self, peets_msg):
-    '''A callback function to process the peets message (to be used by Roster).
+  def peets_msg_callback(self, client, peets_msg):
+    '''A callback function to process the peets message (to be used by the Roster of a local user). Called in the reactor thread.
 
     Args:
+      client (PeetsServerProtocol) : the local user whose roster got the message
       peets_msg (PeetsMessage) : The received PeetsMessage.
 
     Basically, it needs to inform the status change or text chat to the front end and als fetch sdp for the new remote user if the PeetsMessage is a Join.
     '''
+    roster = self.get_roster(client)
+    if roster is None:
+      return
     remote_user = RemoteUser(peets_msg.user)
     if peets_msg.msg_type == PeetsMessage.Join or peets_msg.msg_type == PeetsMessage.Hello:
-      if self.roster.has_key(remote_user.uid):
+      if roster.has_key(remote_user.uid):
         self.__class__.__logger.debug("Redundant join message from %s", remote_user.get_sync_prefix())
-        exit(0)
         return
       
-      self.roster[remote_user.uid] = remote_user
+      roster[remote_user.uid] = remote_user
+      self.remote_status_callback(client, remote_user, 'Joined')
       self.__class__.__logger.debug("Peets join message from remote user: %s", remote_user.get_sync_prefix())
       data = RTCData(socketId = remote_user.uid, username= remote_user.nick)
       msg = RTCMessage('new_peer_connected', data)
-      self.client.sendMessage(str(msg))
+      client.sendMessage(str(msg))
       name = remote_user.get_sdp_prefix()
       
       # ask for sdp message for the new remote user
-      self.ccnx_socket.send_interest(name, PeetsClosure(msg_callback = self.sdp_callback))
+      self.ccnx_socket.send_interest(name, PeetsClosure(msg_callback = lambda interest, data: self.sdp_callback(client, data)))
       
 
     elif peets_msg.msg_type == PeetsMessage.Leave:
-      del self.roster[remote_user.uid]
+      # the roster has already dropped a user whose soft state expired, but the streams of the user still have to be stopped
+      if roster.has_key(remote_user.uid):
+        del roster[remote_user.uid]
+      self.remote_status_callback(client, remote_user, 'Left')
       self.__class__.__logger.debug("Peets leave message from remote user: %s", remote_user.get_sync_prefix())
       data = RTCData(socketId = remote_user.uid)
       msg = RTCMessage('remove_peer_connected', data)
-      self.client.sendMessage(str(msg))
+      client.sendMessage(str(msg))
 
     elif peets_msg.msg_type == PeetsMessage.Chat:
       data = RTCData(socketId = remote_user.uid, messages = peets_msg.extra, username = remote_user.nick)
       msg = RTCMessage('receive_chat_msg', data)
-      self.client.sendMessage(str(msg))
+      client.sendMessage(str(msg))
 
   def unregister(self, client):
-    '''Clean up when the local user quits.
+    '''Clean up when a local user quits.
 
     Args:
       client (PeetsServerProtocol) : the local user.
     '''
 
-    if self.client is not None and client.id == self.client.id:
-      self.local_status_callback('Stopped')
+    if client.id in self.clients:
+      self.client_status_callback(client, 'Left')
       self.handle_leave(client)
       PeetsServerFactory.__logger.debug("unregister client %s", client.id)
-      self.client = None
-      self.roster = None
+      del self.clients[client.id]
+      del self.rosters[client.id]
+      if not self.clients:
+        self.local_status_callback('Stopped')
 
   def process(self, client, msg):
     '''Process the message from the local user's front end.
@@ -238,14 +300,17 @@ class PeetsServerFactory(WebSocketServerFactory):
       client : local user
       data : media_ready message from local user
     '''
-    if self.client is None:
+    if client.id not in self.clients:
       PeetsServerFactory.__logger.debug('register client %s', client.id)
-      self.client = client
+      self.clients[client.id] = client
+      if len(self.clients) == 1:
+        self.local_status_callback('Running')
       # announce self in NDN
-      self.roster = Roster('/ndn/broadcast/' + self.chatroom, self.peets_msg_callback, lambda: self.client.local_user)
-      self.local_status_callback('Running')
+      # the roster calls back from the ccnx thread and from its reaper
+      self.rosters[client.id] = Roster('/ndn/broadcast/' + self.chatroom, lambda msg: call_in_reactor(self.peets_msg_callback, client, msg), lambda: client.local_user)
+      self.client_status_callback(client, 'Joined')
     else:
-      PeetsServerFactory.__logger.debug("Join message from: %s, but we already have a client: %s", client.id, self.client.id)
+      PeetsServerFactory.__logger.debug("Duplicate media ready message from client %s", client.id)
 
   def handle_leave(self, client):
     '''Clean up when local user leaves.
@@ -253,7 +318,7 @@ class PeetsServerFactory(WebSocketServerFactory):
     Args:
       client : local user.
     '''
-    self.roster.leave()
+    self.get_roster(client).leave()
     sleep(1.1)
     
 
@@ -283,11 +348,11 @@ class PeetsServerFactory(WebSocketServerFactory):
       candidate = Candidate(('127.0.0.1', str(self.listen_port)))
       d = RTCData(candidate = str(candidate), socketId = data.socketId)
       msg = RTCMessage('receive_ice_candidate', d)
-      remote_user = self.roster[data.socketId]
+      remote_user = self.get_roster(client)[data.socketId]
       remote_user.set_ice_candidate_msg(msg)
       # sdp answer has already been sent
       if remote_user.sdp_sent:
-        self.client.sendMessage(str(msg))
+        client.sendMessage(str(msg))
 
       
   def handle_offer(self, client, data):
@@ -301,6 +366,7 @@ class PeetsServerFactory(WebSocketServerFactory):
     '''
     if client.media_source_sdp is None:
       client.media_source_sdp = data.sdp
+      self.offer_callback(client, client.media_source_sdp)
 
     d = RTCData(sdp = client.media_source_sdp, socketId = client.id)
     msg = RTCMessage('receive_offer', d)
@@ -317,7 +383,7 @@ class PeetsServerFactory(WebSocketServerFactory):
 
 
   def has_local_client(self):
-    return self.client is not None and self.roster is not None
+    return len(self.clients) > 0
 
   def handle_chat(self, client, data):
     '''Handle chat message from local user.
@@ -328,59 +394,279 @@ class PeetsServerFactory(WebSocketServerFactory):
 
     Publish the text chat message to NDN.
     '''
-    msg = PeetsMessage(PeetsMessage.Chat, self.client.local_user, extra = data.messages)
-    self.roster.chronos_sock.publish_string(self.client.local_user.get_sync_prefix(), self.roster.session, str(msg), StateObject.default_ttl)
+    roster = self.get_roster(client)
+    msg = PeetsMessage(PeetsMessage.Chat, client.local_user, extra = data.messages)
+    roster.chronos_sock.publish_string(client.local_user.get_sync_prefix(), roster.session, str(msg), StateObject.default_ttl)
 
 
 class PeetsMediaTranslator(DatagramProtocol):
   ''' A translator protocol to relay local udp traffic to NDN and remote NDN traffic to local udp.
   This class also implements the strategy for fetching remote data.
-  If the remote seq is unknown, use a short prefix without seq to probe;
-  otherwise use a naive leaking-bucket like method to fetch the remote data
-
-  We seperate the fetching of the media stream and the fetching of the control stream (RTCP, STUN, etc).
+  If the remote seq is unknown, fetch the pointer object the publisher keeps refreshing with the latest seq of the stream, or, without a latest_interval, use a short prefix without seq to probe;
+  otherwise keep a window of pipe_size outstanding Interests, which is refilled as soon as data for the remote user comes back
+
+  We seperate the fetching of the media stream and the fetching of the control stream (RTCP, STUN, etc). The control stream of a remote user to a local user is probed the same way, and then fetched with its own small window of ctrl_window Interests.
+  With split_media, the audio and the video are published under their own prefixes with their own seqs, and the fetching window of a remote user is filled with audio Interests first, so that audio keeps flowing when the window shrinks and only the video degrades.
+  A lost media packet is fetched again on its own, as long as it can still be played out in time, and given up otherwise; a stream falls back to probing only when pipe_size Interests in a row have timed out.
+  With pace_interests, the Interests of the window are not sent as soon as there is room, but when their packets are about to be produced, as estimated from the RTP timestamps of the fetched packets.
+  With a fec_group, every media stream also has a stream of parity objects, one for each group of fec_group packets; the parity of a group is requested with the last packet of the group, and a lost packet is rebuilt as soon as the parity and the rest of its group are in.
+  With top_speakers and split_media, the remote users are ranked by the audio levels of their fetched audio, and the video is only fetched for the loudest top_speakers of them; the others are fetched audio only. The local users are told who the top speakers are whenever that changes.
   '''
   __logger = Logger.get_logger('PeetsMediaTranslator')
-  def __init__(self, factory, pipe_size):
+
+  # the kinds of streams, used with the user id as the keys of the NameCache
+  (MediaStream, CtrlStream, LocalCtrlStream, AudioStream, VideoStream, ParityStream, LatestStream) = range(7)
+  # the times a lost ctrl packet is fetched again
+  ctrl_retries = 2
+
+  def __init__(self, factory, pipe_size, *args, **kwargs):
     '''
     Args:
       factory (PeetsServerFactory) : the factory that stores necessory information about the local user
       pipe_size (int) : the pipeline size for fetching the remote media stream. Pipelining allows us to minimize impact of the interest-data roundtrip delay.
+
+    Kwargs:
+      loop (str) : the event loop for the CcnxSockets, CcnxSocket.ThreadLoop (default) or CcnxSocket.ReactorLoop. With the reactor loop, the callbacks for fetched data run in the reactor thread.
+      batch_size (int) : if positive, sign the local media in batches of at most this many packets with one signature per batch (see batchsign.BatchSigner); 0 (default) signs every packet.
+      batch_interval (float) : the maximum time in seconds a media packet waits for its batch to be signed; defaults to 0.02.
+      cache_bytes (int) : if positive, keep up to this many bytes of the recently published packets in a contentstore.ContentStore and answer Interests for them from memory; 0 disables it. Defaults to 4 MB.
+      handles (int) : the number of ccnx handles (each with its own event loop) used for fetching and for publishing; more than 1 shards the streams over a CcnxSocketPool. Defaults to 1.
+      sign_workers (int) : if not 0, sign the outgoing packets in a publisher.PublishPipeline with this many worker processes (-1 for one per core) instead of in the reactor thread; 0 (default) signs inline.
+      handle_factory : a callable that returns a new ccnx handle for the CcnxSockets, e.g. a localccn.LocalHandle for benchmarks; a handle to the local ccnd is used if not given.
+      fetch_interval (float) : if positive, refill the fetching windows from a periodic job every fetch_interval seconds, as the proxy used to do with 0.01; 0 (default) refills a window from the callbacks of its Interests.
+      max_window (int) : if positive, size the fetching window of every remote user with a fetchwindow.FetchWindow of at most this many Interests, and use its RTO as the Interest lifetime; 0 (default) keeps a fixed window of pipe_size.
+      jitter_delay (float) : if positive, pass the fetched media of every remote user through a jitterbuffer.JitterBuffer that restores the RTP order, waiting at most this many seconds for a missing packet; 0 (default) writes the packets in the order they arrive.
+      bundle_interval (float) : if positive, publish the local media in bundles of the packets of up to this many seconds, or of one video frame (see bundle.Bundler); 0 (default) publishes every packet in its own Content Object.
+      split_media (bool) : if True, publish and fetch the audio and the video as separate streams (see mediasplit.MediaClassifier); False (default) keeps them in one media stream.
+      audio_reserve (int) : with split_media, the number of Interests in the fetching window of a streaming remote user that are kept for its audio (at most all but one); defaults to 4.
+      fec_group (int) : if positive, publish a XOR parity object for every this many packets of a local media stream (at most 255), fetch the parity objects of the remote media streams and rebuild a lost packet of a group from them (see fec.FecDecoder); the overhead is one object in fec_group + 1, and one loss in every fec_group + 1 objects can be repaired. All participants must use the same value. 0 (default) disables it.
+      playout_deadline (float) : the time in seconds after a later packet of its stream came back that a missing media packet is still worth fetching again; defaults to 0.2. Retransmissions only make it in time with Interest lifetimes below this, i.e. with max_window.
+      latest_interval (float) : if positive, publish a pointer to the latest seq of every local media stream at most every latest_interval seconds, with a freshness of 1 second, and start fetching a remote stream from its pointer; 0 finds the latest seq with childSelector probes instead. All participants must use pointers, or none. Defaults to 0.
+      pace_interests (bool) : if True, time the Interests of every remote media stream with a pacing.StreamClock, so that they reach the publisher just before their packets are produced instead of waiting there, or timing out, when the window runs ahead; False (default) sends them as soon as the window has room.
+      ctrl_window (int) : the number of Interests kept outstanding for the ctrl stream (STUN and RTCP) of every remote user to every local user, so that more than one ctrl packet per round trip can come back; 1 fetches one seq at a time. Defaults to 8.
+      ctrl_lifetime (float) : the lifetime in seconds of the ctrl Interests; an Interest that times out is sent again, so this bounds the time a lost ctrl packet takes to be fetched again. Defaults to 1.
+      top_speakers (int) : if positive, and with split_media, only fetch the video of this many remote users, those who talked the most lately (see speakers.SpeakerRanking), and push the list of them to the local users in an 'active_speakers' message; 0 (default) fetches the video of everyone.
+      speaker_interval (float) : with top_speakers, the shortest time in seconds between two rankings of the speakers; defaults to 0.5.
     '''
     self.factory = factory
     self.pipe_size = pipe_size
     self.factory = factory
     self.factory.set_local_status_callback(self.toggle_scheduler)
+    self.factory.set_client_status_callback(self.client_status_callback)
+    self.factory.set_remote_status_callback(self.remote_status_callback)
+    self.factory.set_offer_callback(self.offer_callback)
+    loop = kwargs.get('loop', CcnxSocket.ThreadLoop)
     # here we use two sockets, because the pending interests sent by a socket can not be satisified
     # by the content published later by the same socket
-    self.ccnx_int_socket = CcnxSocket()
+    # the fetching socket keeps a pending interest table, so that re-expressed probes and refills of
+    # the window do not send duplicate interests
+    handles = kwargs.get('handles', 1)
+    cache_bytes = kwargs.get('cache_bytes', 4 * 1024 * 1024)
+    handle_factory = kwargs.get('handle_factory', lambda: None)
+    self.content_store = ContentStore(cache_bytes) if cache_bytes > 0 else None
+    if handles > 1:
+      self.ccnx_int_socket = CcnxSocketPool(handles, handles = [handle_factory() for i in xrange(handles)], loop = loop, pit = True, accept_unverified = batchsign.is_batched)
+      self.ccnx_con_socket = CcnxSocketPool(handles, handles = [handle_factory() for i in xrange(handles)], loop = loop, content_store = self.content_store)
+    else:
+      self.ccnx_int_socket = CcnxSocket(handle = handle_factory(), loop = loop, pit = True, accept_unverified = batchsign.is_batched)
+      self.ccnx_con_socket = CcnxSocket(handle = handle_factory(), loop = loop, content_store = self.content_store)
     self.ccnx_int_socket.start()
-    self.ccnx_con_socket = CcnxSocket()
     self.ccnx_con_socket.start()
-    self.stream_closure = PeetsClosure(msg_callback = self.stream_callback, timeout_callback = self.stream_timeout_callback)
-    self.probe_closure = PeetsClosure(msg_callback = self.probe_callback, timeout_callback = self.probe_timeout_callback)
-    self.ctrl_probe_closure = PeetsClosure(msg_callback = self.ctrl_probe_callback, timeout_callback = self.ctrl_probe_timeout_callback)
+    # the probes touch the streams and write to the transport, which belong to the reactor thread
+    self.probe_closure = PeetsClosure(msg_callback = self.probe_callback, timeout_callback = self.probe_timeout_callback, in_reactor = True, accept_unverified = batchsign.is_batched)
+    self.ctrl_probe_closure = PeetsClosure(msg_callback = self.ctrl_probe_callback, timeout_callback = self.ctrl_probe_timeout_callback, in_reactor = True)
     self.scheduler = None
+    self.fetch_interval = kwargs.get('fetch_interval', 0)
+    self.max_window = kwargs.get('max_window', 0)
+    self.jitter_delay = kwargs.get('jitter_delay', 0)
+    self.bundle_interval = kwargs.get('bundle_interval', 0)
+    # (id of the local user, stream kind) -> Bundler of the local media
+    self.bundlers = {}
+    self.split_media = kwargs.get('split_media', False)
+    self.audio_reserve = kwargs.get('audio_reserve', 4)
+    # the kinds of the media streams, audio first so that its window is filled first
+    self.media_kinds = [self.__class__.AudioStream, self.__class__.VideoStream] if self.split_media else [self.__class__.MediaStream]
+    # id of the local user -> MediaClassifier of its media
+    self.media_classifiers = {}
+    self.fec_group = kwargs.get('fec_group', 0)
+    # (id of the local user, stream kind) -> FecEncoder of the local media
+    self.fec_encoders = {}
+    self.playout_deadline = kwargs.get('playout_deadline', 0.2)
+    self.latest_interval = kwargs.get('latest_interval', 0)
+    self.pace_interests = kwargs.get('pace_interests', False)
+    # (id of the local user, stream kind) -> the time the pointer to the latest seq was last published
+    self.latest_times = {}
+    self.ctrl_window = max(1, kwargs.get('ctrl_window', 8))
+    self.ctrl_lifetime = kwargs.get('ctrl_lifetime', 1.0)
+    # (id of the remote user, id of the local user) -> CtrlState of the ctrl stream fetched for the local user
+    self.ctrl_states = {}
+    top_speakers = kwargs.get('top_speakers', 0)
+    self.speakers = None
+    if top_speakers > 0:
+      if self.split_media:
+        self.speakers = SpeakerRanking(top_speakers)
+      else:
+        self.__class__.__logger.warning('top_speakers needs split_media; fetching the video of everyone')
+    self.speaker_interval = kwargs.get('speaker_interval', 0.5)
+    self.speakers_ranked = 0
+    # the id of the audio level header extension, from the sdp of the local users
+    self.audio_level_id = default_audio_level_id
     self.peets_status = None
+    self.names = NameCache()
+    # the per-peer state looked up on the packet path, instead of the rosters and the dicts of the clients
+    self.peers = ConnectionIndex()
+    # local port of the media of a local user -> the local user
+    self.sources = {}
+    self.batch_size = kwargs.get('batch_size', 0)
+    self.batch_interval = kwargs.get('batch_interval', 0.02)
+    # id of the local user -> BatchSigner of its media
+    self.batch_signers = {}
+    self.batch_verifier = BatchVerifier(self.ccnx_int_socket)
+    self.publish_pipeline = None
+    self.sign_workers = kwargs.get('sign_workers', 0)
+    if self.sign_workers != 0:
+      self.publish_pipeline = PublishPipeline(self.ccnx_con_socket, self.sign_workers if self.sign_workers > 0 else None)
     
   def toggle_scheduler(self, status):
-    '''Start or stop the scheduler for periodic jobs.
+    '''Start or stop fetching and publishing.
 
     Args:
       status (str): either 'Running' or 'Stopped'
+
+    With a fetch_interval, the fetching is driven by a scheduler job; otherwise every remote user is probed as soon as a local user has it in its roster.
     '''
     if status == 'Running':
       self.peets_status = 'Running'
-      self.scheduler = Scheduler()
-      self.scheduler.start()
-      self.scheduler.add_interval_job(self.fetch_media, seconds = 0.01, max_instances = 2)
+      self.peers.clear()
+      if self.sign_workers != 0 and self.publish_pipeline is None:
+        self.publish_pipeline = PublishPipeline(self.ccnx_con_socket, self.sign_workers if self.sign_workers > 0 else None)
+      if self.fetch_interval > 0:
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+        # the job runs in a thread of the scheduler; the fetching state belongs to the reactor thread
+        self.scheduler.add_interval_job(lambda: call_in_reactor(self.fetch_media), seconds = self.fetch_interval, max_instances = 2)
     elif status == 'Stopped':
       self.peets_status = 'Stopped'
-      for job in self.scheduler.get_jobs():
-        self.scheduler.unschedule_job(job)
-      self.scheduler.shutdown(wait = True)
-      self.scheduler = None
-       
+      if self.scheduler is not None:
+        for job in self.scheduler.get_jobs():
+          self.scheduler.unschedule_job(job)
+        self.scheduler.shutdown(wait = True)
+        self.scheduler = None
+      if self.publish_pipeline is not None:
+        self.__class__.__logger.info('Publish pipeline: %s', self.publish_pipeline.get_stats())
+        self.publish_pipeline.stop()
+        self.publish_pipeline = None
+      if self.content_store is not None:
+        self.__class__.__logger.info('Content store: %s', self.content_store.get_stats())
+      for peer in self.peers.values():
+        self.forget_peer(peer)
+      for ctrl in self.ctrl_states.values():
+        self.log_ctrl_stats(ctrl)
+      self.ctrl_states = {}
+      self.peers.clear()
+      self.__class__.__logger.info('Pending interests: %s', self.ccnx_int_socket.get_pit_stats())
+
+  def offer_callback(self, client, sdp):
+    '''Learn the payload types and the SSRCs of the audio and the video of a local user, and the id of the audio level extension, from its sdp offer, which comes after it has joined
+
+    Args:
+      client (PeetsServerProtocol) : the local user
+      sdp (str) : the sdp offer
+    '''
+    classifier = self.media_classifiers.get(client.id)
+    if classifier is not None:
+      classifier.learn_sdp(sdp)
+    if self.speakers is not None:
+      # the browsers of the remote users are assumed to number the extensions the same way
+      self.audio_level_id = get_audio_level_id(sdp)
+
+  def client_status_callback(self, client, status):
+    '''Start or stop publishing the media of a local user, and fetching for it.
+
+    Args:
+      client (PeetsServerProtocol) : the local user
+      status (str): either 'Joined' or 'Left'
+    '''
+    local_user = client.local_user
+    if status == 'Joined':
+      for kind in self.media_kinds:
+        self.names.add_prefix((local_user.uid, kind), self.get_media_prefix(local_user, kind))
+        if self.bundle_interval > 0:
+          self.bundlers[(client.id, kind)] = Bundler(lambda data, kind = kind: self.publish_media(data, kind, client), self.bundle_interval)
+        if self.fec_group > 0:
+          self.names.add_prefix((local_user.uid, self.__class__.ParityStream, kind), self.get_parity_prefix(local_user, kind))
+          self.fec_encoders[(client.id, kind)] = FecEncoder(lambda group, parity, kind = kind: self.publish_parity(group, parity, kind, client), self.fec_group)
+        if self.latest_interval > 0:
+          self.names.add_prefix((local_user.uid, self.__class__.LatestStream, kind), self.get_latest_prefix(local_user, kind))
+      if self.split_media:
+        self.media_classifiers[client.id] = MediaClassifier(client.media_source_sdp)
+      if self.batch_size > 0:
+        self.batch_signers[client.id] = BatchSigner(self.ccnx_con_socket, local_user.get_batch_prefix(), self.batch_size, self.batch_interval)
+        self.ccnx_con_socket.serve_prefix(local_user.get_batch_prefix())
+      self.ccnx_con_socket.serve_prefix(local_user.get_media_prefix())
+      self.ccnx_con_socket.serve_prefix(local_user.get_ctrl_prefix())
+      if self.fec_group > 0:
+        self.ccnx_con_socket.serve_prefix(local_user.get_fec_prefix())
+      if self.latest_interval > 0:
+        self.ccnx_con_socket.serve_prefix(local_user.get_latest_prefix())
+      roster = self.factory.get_roster(client)
+      if roster is not None:
+        for remote_user in roster.values():
+          self.remote_status_callback(client, remote_user, 'Joined')
+    elif status == 'Left':
+      for kind in self.media_kinds:
+        bundler = self.bundlers.pop((client.id, kind), None)
+        if bundler is not None:
+          bundler.flush()
+          self.__class__.__logger.info('Bundles of stream %s of %s: %s', kind, client.id, bundler.get_stats())
+        encoder = self.fec_encoders.pop((client.id, kind), None)
+        if encoder is not None:
+          encoder.flush()
+          self.__class__.__logger.info('Parity of stream %s of %s: %s', kind, client.id, encoder.get_stats())
+      for kind in self.media_kinds:
+        self.latest_times.pop((client.id, kind), None)
+      batch_signer = self.batch_signers.pop(client.id, None)
+      if batch_signer is not None:
+        batch_signer.flush()
+      self.media_classifiers.pop(client.id, None)
+      for (uid, client_id) in self.ctrl_states.keys():
+        if client_id == client.id:
+          self.log_ctrl_stats(self.ctrl_states.pop((uid, client_id)))
+      self.sources = dict([(port, c) for (port, c) in self.sources.iteritems() if c is not client])
+      for peer in self.peers.values():
+        if self.peers.unsubscribe(peer.cid, client.id) is None:
+          self.forget_peer(peer)
+      self.peers.disconnect(client.id)
+
+  def forget_peer(self, peer):
+    '''Log the stats of a remote user that is no longer fetched, and drop the packets its jitter buffer holds
+    '''
+    self.log_fetch_stats(peer)
+    if peer.remote_user is not None and peer.remote_user.jitter_buffer is not None:
+      peer.remote_user.jitter_buffer.clear()
+
+  def reset_stream(self, stream):
+    '''Reset a media stream to Stopped. The jitter buffer of its remote user releases what it holds at once, as the stream starts over from another seq
+    '''
+    stream.reset()
+    if stream.remote_user.jitter_buffer is not None:
+      stream.remote_user.jitter_buffer.flush()
+
+  def log_fetch_stats(self, peer):
+    '''Log the stats of the fetching window and the jitter buffer of a remote user
+    '''
+    remote_user = peer.remote_user
+    if remote_user is None:
+      return
+    if remote_user.window is not None:
+      self.__class__.__logger.info('Fetch window for %s: %s', remote_user.uid, remote_user.window.get_stats())
+    if remote_user.jitter_buffer is not None:
+      self.__class__.__logger.info('Jitter buffer for %s: %s', remote_user.uid, remote_user.jitter_buffer.get_stats())
+    for stream in remote_user.streams.values():
+      self.__class__.__logger.info('Stream %s of %s: timed out %d, refetched %d, skipped %d', stream.kind, remote_user.uid, stream.expired, stream.refetched, stream.skipped)
+      if stream.fec_decoder is not None:
+        self.__class__.__logger.info('FEC of stream %s of %s: %s', stream.kind, remote_user.uid, stream.fec_decoder.get_stats())
+
   def datagramReceived(self, data, (host, port)):
     '''Intercept the webrtc traffice from the local front end and relay it to the NDN
 
@@ -409,64 +695,449 @@ class PeetsMediaTranslator(DatagramProtocol):
     We need to use the username exchanged in the sdps for stun it worked for a while but magically stopped working, so now we still send it over NDN
 
     Note 2:
-    We only publish one medai stream from the local user (with the default offer SDP). We publish RTCP and STUN for each PeerConnections though.
+    We only publish one medai stream from each local user (with the default offer SDP), or one audio and one video stream with split_media. We publish RTCP and STUN for each PeerConnections though.
     '''
     # mask to test most significant 2 bits
     msg = bytearray(data)
-    c = self.factory.client
 
     if msg[0] & 0xC0 == 0 or msg[1] > 199 and msg[1] < 209:
-      try:
-        ctrl_seq = c.ctrl_seqs[port]
-        cid = c.remote_cids[port]
-        # RTCP and STUN is for each peerconnection. the cid of remote user is used to identify the peer connection so that remote user knows which one to fetch
-        name = c.local_user.get_ctrl_prefix() + '/' + cid + '/' + str(ctrl_seq)
-        c.ctrl_seqs[port] = ctrl_seq + 1
-        self.ccnx_con_socket.publish_content(name, data)
-      except KeyError:
-        pass
-
-    elif c.media_source_port == port:
-      # only publish one media stream
-      name = c.local_user.get_media_prefix() + '/' + str(c.local_seq)
-      c.local_seq += 1
+      conn = self.peers.get_by_port(port)
+      if conn is None:
+        # the first ctrl packet of the peerconnection
+        conn = self.connect(port)
+        if conn is None:
+          return
+      self.publish_ctrl(data, conn)
+
+    else:
+      c = self.get_source(port)
+      if c is None:
+        return
+      self.relay_media(data, c)
+
+  def datagramsReceived(self, datagrams):
+    '''Like datagramReceived, for the datagrams read from the socket in one go by a BatchedUdpPort. The PeerConnection or the local user of every port is looked up once per batch.
+
+    Args:
+      datagrams (list): the (data, (host, port)) read
+    '''
+    conns = {}
+    sources = {}
+    for (data, (host, port)) in datagrams:
+      if not data:
+        continue
+      msg = bytearray(data[:2])
+      if msg[0] & 0xC0 == 0 or len(msg) > 1 and msg[1] > 199 and msg[1] < 209:
+        conn = conns.get(port)
+        if conn is None:
+          conn = self.peers.get_by_port(port) or self.connect(port)
+          if conn is None:
+            continue
+          conns[port] = conn
+        self.publish_ctrl(data, conn)
+      else:
+        c = sources.get(port)
+        if c is None:
+          c = self.get_source(port)
+          if c is None:
+            continue
+          sources[port] = c
+        self.relay_media(data, c)
+
+  def publish_ctrl(self, data, conn):
+    '''Publish a RTCP or STUN packet of a PeerConnection
+    '''
+    # RTCP and STUN is for each peerconnection. the cid of remote user is used to identify the peer connection so that remote user knows which one to fetch
+    key = (conn.cid, self.__class__.LocalCtrlStream, conn.client.id)
+    if conn.ctrl_prefix is None:
+      conn.ctrl_prefix = self.names.add_prefix(key, conn.client.local_user.get_ctrl_prefix() + '/' + conn.cid)
+    name = conn.ctrl_prefix.append(str(conn.ctrl_seq))
+    conn.ctrl_seq += 1
+    if self.publish_pipeline is not None:
+      self.publish_pipeline.publish_content(name, data, stream = key, priority = PublishPipeline.Ctrl)
+    else:
+      self.ccnx_con_socket.publish_content(name, data)
+
+  def relay_media(self, data, c):
+    '''Bundle or publish a RTP packet of a local user
+    '''
+    # only publish one media stream, or one for audio and one for video
+    kind = self.get_media_kind(data, c)
+    bundler = self.bundlers.get((c.id, kind))
+    if bundler is not None:
+      bundler.add(data)
+    else:
+      self.publish_media(data, kind, c)
+
+  def connect(self, port):
+    '''Set up the PeerConnection record for a local port, once the ice candidate of a local user has bound it to a remote user
+
+    Returns:
+      the PeerConnection, or None if no local user uses the port
+    '''
+    for c in self.factory.clients.values():
+      cid = c.remote_cids.get(port)
+      if cid is not None:
+        conn = self.peers.connect(c, cid, port)
+        conn.ctrl_seq = c.ctrl_seqs.get(port, 0)
+        return conn
+    return None
+
+  def get_source(self, port):
+    '''
+    Returns:
+      the local user whose media comes from the local port, or None
+    '''
+    c = self.sources.get(port)
+    if c is None:
+      for client in self.factory.clients.values():
+        if client.media_source_port == port:
+          c = client
+          self.sources = dict(self.sources.items() + [(port, c)])
+    return c
+
+  def get_media_kind(self, data, client):
+    '''
+    Args:
+      data (bytes) : a local RTP packet
+      client (PeetsServerProtocol) : the local user that sent it
+
+    Returns:
+      the kind of the stream the packet is published in
+    '''
+    classifier = self.media_classifiers.get(client.id)
+    if classifier is None:
+      return self.__class__.MediaStream
+    return self.__class__.AudioStream if classifier.is_audio(data) else self.__class__.VideoStream
+
+  def get_media_prefix(self, user, kind):
+    '''
+    Args:
+      user (User) : the publisher
+      kind : the kind of the media stream
+
+    Returns:
+      the prefix of the media stream of the user
+    '''
+    if kind == self.__class__.AudioStream:
+      return user.get_audio_prefix()
+    elif kind == self.__class__.VideoStream:
+      return user.get_video_prefix()
+    return user.get_media_prefix()
+
+  def get_parity_prefix(self, user, kind):
+    '''
+    Args:
+      user (User) : the publisher
+      kind : the kind of the media stream
+
+    Returns:
+      the prefix of the parity objects of the media stream of the user. It is not under the media prefix, so that the probes for the media never bring back a parity object.
+    '''
+    if kind == self.__class__.AudioStream:
+      return user.get_fec_prefix() + '/audio'
+    elif kind == self.__class__.VideoStream:
+      return user.get_fec_prefix() + '/video'
+    return user.get_fec_prefix()
+
+  def get_latest_prefix(self, user, kind):
+    '''
+    Returns:
+      the name of the pointer to the latest seq of the media stream of the user, which is not under the media prefix either
+    '''
+    if kind == self.__class__.AudioStream:
+      return user.get_latest_prefix() + '/audio'
+    elif kind == self.__class__.VideoStream:
+      return user.get_latest_prefix() + '/video'
+    return user.get_latest_prefix()
+
+  def publish_media(self, data, kind, c):
+    '''Publish a media packet, or a bundle of them, under the next seq of a local media stream
+
+    Args:
+      data (bytes) : the content
+      kind : the kind of the media stream
+      c (PeetsServerProtocol) : the local user
+    '''
+    key = (c.local_user.uid, kind)
+    seq = c.local_seqs.get(kind, 0)
+    name = self.names.get_name(key, seq)
+    c.local_seqs[kind] = seq + 1
+    self.publish_content(name, data, key, kind, c)
+    encoder = self.fec_encoders.get((c.id, kind))
+    if encoder is not None:
+      encoder.add(seq, data)
+    if self.latest_interval > 0:
+      now = time()
+      if now - self.latest_times.get((c.id, kind), 0) >= self.latest_interval:
+        self.latest_times[(c.id, kind)] = now
+        self.publish_latest(seq, data, kind, c)
+
+  def publish_latest(self, seq, data, kind, c):
+    '''Publish the pointer to the latest seq of a local media stream, which also carries the payload of that seq, so that a fetcher gets its first packet with it. It is signed on its own rather than in a batch, so that it goes out at once, and it is fresh for 1 second, so that caches soon stop answering with an old one.
+
+    Args:
+      seq (int) : the latest seq
+      data (bytes) : the payload published under it
+      kind : the kind of the media stream
+      c (PeetsServerProtocol) : the local user
+    '''
+    key = (c.local_user.uid, self.__class__.LatestStream, kind)
+    name = self.names.get_prefix(key)
+    if self.publish_pipeline is not None:
+      self.publish_pipeline.publish_content(name, pack('!I', seq) + data, 1, stream = key, priority = PublishPipeline.Ctrl)
+    else:
+      self.ccnx_con_socket.publish_content(name, pack('!I', seq) + data, 1)
+
+  def publish_parity(self, group, parity, kind, c):
+    '''Publish the parity object of a group of packets of a local media stream
+
+    Args:
+      group (int) : the number of the group
+      parity (bytes) : the content
+      kind : the kind of the media stream
+      c (PeetsServerProtocol) : the local user
+    '''
+    key = (c.local_user.uid, self.__class__.ParityStream, kind)
+    self.publish_content(self.names.get_name(key, group), parity, key, kind, c)
+
+  def publish_content(self, name, data, key, kind, c):
+    '''Sign and publish a Content Object of a local media stream, in the batch of the local user, through the publish pipeline or inline
+    '''
+    batch_signer = self.batch_signers.get(c.id)
+    if batch_signer is not None:
+      batch_signer.publish_content(name, data)
+    elif self.publish_pipeline is not None:
+      # when audio and video share one stream, it is all in the class that is dropped first
+      priority = PublishPipeline.Audio if kind == self.__class__.AudioStream else PublishPipeline.Video
+      self.publish_pipeline.publish_content(name, data, stream = key, priority = priority)
+    else:
       self.ccnx_con_socket.publish_content(name, data)
 
   def get_info_from_name(self, name):
-    '''Get information such as remote user, remote user id, and sequence number from a name for a media packet
+    '''Get information such as remote user, remote user id, stream kind and sequence number from a name for a media packet
     
     Args:
-      name (str) : name for the media packet.
+      name (PyCCN.Name) : name for the media packet.
+
+    Returns:
+      (remote user, remote user id, kind, seq); all None if the name is not under a media prefix of a known remote user
     '''
-    comps = str(name).split('/')
-    cid = comps[-3]
-    seq = comps[-1]
-    remote_user = self.factory.roster[cid]
-    return remote_user, cid, seq
+    key, seq = self.names.parse(name)
+    if key is None:
+      return None, None, None, None
+    (cid, kind) = key
+    peer = self.peers.get(cid)
+    remote_user = peer.remote_user if peer is not None else None
+    return remote_user, cid, kind, seq
 
-  def stream_callback(self, interest, data):
-    '''The callback function when media stream data comes from NDN
+  def get_peer(self, cid):
+    '''Get the Peer of a remote user, binding the PeerConnections of the local users to it once their ice candidates have set them up
 
     Args:
-      interest : PyCCN.UpcallInfo.Interest
+      cid (str) : the id of the remote user
+
+    Returns:
+      the Peer, or None if no local user has the remote user in its roster
+    '''
+    peer = self.peers.get(cid)
+    if peer is not None and len(peer.connections) < len(peer.clients):
+      for c in peer.clients.values():
+        port = c.media_sink_ports.get(cid)
+        if port is not None and self.peers.get_by_port(port) is None:
+          self.peers.connect(c, cid, port).ctrl_seq = c.ctrl_seqs.get(port, 0)
+    return peer
+
+  def get_connection(self, cid, client_id):
+    '''
+    Returns:
+      the PeerConnection of a local user to a remote user, or None
+    '''
+    peer = self.get_peer(cid)
+    if peer is not None:
+      for conn in peer.connections:
+        if conn.client.id == client_id:
+          return conn
+    return None
+
+  def is_known(self, cid, client_id = None):
+    '''Whether a remote user id is in the roster of any local user, or of the given one
+    '''
+    peer = self.peers.get(cid)
+    return peer is not None and peer.remote_user is not None and (client_id is None or client_id in peer.clients)
+
+  def write_media(self, peer, payload):
+    '''Write a media packet of a remote user to the PeerConnection of every local user that has the remote user
+    '''
+    for conn in peer.connections:
+      self.transport.write(payload, (conn.client.ip, conn.port))
+
+  def get_packet_writer(self, peer, remote_user):
+    '''
+    Returns:
+      a function that writes a fetched payload, a packet or a bundle of them, to the PeerConnections of a remote user, through its jitter buffer if there is one
+    '''
+    write = lambda payload: self.write_media(peer, payload)
+    if self.jitter_delay > 0 and remote_user is not None:
+      if remote_user.jitter_buffer is None:
+        remote_user.jitter_buffer = JitterBuffer(write, self.jitter_delay)
+      write = lambda payload: call_in_reactor(remote_user.jitter_buffer.push, payload)
+
+    def write_packets(payload):
+      for packet in bundle.unbundle(payload):
+        write(packet)
+    return write_packets
+
+  def get_stream_writer(self, peer, remote_user, stream, seq):
+    '''
+    Returns:
+      the function of get_packet_writer for the payload of a seq of a stream, which first hands the payload to the FecDecoder of the stream if there is one
+    '''
+    write_packets = self.get_packet_writer(peer, remote_user)
+    decoder = stream.fec_decoder if stream is not None else None
+    if decoder is None:
+      return write_packets
+
+    def write_unless_recovered(payload):
+      if decoder.add_data(seq, payload):
+        write_packets(payload)
+    return write_unless_recovered
+
+  def deliver_media(self, remote_user, cid, data, stream = None, seq = None):
+    '''Write fetched media data to the PeerConnections for the remote user in the front ends of the local users
+
+    Args:
+      remote_user (RemoteUser) : the publisher of the data
+      cid (str) : the id of the remote user
       data : PyCCN.UpcallInfo.ContentObject
 
-    Update the fetched_seq and reset the number of consecutive timeouts for the remote user.
+    Kwargs:
+      stream (user.StreamState) : the media stream the data belongs to
+      seq (int) : the sequence number of the data
+
+    Batch signed packets are written only after their inclusion proof is checked against the signed root of their batch.
+    Bundles are unpacked into the packets they carry.
+    With a jitter_delay, the packets go through the JitterBuffer of the remote user in the reactor thread.
+    The media is fetched once however many local users have the remote user, and every packet is written to each of their PeerConnections.
+    With a FecDecoder for the stream, the payload is recorded for rebuilding the other packets of its group, and is not written if it has been rebuilt already.
+    '''
+    peer = self.get_peer(cid)
+    if peer is None or not peer.connections:
+      return
+
+    write_packets = self.get_stream_writer(peer, remote_user, stream, seq)
+    content = data.content
+    if remote_user is not None and batchsign.is_batched(content):
+      self.batch_verifier.verify(remote_user.get_batch_prefix(), str(data.name), content, write_packets)
+    else:
+      write_packets(content)
+    self.__class__.__logger.debug('RTP-DATA:%s', str(data.name))
+
+  def fetch_stream(self, stream, seq):
+    '''Send the Interest for a media packet of a streaming remote user.
+
+    Args:
+      stream (user.StreamState) : the media stream of the remote user
+      seq (int) : the sequence number of the packet
+
+    The stream, the seq and the time the Interest is sent are attached to the Deferred of the Interest, so the callbacks need not parse them back from the name.
+    With a FetchWindow, the lifetime of the Interest is its RTO.
+    '''
+    remote_user = stream.remote_user
+    name = self.names.get_name((remote_user.uid, stream.kind), seq)
+    lifetime = remote_user.window.get_lifetime() if remote_user.window is not None else None
+    stream.pending.add(seq)
+    d = self.ccnx_int_socket.express(name, lifetime)
+    sent = time()
+    d.addCallbacks(self.stream_callback, self.stream_timeout_callback, callbackArgs = (stream, seq, sent), errbackArgs = (stream, seq, sent))
+    self.__class__.__logger.debug('RTP-INT:%s', name)
+
+  def stream_callback(self, data, stream, seq, sent):
+    '''The callback function when media stream data comes from NDN
+
+    Args:
+      data : PyCCN.ContentObject
+      stream (user.StreamState) : the media stream the data was fetched for
+      seq (int) : the sequence number of the data
+      sent (float) : the time the Interest was sent
+
+    Update the received seqs, the gaps and the number of consecutive timeouts of the stream and the round trip time for the remote user, and refill the fetching window.
     Deliver the media data to the correct PeerConnection the the front end.
     '''
 
     if self.peets_status != 'Running':
       return
+    remote_user = stream.remote_user
+    self.deliver_media(remote_user, remote_user.uid, data, stream, seq)
+    if seq not in stream.pending:
+      # the stream has been reset since the Interest was sent
+      return
+    now = time()
+    stream.on_data(seq, now)
+    if stream.clock is not None:
+      stream.clock.on_data(seq, data.content, now, now - sent)
+    if self.speakers is not None and stream.kind == self.__class__.AudioStream and self.is_fetching(remote_user):
+      # late audio of a remote user who has left would bring it back into the ranking
+      self.speakers.update(remote_user.uid, self.speakers.get_loudness(data.content, self.audio_level_id), now)
+      if now - self.speakers_ranked >= self.speaker_interval:
+        self.rank_speakers()
+    if remote_user.window is not None:
+      remote_user.window.on_data(now - sent)
+    if self.fetch_interval <= 0:
+      self.fill_window(remote_user)
+
+  def fetch_parity(self, stream, group):
+    '''Send the Interest for the parity object of a group of packets of a media stream
+
+    Args:
+      stream (user.StreamState) : the media stream of the remote user
+      group (int) : the number of the group
+    '''
+    remote_user = stream.remote_user
+    name = self.names.get_name((remote_user.uid, self.__class__.ParityStream, stream.kind), group)
+    lifetime = remote_user.window.get_lifetime() if remote_user.window is not None else None
+    d = self.ccnx_int_socket.express(name, lifetime)
+    d.addCallbacks(self.parity_callback, self.parity_timeout_callback, callbackArgs = (stream,))
+    self.__class__.__logger.debug('FEC-INT:%s', name)
+
+  def parity_callback(self, data, stream):
+    '''The callback when a parity object comes back; it is handed to the FecDecoder of its stream, after its inclusion proof is checked if it is batch signed.
+
+    Args:
+      data : PyCCN.ContentObject
+      stream (user.StreamState) : the media stream the parity object was fetched for
+    '''
+    decoder = stream.fec_decoder
+    if self.peets_status != 'Running' or decoder is None:
+      return
     content = data.content
-    remote_user, cid, seq = self.get_info_from_name(data.name)
-    c = self.factory.client
-    if cid in c.media_sink_ports:
-      self.transport.write(content, (c.ip, c.media_sink_ports[cid]))
-      self.__class__.__logger.debug('RTP-DATA:%s', str(data.name))
+    if batchsign.is_batched(content):
+      self.batch_verifier.verify(stream.remote_user.get_batch_prefix(), str(data.name), content, decoder.add_parity)
+    else:
+      decoder.add_parity(content)
+
+  def parity_timeout_callback(self, failure):
+    '''A lost parity object only costs the repair of its group; the window and the stream are left alone.
+    '''
+    failure.trap(InterestTimedOut)
+
+  def deliver_recovered(self, stream, seq, payload):
+    '''Write a packet of a remote media stream rebuilt by its FecDecoder
 
-    if remote_user is not None:
-      remote_user.fetched_seq = int(seq)
-      remote_user.timeouts = 0
+    Args:
+      stream (user.StreamState) : the media stream
+      seq (int) : the sequence number of the rebuilt packet
+      payload (bytes) : its content, a packet or a bundle
+    '''
+    if self.peets_status != 'Running':
+      return
+    call_in_reactor(stream.on_recovered, seq)
+    remote_user = stream.remote_user
+    peer = self.get_peer(remote_user.uid)
+    if peer is None or not peer.connections:
+      return
+    self.get_packet_writer(peer, remote_user)(payload)
+    self.__class__.__logger.debug('FEC-RECOVERED:%s', self.names.get_name((remote_user.uid, stream.kind), seq))
 
   def probe_callback(self, interest, data):
     '''The callback when the probe for the remote media brought back data.
@@ -475,22 +1146,21 @@ class PeetsMediaTranslator(DatagramProtocol):
       interest : PyCCN.UpcallInfo.Interest; the interest without sequence number to probe the remote media (when we don't know the sequenece number).
       data : PyCCN.UpcallInfo.ContentObject; the data with a name including sequence number
 
-    When such data comes back, we update the requested_seq and fetched_seq for remote user; reset the consecutive timeouts and set its status to be Streaming.
+    When such data comes back, the stream it belongs to starts streaming from its seq, and the fetching window of the remote user is filled.
     '''
     if self.peets_status != 'Running':
       return
-    content = data.content
-    remote_user, cid, seq = self.get_info_from_name(data.name)
-    c = self.factory.client
-    if cid in c.media_sink_ports:
-      self.transport.write(content, (c.ip, c.media_sink_ports[cid]))
-      self.__class__.__logger.debug('RTP-DATA:%s', str(data.name))
-
-    if remote_user is not None:
-      remote_user.requested_seq = int(seq)
-      remote_user.fetched_seq = int(seq)
-      remote_user.timeouts = 0
-      remote_user.streaming_state = RemoteUser.Streaming
+    remote_user, cid, kind, seq = self.get_info_from_name(data.name)
+    stream = remote_user.get_stream(kind) if remote_user is not None else None
+    if stream is not None and (stream.streaming_state != RemoteUser.Probing or not self.is_wanted(stream)):
+      # the stream has been reset since the probe was sent, has started already, or is video no longer wanted
+      return
+    self.deliver_media(remote_user, cid, data, stream, seq)
+
+    if stream is not None:
+      stream.start(seq)
+      if self.fetch_interval <= 0:
+        call_in_reactor(self.fill_window, remote_user)
 
   def ctrl_probe_callback(self, interest, data):
     '''The callback when probe for remote control data brought back data
@@ -499,33 +1169,91 @@ class PeetsMediaTranslator(DatagramProtocol):
       interest : PyCCN.UpcallInfo.Interest
       data : PyCCN.UpcallInfo.ContentObject
 
-    We fetch for the next control data in the end.
+    The ctrl stream then starts streaming after its seq, with a window of ctrl_window Interests.
     '''
     if self.peets_status != 'Running':
       return
     # /remote-prefix/remote-nick/remote-uid/ctrl/self-uid/seq 
-    comps = str(data.name).split('/')
-    seq = comps[-1]
-    cid = comps[-4]
-    remote_user = self.factory.roster[cid]
+    key, seq = self.names.parse(data.name)
+    if key is None:
+      return
+    (cid, kind, client_id) = key
+    self.write_ctrl(key, data)
+    if (cid, client_id) in self.ctrl_states or not self.is_known(cid, client_id):
+      return
+    ctrl = CtrlState(key)
+    ctrl.start(seq)
+    self.ctrl_states[(cid, client_id)] = ctrl
+    self.fill_ctrl(ctrl)
 
+  def write_ctrl(self, key, data):
+    '''Write a fetched ctrl packet to the PeerConnection of the local user to the remote user
+    '''
+    (cid, kind, client_id) = key
     content = data.content
-    c = self.factory.client
-    if cid in c.media_sink_ports:
-      self.transport.write(content, (c.ip, c.media_sink_ports[cid]))
+    conn = self.get_connection(cid, client_id)
+    if conn is not None:
+      self.transport.write(content, (conn.client.ip, conn.port))
       msg = bytearray(content)
       if msg[0] & 0xC0 == 0:
         self.__class__.__logger.debug('STUN-DATA:%s', str(data.name))
       else:
         self.__class__.__logger.debug('RTCP-DATA:%s', str(data.name))
-    
-    name_comps = comps[:-1]
-    new_seq = int(seq) + 1
-    name_comps.append(str(new_seq))
-    name = '/'.join(name_comps)
-    # fetch the next ctrl message
-    self.ccnx_int_socket.send_interest(name, self.ctrl_probe_closure)
+
+  def is_ctrl_fetching(self, ctrl):
+    '''Whether the ctrl stream is still fetched, i.e. we are running and the remote user is still in the roster of the local user
+    '''
+    (cid, kind, client_id) = ctrl.key
+    return self.peets_status == 'Running' and self.ctrl_states.get((cid, client_id)) is ctrl and self.is_known(cid, client_id)
+
+  def fill_ctrl(self, ctrl):
+    '''Send the Interests for the next seqs of a ctrl stream until ctrl_window of them are outstanding
+    '''
+    while len(ctrl.pending) < self.ctrl_window:
+      ctrl.pending[ctrl.next_seq] = 0
+      self.fetch_ctrl(ctrl, ctrl.next_seq)
+      ctrl.next_seq += 1
+
+  def fetch_ctrl(self, ctrl, seq):
+    name = self.names.get_name(ctrl.key, seq)
+    d = self.ccnx_int_socket.express(name, self.ctrl_lifetime)
+    d.addCallbacks(self.ctrl_callback, self.ctrl_timeout_callback, callbackArgs = (ctrl, seq), errbackArgs = (ctrl, seq))
     self.__class__.__logger.debug('CTRL-INT:%s', str(name))
+
+  def ctrl_callback(self, data, ctrl, seq):
+    '''The callback when a ctrl packet comes back: it is written to the local user, and the window of the ctrl stream is refilled
+    '''
+    if seq not in ctrl.pending or not self.is_ctrl_fetching(ctrl):
+      return
+    ctrl.on_data(seq)
+    self.write_ctrl(ctrl.key, data)
+    self.fill_ctrl(ctrl)
+
+  def ctrl_timeout_callback(self, failure, ctrl, seq):
+    '''When a ctrl Interest times out, it is sent again, as its packet may just not be produced yet; but a seq below one that has come back was lost, and it is given up after ctrl_retries more tries, as old STUN and RTCP are of no use.
+    The ctrl stream is dropped once the remote user has left the roster of the local user.
+    '''
+    failure.trap(InterestTimedOut)
+    if seq not in ctrl.pending:
+      return
+    ctrl.expired += 1
+    if not self.is_ctrl_fetching(ctrl):
+      (cid, kind, client_id) = ctrl.key
+      if self.ctrl_states.get((cid, client_id)) is ctrl:
+        self.log_ctrl_stats(self.ctrl_states.pop((cid, client_id)))
+      return
+    if seq < ctrl.fetched_seq:
+      if ctrl.pending[seq] >= self.__class__.ctrl_retries:
+        del ctrl.pending[seq]
+        ctrl.dropped += 1
+        self.fill_ctrl(ctrl)
+        return
+      ctrl.pending[seq] += 1
+    self.fetch_ctrl(ctrl, seq)
+
+  def log_ctrl_stats(self, ctrl):
+    (cid, kind, client_id) = ctrl.key
+    self.__class__.__logger.info('Ctrl stream of %s for %s: %s', cid, client_id, ctrl.get_stats())
     
   def ctrl_probe_timeout_callback(self, interest):
     '''Decides what to do when control probe times out
@@ -533,40 +1261,70 @@ class PeetsMediaTranslator(DatagramProtocol):
     Args:
       interest : the control probe interest
 
-    Check if local user is still here and whether the remote user is still considered active.
+    Check if local user is still here and whether the remote user is still in its roster.
     If both yes, reexpress.
     '''
     if self.peets_status != 'Running':
       return pyccn.RESULT_OK
 
-    comps = str(interest.name).split('/')
-    with_seq = True
-    try:
-      int(comps[-1])
-    except ValueError:
-      with_seq = False
+    key, seq = self.names.parse(interest.name)
+    if key is None:
+      key = self.names.parse_prefix(interest.name)
+    if key is None:
+      return pyccn.RESULT_OK
 
-    cid = comps[-4] if with_seq else comps[-3]
-    if self.factory.roster is not None and self.factory.roster[cid] is not None:
+    (cid, kind, client_id) = key
+    if self.is_known(cid, client_id):
       return pyccn.RESULT_REEXPRESS
 
 
-  def stream_timeout_callback(self, interest):
-    '''When streaming interests timesout, increment the number of consecutive timeouts for the remote.
+  def stream_timeout_callback(self, failure, stream, seq, sent):
+    '''When streaming interests timesout, increment the number of consecutive timeouts of the stream.
+    After pipe_size consecutive timeouts the stream has stalled and falls back to probing; the fetching window restarts once no stream of the remote user is streaming.
+    Otherwise the seq is fetched again if it is missing, i.e. a later seq has come back, and it is still within playout_deadline of that; a missing seq that is too late is skipped. A seq above all the received ones is fetched again, as it may just not be published yet.
 
     Args:
-      interest : PyCCN.UpcallInfo.Interest
+      failure (twisted.python.failure.Failure) : wraps the InterestTimedOut
+      stream (user.StreamState) : the media stream the Interest was sent for
+      seq (int) : the sequence number in the Interest
+      sent (float) : the time the Interest was sent
     '''
+    failure.trap(InterestTimedOut)
     # do not reexpress for non-probing interest
     if self.peets_status != 'Running':
       return
-    remote_user, cid, seq = self.get_info_from_name(interest.name)
-    if remote_user is not None:
-      remote_user.timeouts += 1
-      if remote_user.timeouts >= self.pipe_size:
-        remote_user.reset()
-          
-    return pyccn.RESULT_OK
+    if seq not in stream.pending:
+      # the stream has been reset since the Interest was sent
+      return
+    remote_user = stream.remote_user
+    stream.pending.discard(seq)
+    stream.expired += 1
+    stream.timeouts += 1
+    if remote_user.window is not None:
+      remote_user.window.on_timeout(sent)
+    if stream.timeouts >= self.pipe_size:
+      self.reset_stream(stream)
+      if remote_user.window is not None and all([s.streaming_state != RemoteUser.Streaming for s in remote_user.streams.values()]):
+        remote_user.window.restart()
+      if self.fetch_interval <= 0:
+        self.start_fetching(remote_user)
+      return
+
+    if not self.is_fetching(remote_user) or seq in stream.received:
+      # rebuilt from its parity object in the meantime
+      stream.gaps.pop(seq, None)
+    elif seq < stream.fetched_seq:
+      missed = stream.gaps.get(seq)
+      if missed is not None and time() - missed < self.playout_deadline:
+        stream.refetched += 1
+        self.fetch_stream(stream, seq)
+      else:
+        stream.gaps.pop(seq, None)
+        stream.skipped += 1
+    else:
+      self.fetch_stream(stream, seq)
+    if self.fetch_interval <= 0:
+      self.fill_window(remote_user)
 
   def probe_timeout_callback(self, interest):
     '''Decides what to do when media probe times out
@@ -574,46 +1332,229 @@ class PeetsMediaTranslator(DatagramProtocol):
     Args:
       interest : the media probe interest
 
-    Check if local user is still here and whether the remote user is still considered active.
-    If both yes, reexpress.
+    Check if local user is still here, whether the remote user is still considered active, and whether its stream is still probed and wanted.
+    If all yes, reexpress.
     '''
 
     if self.peets_status != 'Running':
       return pyccn.RESULT_OK
 
-    comps = str(interest.name).split('/')
-    cid = comps[-2]
-    if self.factory.roster is not None and self.factory.roster[cid] is not None:
+    key = self.names.parse_prefix(interest.name)
+    if key is None:
+      return pyccn.RESULT_OK
+
+    (cid, kind) = key
+    if not self.is_known(cid):
+      return pyccn.RESULT_OK
+    stream = self.peers.get(cid).remote_user.get_stream(kind)
+    if stream.streaming_state == RemoteUser.Probing and self.is_wanted(stream):
       return pyccn.RESULT_REEXPRESS
+    return pyccn.RESULT_OK
     
+  def remote_status_callback(self, client, remote_user, status):
+    '''Start fetching from a remote user as soon as it joins the roster of a local user. Called in the reactor thread.
+
+    Args:
+      client (PeetsServerProtocol) : the local user
+      remote_user (RemoteUser) : the remote user
+      status (str) : either 'Joined' or 'Left'
+
+    The media of the remote user is fetched once for all the local users that have it, with the RemoteUser of the first of them; its ctrl data is fetched for each of them.
+    The media is fetched until the remote user has left the roster of every local user; the callbacks of its Interests stop refilling its window once its Peer is gone.
+    '''
+    if status == 'Joined':
+      peer = self.peers.subscribe(remote_user.uid, client)
+      if peer.remote_user is None:
+        peer.remote_user = remote_user
+        if self.speakers is not None:
+          self.add_speaker(remote_user.uid)
+      if self.fetch_interval <= 0:
+        self.start_fetching(peer.remote_user)
+      self.start_ctrl(peer.remote_user, client)
+    elif status == 'Left':
+      ctrl = self.ctrl_states.pop((remote_user.uid, client.id), None)
+      if ctrl is not None:
+        self.log_ctrl_stats(ctrl)
+      peer = self.peers.get(remote_user.uid)
+      if peer is not None and self.peers.unsubscribe(remote_user.uid, client.id) is None:
+        self.forget_peer(peer)
+        if self.speakers is not None:
+          self.remove_speaker(remote_user.uid)
+
+  def add_speaker(self, uid):
+    self.speakers.add(uid)
+    self.rank_speakers()
+
+  def remove_speaker(self, uid):
+    self.speakers.remove(uid)
+    self.rank_speakers()
+
+  def rank_speakers(self):
+    '''Rank the remote users by their loudness. When the top speakers change, the video of the remote users who are no longer among them stops being fetched, the video of the new ones is fetched from the latest seq, and every local user gets the new list of top speakers
+    '''
+    now = time()
+    self.speakers_ranked = now
+    if not self.speakers.rank(now):
+      return
+    self.__class__.__logger.debug('TOP-SPEAKERS:%s', self.speakers.top)
+    for peer in self.peers.values():
+      remote_user = peer.remote_user
+      if remote_user is None:
+        continue
+      video = remote_user.get_stream(self.__class__.VideoStream)
+      if not self.is_wanted(video):
+        if video.streaming_state != RemoteUser.Stopped:
+          # the outstanding Interests are ignored when they come back
+          self.reset_stream(video)
+      elif video.streaming_state == RemoteUser.Stopped and self.fetch_interval <= 0:
+        self.start_fetching(remote_user)
+    for client in self.factory.clients.values():
+      roster = self.factory.get_roster(client)
+      uids = [uid for uid in self.speakers.top if roster is not None and roster.has_key(uid)]
+      client.sendMessage(str(RTCMessage('active_speakers', RTCData(connections = uids))))
+
+  def is_wanted(self, stream):
+    '''Whether a media stream of a remote user should be fetched: its audio always, its video unless it is not among the top speakers
+    '''
+    return self.speakers is None or stream.kind != self.__class__.VideoStream or self.speakers.is_top(stream.remote_user.uid)
+
+  def is_fetching(self, remote_user):
+    '''Whether the media of a remote user should still be fetched, i.e. we are running, a local user is here and the remote user is (still) in the roster of a local user
+    '''
+    peer = self.peers.get(remote_user.uid)
+    return self.peets_status == 'Running' and self.factory.has_local_client() and peer is not None and peer.remote_user is remote_user
+
+  def start_fetching(self, remote_user):
+    '''Probe for the media streams of a remote user that are not being fetched.
+    '''
+    if not self.is_fetching(remote_user):
+      return
+    streams = [remote_user.get_stream(kind) for kind in self.media_kinds]
+    stopped = [stream for stream in streams if stream.streaming_state == RemoteUser.Stopped and self.is_wanted(stream)]
+    if not stopped:
+      return
+    if self.max_window > 0 and remote_user.window is None:
+      remote_user.window = FetchWindow(self.max_window)
+
+    template = Interest(childSelector = 1)
+    for stream in stopped:
+      if self.fec_group > 0 and stream.fec_decoder is None:
+        self.names.add_prefix((remote_user.uid, self.__class__.ParityStream, stream.kind), self.get_parity_prefix(remote_user, stream.kind))
+        stream.fec_decoder = FecDecoder(lambda seq, payload, stream = stream: self.deliver_recovered(stream, seq, payload))
+      if self.pace_interests and stream.clock is None:
+        stream.clock = StreamClock()
+      name = self.names.add_prefix((remote_user.uid, stream.kind), self.get_media_prefix(remote_user, stream.kind))
+      stream.streaming_state = RemoteUser.Probing
+      if self.latest_interval > 0:
+        self.names.add_prefix((remote_user.uid, self.__class__.LatestStream, stream.kind), self.get_latest_prefix(remote_user, stream.kind))
+        self.fetch_latest(stream)
+      else:
+        self.ccnx_int_socket.send_interest(name, self.probe_closure, template)
+        self.__class__.__logger.debug('RTP-INT:%s', name)
+
+  def fetch_latest(self, stream):
+    '''Send the Interest for the pointer to the latest seq of a remote media stream
+    '''
+    remote_user = stream.remote_user
+    name = self.names.get_prefix((remote_user.uid, self.__class__.LatestStream, stream.kind))
+    lifetime = remote_user.window.get_lifetime() if remote_user.window is not None else None
+    d = self.ccnx_int_socket.express(name, lifetime)
+    d.addCallbacks(self.latest_callback, self.latest_timeout_callback, callbackArgs = (stream,), errbackArgs = (stream,))
+    self.__class__.__logger.debug('LATEST-INT:%s', name)
+
+  def latest_callback(self, data, stream):
+    '''The callback when the pointer to the latest seq of a remote media stream comes back: the payload it carries is delivered, and the stream starts streaming from its seq, the first Interests of the window being for packets that are mostly published already.
+
+    Args:
+      data : PyCCN.ContentObject
+      stream (user.StreamState) : the media stream
+    '''
+    if self.peets_status != 'Running' or stream.streaming_state != RemoteUser.Probing:
+      return
+    content = data.content
+    if len(content) < 4:
+      return
+    (seq,) = unpack('!I', content[:4])
+    remote_user = stream.remote_user
+    peer = self.get_peer(remote_user.uid)
+    if peer is not None and peer.connections:
+      self.get_stream_writer(peer, remote_user, stream, seq)(content[4:])
+    stream.start(seq)
+    if self.fetch_interval <= 0:
+      self.fill_window(remote_user)
+
+  def latest_timeout_callback(self, failure, stream):
+    '''Ask for the pointer again as long as the remote user is fetched and the stream has not started otherwise
+    '''
+    failure.trap(InterestTimedOut)
+    if self.is_fetching(stream.remote_user) and stream.streaming_state == RemoteUser.Probing:
+      self.fetch_latest(stream)
+
+  def start_ctrl(self, remote_user, client):
+    '''Probe for the control data a remote user sends to a local user; the probe is re-expressed as long as the remote user is in the roster of the local user.
+    '''
+    if self.peets_status != 'Running' or not self.is_known(remote_user.uid, client.id):
+      return
+    template = Interest(childSelector = 1)
+    ctrl_name = self.names.add_prefix((remote_user.uid, self.__class__.CtrlStream, client.id), remote_user.get_ctrl_prefix() + '/' + client.local_user.uid)
+    self.ccnx_int_socket.send_interest(ctrl_name, self.ctrl_probe_closure, template)
+    self.__class__.__logger.debug('CTRL-INT:%s', ctrl_name)
+
+  def fill_window(self, remote_user):
+    '''Send the media Interests for a streaming remote user until the number of outstanding Interests reaches the size of its window, or pipe_size without a FetchWindow
+
+    With split_media, the audio is served first: while the video is streaming, audio_reserve Interests of the window (at most all but one) are kept for the audio and the video gets the rest, so a shrinking window takes the Interests of the video first. Otherwise the audio may use the whole window.
+    '''
+    if not self.is_fetching(remote_user):
+      return
+
+    size = remote_user.window.get_size() if remote_user.window is not None else self.pipe_size
+    streams = [remote_user.get_stream(kind) for kind in self.media_kinds]
+    if len(streams) == 1:
+      self.fill_stream(streams[0], size)
+      return
+
+    (audio, video) = streams
+    reserve = min(self.audio_reserve, size - 1) if video.streaming_state == RemoteUser.Streaming else size
+    self.fill_stream(audio, reserve)
+    self.fill_stream(video, size - max(reserve, audio.get_outstanding()) if audio.streaming_state == RemoteUser.Streaming else size)
+
+  def fill_stream(self, stream, limit):
+    '''Send the Interests for a streaming media stream until it has limit outstanding Interests.
+    With a FecDecoder, the Interest for the parity object of a group goes out with the one for the last packet of the group; it is not counted in the window.
+    With a StreamClock, an Interest is only sent once its send time has come; the window is refilled again at that time, or by the periodic job with a fetch_interval.
+    '''
+    if stream.streaming_state != RemoteUser.Streaming:
+      return
+    now = time()
+    while stream.get_outstanding() < limit:
+      if stream.clock is not None:
+        at = stream.clock.get_send_time(stream.requested_seq + 1)
+        if at is not None and at > now:
+          if self.fetch_interval <= 0 and stream.pace_call is None:
+            stream.pace_call = reactor.callLater(at - now, self.paced_fill, stream)
+          break
+      stream.requested_seq += 1
+      self.fetch_stream(stream, stream.requested_seq)
+      if stream.fec_decoder is not None and (stream.requested_seq + 1) % self.fec_group == 0:
+        self.fetch_parity(stream, stream.requested_seq // self.fec_group)
+
+  def paced_fill(self, stream):
+    '''Refill the window of a remote user when the next paced Interest of one of its streams is due
+    '''
+    stream.pace_call = None
+    self.fill_window(stream.remote_user)
+
   def fetch_media(self):
-    '''Fetch remote media and control data.
-    Check every 10 ms. 
-    If the remote user is not Stopped, probe for its media and control;
-    Otherwise, if it's Streaming, send the media Interest if the number of outstanding Interests is less than pipe_size
+    '''Fetch remote media; the periodic job used with a fetch_interval, run in the reactor thread.
+    Probe for the media streams of every remote user that are Stopped;
+    send the media Interests of its Streaming streams if the number of outstanding Interests is less than the window
     '''
     if self.factory.has_local_client():
-      for remote_user in self.factory.roster.values():
-        if remote_user.streaming_state == RemoteUser.Stopped:
-          name = remote_user.get_media_prefix()
-          template = Interest(childSelector = 1)
-          self.ccnx_int_socket.send_interest(name, self.probe_closure, template)
-          self.__class__.__logger.debug('RTP-INT:%s', name)
-          remote_user.streaming_state = RemoteUser.Probing
-
-          # also fetch ctrl messages
-          ctrl_name = remote_user.get_ctrl_prefix() + '/' + self.factory.client.local_user.uid
-          self.ccnx_int_socket.send_interest(ctrl_name, self.ctrl_probe_closure, template)
-          self.__class__.__logger.debug('CTRL-INT:%s', ctrl_name)
-          
-        elif remote_user.streaming_state == RemoteUser.Streaming:
-          while remote_user.requested_seq - remote_user.fetched_seq < self.pipe_size:
-            name = remote_user.get_media_prefix() + '/' + str(remote_user.requested_seq + 1)
-            remote_user.requested_seq += 1
-            self.ccnx_int_socket.send_interest(name, self.stream_closure)
-            self.__class__.__logger.debug('RTP-INT:%s', name)
-        else:
-          pass
+      for peer in self.peers.values():
+        if peer.remote_user is not None:
+          self.start_fetching(peer.remote_user)
+          self.fill_window(peer.remote_user)
 
 if __name__ == '__main__':
   peets_factory = PeetsServerFactory("ws://localhost:8000")
@@ -0,0 +1,206 @@
+from threading import Condition, Lock, Thread
+from collections import deque
+from multiprocessing import cpu_count
+import marshal
+import os
+import subprocess
+import sys
+from time import time
+import pyccn
+from pyccn import CCN, ContentObject, Name
+from ccnxsocket import CcnxSocket
+from log import Logger
+
+'''
+.. module:: publisher
+  :platform: Mac OS X, Linux
+  :synopsis: A pipeline that signs outgoing Content Objects in worker processes, away from the Twisted reactor.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+def sign_loop(infile, outfile):
+  '''The loop of a worker process: sign the packets that come in marshalled on infile and marshal back the ccnb encodings of the Content Objects, or None if the signing failed.
+  The packets are signed with the default ccnx key and a SignedInfo that is rebuilt every CcnxSocket.signed_info_ttl seconds, as CcnxSocket.sign_content does.
+
+  Args:
+    infile (file): where the (name, content, freshness) jobs are read from, until it is closed
+    outfile (file): where the results are written to
+  '''
+  key = CCN.getDefaultKey()
+  key_locator = pyccn.KeyLocator(key)
+  # freshness -> (PyCCN.SignedInfo, time created)
+  signed_infos = {}
+  try:
+    while True:
+      (name, content, freshness) = marshal.load(infile)
+      try:
+        now = time()
+        (si, created) = signed_infos.get(freshness, (None, 0))
+        if si is None or now - created >= CcnxSocket.signed_info_ttl:
+          si = pyccn.SignedInfo()
+          si.publisherPublicKeyDigest = key.publicKeyID
+          si.type = pyccn.CONTENT_DATA
+          si.freshnessSeconds = freshness
+          si.keyLocator = key_locator
+          signed_infos[freshness] = (si, now)
+        co = ContentObject(Name(name), content, si)
+        co.sign(key)
+        marshal.dump(co.get_ccnb(), outfile)
+      except Exception:
+        marshal.dump(None, outfile)
+      outfile.flush()
+  except (EOFError, IOError, KeyboardInterrupt):
+    # the proxy has gone away or is being interrupted
+    return
+
+class PublishPipeline(object):
+  ''' Queues the packets to be published and signs them in a pool of worker processes; the signed Content Objects are put from the reactor thread.
+  Every stream is always handled by the same worker, so the packets of a stream are put in the order they were queued.
+  The queue is bounded. When it is full, the oldest packet of the lowest priority class is dropped (video first, then audio; control packets last), which may be the new packet itself.
+
+  PyCCN holds the GIL while it signs, so the signing is done in processes. Each worker is a thread that feeds its process through a pipe and waits for the ccnb encoding of the signed Content Object, which it decodes again; the thread only holds the GIL for the copying.
+  The processes run this module afresh (fork and exec) and load the default ccnx key themselves, rather than being forked off the proxy, whose ccnx loops and other threads may hold locks at the time of the fork.
+  '''
+
+  __logger = Logger.get_logger('PublishPipeline')
+
+  # priority classes, in the order of dropping last to dropping first
+  (Ctrl, Audio, Video) = range(3)
+
+  def __init__(self, ccnx_socket, workers = None, max_queue = 256, reactor = None, *args, **kwargs):
+    '''
+    Args:
+      ccnx_socket (CcnxSocket): the socket to sign with and publish to
+
+    Kwargs:
+      workers (int): the number of worker processes; one per core if not given
+      max_queue (int): the maximum number of packets waiting to be signed
+      reactor: the Twisted reactor to put the Content Objects from; the global reactor is used if not given
+    '''
+    super(PublishPipeline, self).__init__()
+    if reactor is None:
+      from twisted.internet import reactor
+    self.reactor = reactor
+    self.ccnx_socket = ccnx_socket
+    self.max_queue = max_queue
+    self.lock = Lock()
+    self.queues = [deque() for i in xrange(workers or cpu_count())]
+    # one condition per worker, all sharing self.lock
+    self.conditions = [Condition(self.lock) for queue in self.queues]
+    self.queued = 0
+    # a counter to tell the oldest packet across the queues
+    self.order = 0
+    self.dropped = [0, 0, 0]
+    self.running = True
+    self.processes = []
+    self.threads = []
+    script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+    for i in xrange(len(self.queues)):
+      p = subprocess.Popen([sys.executable, script], stdin = subprocess.PIPE, stdout = subprocess.PIPE, close_fds = True)
+      self.processes.append(p)
+      t = Thread(target = self.work, args = (i, p))
+      t.daemon = True
+      t.start()
+      self.threads.append(t)
+
+  def publish_content(self, name, content, freshness = 5, stream = None, priority = Video):
+    '''Queue a packet to be signed and published; safe to call from any thread.
+
+    Args:
+      name (str): the name string
+      content (bytes): the data bytes
+
+    Kwargs:
+      freshness (int): the freshness in seconds for the Content Object
+      stream: the key of the stream the packet belongs to, e.g. its prefix; packets of the same stream are published in order
+      priority (int): one of PublishPipeline.Ctrl, PublishPipeline.Audio and PublishPipeline.Video
+    '''
+    i = hash(stream) % len(self.queues)
+    queue = self.queues[i]
+    with self.lock:
+      if self.queued >= self.max_queue and not self.drop(priority):
+        self.dropped[priority] += 1
+        return
+      queue.append((self.order, priority, name, content, freshness))
+      self.order += 1
+      self.queued += 1
+      self.conditions[i].notify()
+
+  def drop(self, priority):
+    '''Drop the oldest queued packet of the lowest priority class, if it is not more important than a new packet of the given priority. Must be called with self.lock held.
+
+    Returns:
+      True if a queued packet has been dropped
+    '''
+    victim = None
+    for queue in self.queues:
+      for item in queue:
+        if item[1] >= priority and (victim is None or item[1] > victim[1][1] or (item[1] == victim[1][1] and item[0] < victim[1][0])):
+          victim = (queue, item)
+
+    if victim is None:
+      return False
+
+    (queue, item) = victim
+    queue.remove(item)
+    self.queued -= 1
+    self.dropped[item[1]] += 1
+    return True
+
+  def work(self, i, process):
+    '''The loop of a worker thread, which has its packets signed by its worker process
+
+    Args:
+      i (int): the index of the queue of the worker
+      process (subprocess.Popen): the worker process
+    '''
+    queue = self.queues[i]
+    condition = self.conditions[i]
+    while True:
+      with self.lock:
+        while self.running and not queue:
+          condition.wait()
+        if not self.running:
+          break
+        (order, priority, name, content, freshness) = queue.popleft()
+        self.queued -= 1
+
+      try:
+        marshal.dump((str(name), content, freshness), process.stdin)
+        process.stdin.flush()
+        ccnb = marshal.load(process.stdout)
+      except (EOFError, IOError, ValueError):
+        self.__class__.__logger.error('Worker process %d is gone, dropping its packets', i)
+        break
+      if ccnb is None:
+        self.__class__.__logger.error('Failed to sign %s', name)
+        continue
+      self.reactor.callFromThread(self.ccnx_socket.put, ContentObject.from_ccnb(ccnb))
+
+    try:
+      # the worker process exits when its input is closed
+      process.stdin.close()
+    except IOError:
+      pass
+    process.wait()
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the number of queued packets and the number of dropped packets per priority class
+    '''
+    with self.lock:
+      return {'queued': self.queued, 'dropped_ctrl': self.dropped[self.__class__.Ctrl], 'dropped_audio': self.dropped[self.__class__.Audio], 'dropped_video': self.dropped[self.__class__.Video]}
+
+  def stop(self):
+    '''Stop the workers and their processes; the packets still queued are discarded
+    '''
+    with self.lock:
+      self.running = False
+      for condition in self.conditions:
+        condition.notify()
+
+if __name__ == '__main__':
+  sign_loop(sys.stdin, sys.stdout)
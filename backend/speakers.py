@@ -0,0 +1,205 @@
+from struct import unpack_from
+from math import exp
+import bundle
+import batchsign
+
+'''
+.. module:: speakers
+  :platform: Mac OS X, Linux
+  :synopsis: Ranks the remote users by how much they have been talking lately, from the audio levels in their RTP packets, so that the video of only the top speakers needs to be fetched.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+audio_level_uri = 'urn:ietf:params:rtp-hdrext:ssrc-audio-level'
+# the id WebRTC gives the audio level extension if the sdp does not say
+default_audio_level_id = 1
+
+def get_audio_level_id(sdp):
+  '''
+  Args:
+    sdp (str): an sdp description
+
+  Returns:
+    the id of the audio level header extension in the "a=extmap" lines of the sdp, or default_audio_level_id
+  '''
+  if sdp is not None:
+    for line in sdp.splitlines():
+      if line.startswith('a=extmap:') and audio_level_uri in line:
+        ext_id = line[len('a=extmap:'):].split(' ', 1)[0].split('/', 1)[0]
+        if ext_id.isdigit():
+          return int(ext_id)
+  return default_audio_level_id
+
+def get_audio_level(packet, ext_id = default_audio_level_id):
+  '''Read the audio level of an RTP packet from its header extension (RFC 6464), with the one-byte or the two-byte extension headers (RFC 5285). SRTP leaves the header extensions in the clear.
+
+  Args:
+    packet (bytes): an RTP packet
+
+  Kwargs:
+    ext_id (int): the id of the audio level extension
+
+  Returns:
+    the level in -dBov, from 0 for the loudest to 127 for silence, or None if the packet has no audio level
+  '''
+  if len(packet) < 16:
+    return None
+  first = ord(packet[0])
+  if first & 0xC0 != 0x80 or not first & 0x10:
+    return None
+  offset = 12 + 4 * (first & 0x0F)
+  if len(packet) < offset + 4:
+    return None
+  (profile, length) = unpack_from('!HH', packet, offset)
+  i = offset + 4
+  end = min(len(packet), i + 4 * length)
+  if profile == 0xBEDE:
+    while i < end:
+      byte = ord(packet[i])
+      if byte == 0:
+        # padding
+        i += 1
+        continue
+      element_id = byte >> 4
+      if element_id == 15:
+        break
+      if element_id == ext_id and i + 1 < end:
+        return ord(packet[i + 1]) & 0x7F
+      i += 2 + (byte & 0x0F)
+  elif profile & 0xFFF0 == 0x1000:
+    while i + 1 < end:
+      element_id = ord(packet[i])
+      if element_id == 0:
+        i += 1
+        continue
+      if element_id == ext_id and i + 2 < end:
+        return ord(packet[i + 2]) & 0x7F
+      i += 2 + ord(packet[i + 1])
+  return None
+
+def get_payload_size(packet):
+  '''
+  Returns:
+    the size of the payload of an RTP packet, without the header, the CSRCs, the header extension and the padding
+  '''
+  if len(packet) < 12:
+    return 0
+  first = ord(packet[0])
+  size = len(packet) - 12 - 4 * (first & 0x0F)
+  if first & 0x10 and size >= 4:
+    (length,) = unpack_from('!H', packet, 12 + 4 * (first & 0x0F) + 2)
+    size -= 4 + 4 * length
+  if first & 0x20 and size > 0:
+    size -= ord(packet[-1])
+  return max(0, size)
+
+class SpeakerRanking(object):
+  ''' The loudness of every remote user, and the size top speakers.
+  The loudness of a packet is taken from its audio level if it has one, 1 at 0 dBov down to 0 at silence_level; otherwise the size of its payload stands in for it, as the variable bitrate audio of WebRTC (opus, with DTX) makes much smaller packets in silence than in speech. The loudness of a user decays exponentially with time_constant.
+  A user stays among the top speakers for at least hold seconds, so that the video is not switched back and forth between two users talking in turns.
+  '''
+
+  time_constant = 1.0
+  hold = 2.0
+  # the audio level (-dBov) at and below which a packet counts as silence
+  silence_level = 70
+  # the payload size of a packet that counts as full loudness when there is no audio level
+  loud_size = 100
+
+  def __init__(self, size, *args, **kwargs):
+    '''
+    Args:
+      size (int): the number of top speakers
+    '''
+    super(SpeakerRanking, self).__init__()
+    self.size = size
+    # id of the remote user -> (loudness, time of the last update)
+    self.scores = {}
+    # the ids of the top speakers, loudest first
+    self.top = []
+    # id of a top speaker -> the time it became one
+    self.since = {}
+    self.changes = 0
+
+  def add(self, uid):
+    self.scores.setdefault(uid, (0.0, None))
+
+  def remove(self, uid):
+    self.scores.pop(uid, None)
+    self.since.pop(uid, None)
+
+  def get_loudness(self, content, ext_id = default_audio_level_id):
+    '''
+    Args:
+      content (bytes): the content of a fetched audio Content Object, batch signed or not, holding a packet or a bundle
+
+    Kwargs:
+      ext_id (int): the id of the audio level extension
+
+    Returns:
+      the loudness of the packets in it, from 0 to 1
+    '''
+    if batchsign.is_batched(content):
+      content = batchsign.unwrap(content)[4]
+    packets = bundle.unbundle(content)
+    total = 0.0
+    for packet in packets:
+      level = get_audio_level(packet, ext_id)
+      if level is not None:
+        total += max(0.0, 1 - float(level) / self.__class__.silence_level)
+      else:
+        total += min(1.0, float(get_payload_size(packet)) / self.__class__.loud_size)
+    return total / len(packets) if packets else 0.0
+
+  def update(self, uid, loudness, now):
+    '''Add the loudness of a fetched audio packet of a remote user
+    '''
+    (score, last) = self.scores.get(uid, (0.0, None))
+    if last is None:
+      score = loudness
+    else:
+      gain = 1 - exp(-max(0.0, now - last) / self.__class__.time_constant)
+      score += gain * (loudness - score)
+    self.scores[uid] = (score, now)
+
+  def get_score(self, uid, now):
+    '''
+    Returns:
+      the loudness of a remote user, decayed to now
+    '''
+    (score, last) = self.scores.get(uid, (0.0, None))
+    if last is None:
+      return score
+    return score * exp(-max(0.0, now - last) / self.__class__.time_constant)
+
+  def rank(self, now):
+    '''Pick the top speakers again
+
+    Returns:
+      whether the set of the top speakers has changed
+    '''
+    scores = dict([(uid, self.get_score(uid, now)) for uid in self.scores])
+    held = [uid for uid in self.top if uid in scores and now - self.since[uid] < self.__class__.hold]
+    top = held[:self.size]
+    for uid in sorted(scores, key = lambda uid: scores[uid], reverse = True):
+      if len(top) >= self.size:
+        break
+      if uid not in top:
+        top.append(uid)
+    top.sort(key = lambda uid: scores[uid], reverse = True)
+    changed = set(top) != set(self.top)
+    for uid in top:
+      if uid not in self.since or uid not in self.top:
+        self.since[uid] = now
+    for uid in self.top:
+      if uid not in top:
+        self.since.pop(uid, None)
+    self.top = top
+    if changed:
+      self.changes += 1
+    return changed
+
+  def is_top(self, uid):
+    return uid in self.top
@@ -0,0 +1,329 @@
+import socket
+import errno
+import ctypes
+import ctypes.util
+from struct import pack, unpack_from
+from threading import Lock
+from log import Logger
+from zope.interface import implements
+from twisted.internet.interfaces import IReadDescriptor
+from twisted.python import threadable
+
+'''
+.. module:: udpbatch
+  :platform: Mac OS X, Linux
+  :synopsis: A UDP port for the Twisted reactor that reads and writes many datagrams per wakeup, with recvmmsg and sendmmsg where the libc has them.
+
+.. moduleauthor:: Zhenkai Zhu <zhenkai@cs.ucla.edu>
+
+'''
+
+MSG_DONTWAIT = 0x40
+sockaddr_size = 128
+
+class iovec(ctypes.Structure):
+  _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class msghdr(ctypes.Structure):
+  _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32), ('msg_iov', ctypes.POINTER(iovec)), ('msg_iovlen', ctypes.c_size_t), ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t), ('msg_flags', ctypes.c_int)]
+
+class mmsghdr(ctypes.Structure):
+  _fields_ = [('msg_hdr', msghdr), ('msg_len', ctypes.c_uint)]
+
+# the same layouts with the pointers typed as strings, so the datagrams to send and their addresses are referenced without copies or casts
+class send_iovec(ctypes.Structure):
+  _fields_ = [('iov_base', ctypes.c_char_p), ('iov_len', ctypes.c_size_t)]
+
+class send_msghdr(ctypes.Structure):
+  _fields_ = [('msg_name', ctypes.c_char_p), ('msg_namelen', ctypes.c_uint32), ('msg_iov', ctypes.POINTER(send_iovec)), ('msg_iovlen', ctypes.c_size_t), ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t), ('msg_flags', ctypes.c_int)]
+
+class send_mmsghdr(ctypes.Structure):
+  _fields_ = [('msg_hdr', send_msghdr), ('msg_len', ctypes.c_uint)]
+
+def load_mmsg():
+  '''
+  Returns:
+    (recvmmsg, sendmmsg) of the libc, or (None, None) if it does not have them, e.g. on Mac OS X
+  '''
+  try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+    recvmmsg = libc.recvmmsg
+    sendmmsg = libc.sendmmsg
+  except (OSError, AttributeError, TypeError):
+    return (None, None)
+  recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+  sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+  return (recvmmsg, sendmmsg)
+
+(recvmmsg, sendmmsg) = load_mmsg()
+
+def encode_address((host, port)):
+  '''
+  Returns:
+    the struct sockaddr_in of an IPv4 address, as a string
+  '''
+  return pack('=H', socket.AF_INET) + pack('!H', port) + socket.inet_aton(host) + '\0' * 8
+
+def decode_address(raw):
+  '''
+  Returns:
+    (host, port) of a struct sockaddr_in, or None for another family
+  '''
+  (family,) = unpack_from('=H', raw)
+  if family != socket.AF_INET:
+    return None
+  (port,) = unpack_from('!H', raw, 2)
+  return (socket.inet_ntoa(raw[4:8]), port)
+
+class RecvBuffers(object):
+  ''' The message headers, the buffers and the address buffers to read up to count datagrams, allocated once per port
+  '''
+  def __init__(self, count, size, *args, **kwargs):
+    super(RecvBuffers, self).__init__()
+    self.count = count
+    self.msgs = (mmsghdr * count)()
+    self.iovs = (iovec * count)()
+    self.buffers = [ctypes.create_string_buffer(size) for i in xrange(count)]
+    self.names = [ctypes.create_string_buffer(sockaddr_size) for i in xrange(count)]
+    for i in xrange(count):
+      self.iovs[i].iov_base = ctypes.addressof(self.buffers[i])
+      self.iovs[i].iov_len = size
+      self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovs[i])
+      self.msgs[i].msg_hdr.msg_iovlen = 1
+      self.msgs[i].msg_hdr.msg_name = ctypes.addressof(self.names[i])
+
+class SendBuffers(object):
+  ''' The message headers to send up to count datagrams, allocated once per port
+  '''
+  def __init__(self, count, *args, **kwargs):
+    super(SendBuffers, self).__init__()
+    self.count = count
+    self.msgs = (send_mmsghdr * count)()
+    self.iovs = (send_iovec * count)()
+    self.headers = [msg.msg_hdr for msg in self.msgs]
+    for i in xrange(count):
+      self.headers[i].msg_iov = ctypes.pointer(self.iovs[i])
+      self.headers[i].msg_iovlen = 1
+    self.address = ctypes.addressof(self.msgs)
+
+class BatchedUdpPort(object):
+  ''' A UDP port registered with the reactor as a reader, in place of reactor.listenUDP.
+  Every time the socket is readable, up to max_batch datagrams are read, with one recvmmsg call where available, and handed to the protocol in one datagramsReceived call if it has one (datagramReceived is called for each otherwise).
+  Writes may come from any thread. They are queued and sent together at the end of the reactor iteration, with one sendmmsg call per max_batch datagrams where available, or as soon as max_batch of them are queued.
+  '''
+  implements(IReadDescriptor)
+  __logger = Logger.get_logger('BatchedUdpPort')
+
+  max_size = 65536
+
+  def __init__(self, port, protocol, interface = '', max_batch = 64, reactor = None, *args, **kwargs):
+    '''
+    Args:
+      port (int): the port to listen on
+      protocol (DatagramProtocol): the protocol, e.g. the PeetsMediaTranslator
+
+    Kwargs:
+      interface (str): the address to bind to, all interfaces if empty
+      max_batch (int): the most datagrams read, or sent, in one go
+      reactor: the Twisted reactor; the global reactor is used if not given
+    '''
+    super(BatchedUdpPort, self).__init__()
+    if reactor is None:
+      from twisted.internet import reactor
+    self.reactor = reactor
+    self.port = port
+    self.protocol = protocol
+    self.interface = interface
+    self.max_batch = max_batch
+    self.socket = None
+    self.lock = Lock()
+    # (data, (host, port)) to send
+    self.queue = []
+    self.flush_scheduled = False
+    self.recv_buffers = None
+    self.send_buffers = None
+    # (host, port) -> encoded sockaddr
+    self.addresses = {}
+    self.reads = 0
+    self.received = 0
+    self.flushes = 0
+    self.sent = 0
+    self.dropped = 0
+
+  def startListening(self):
+    '''Bind the socket, register it with the reactor and connect the protocol. Must be called in the reactor thread.
+    '''
+    self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.socket.bind((self.interface, self.port))
+    self.socket.setblocking(0)
+    self.port = self.socket.getsockname()[1]
+    # a syscall through ctypes costs more than socket.recvfrom, and pays off only with batches
+    if recvmmsg is not None and self.max_batch > 1:
+      self.recv_buffers = RecvBuffers(self.max_batch, self.__class__.max_size)
+      self.send_buffers = SendBuffers(self.max_batch)
+    self.protocol.makeConnection(self)
+    self.reactor.addReader(self)
+
+  def stopListening(self):
+    self.reactor.removeReader(self)
+    self.flush()
+    if self.socket is not None:
+      self.socket.close()
+      self.socket = None
+
+  def fileno(self):
+    return self.socket.fileno() if self.socket is not None else -1
+
+  def logPrefix(self):
+    return 'BatchedUdpPort'
+
+  def getHost(self):
+    return self.socket.getsockname()
+
+  def connectionLost(self, reason):
+    self.stopListening()
+
+  def doRead(self):
+    datagrams = self.read_batch()
+    if not datagrams:
+      return
+    self.reads += 1
+    self.received += len(datagrams)
+    batch_received = getattr(self.protocol, 'datagramsReceived', None)
+    if batch_received is not None:
+      batch_received(datagrams)
+    else:
+      for (data, address) in datagrams:
+        self.protocol.datagramReceived(data, address)
+
+  def read_batch(self):
+    '''
+    Returns:
+      the list of (data, (host, port)) read without blocking, at most max_batch of them
+    '''
+    if self.recv_buffers is None:
+      datagrams = []
+      while len(datagrams) < self.max_batch:
+        try:
+          datagrams.append(self.socket.recvfrom(self.__class__.max_size))
+        except socket.error, e:
+          if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNREFUSED, errno.EINTR):
+            raise
+          break
+      return datagrams
+
+    buffers = self.recv_buffers
+    for msg in buffers.msgs:
+      msg.msg_hdr.msg_namelen = sockaddr_size
+    count = recvmmsg(self.socket.fileno(), buffers.msgs, buffers.count, MSG_DONTWAIT, None)
+    if count < 0:
+      err = ctypes.get_errno()
+      if err not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNREFUSED, errno.EINTR):
+        raise socket.error(err, 'recvmmsg failed')
+      return []
+    datagrams = []
+    for i in xrange(count):
+      # .raw would copy the whole buffer
+      address = decode_address(ctypes.string_at(buffers.names[i], buffers.msgs[i].msg_hdr.msg_namelen))
+      if address is not None:
+        datagrams.append((ctypes.string_at(buffers.buffers[i], buffers.msgs[i].msg_len), address))
+    return datagrams
+
+  def write(self, data, address):
+    '''Queue a datagram to be sent at the end of the reactor iteration; safe to be called from any thread
+
+    Args:
+      data (bytes): the datagram
+      address: (host, port) of the destination; host must be an IPv4 address
+    '''
+    with self.lock:
+      self.queue.append((data, address))
+      full = len(self.queue) >= self.max_batch
+      schedule = not full and not self.flush_scheduled
+      if schedule:
+        self.flush_scheduled = True
+    if full:
+      self.flush()
+    elif schedule:
+      if threadable.isInIOThread():
+        self.reactor.callLater(0, self.flush)
+      else:
+        self.reactor.callFromThread(self.flush)
+
+  def flush(self):
+    '''Send the queued datagrams
+    '''
+    with self.lock:
+      queue = self.queue
+      self.queue = []
+      self.flush_scheduled = False
+    if not queue or self.socket is None:
+      return
+    self.flushes += 1
+    if self.send_buffers is None:
+      for (data, address) in queue:
+        self.send_one(data, address)
+      return
+    # the buffers are shared by the threads that fill the queue
+    with self.lock:
+      for start in xrange(0, len(queue), self.max_batch):
+        self.send_batch(queue[start: start + self.max_batch])
+
+  def send_one(self, data, address):
+    try:
+      self.socket.sendto(data, address)
+      self.sent += 1
+    except socket.error, e:
+      if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS, errno.ECONNREFUSED, errno.EINTR):
+        raise
+      self.dropped += 1
+
+  def send_batch(self, datagrams):
+    '''Send up to max_batch datagrams with sendmmsg; those the socket does not take right away are dropped, as UDP would drop them
+    '''
+    buffers = self.send_buffers
+    iovs = buffers.iovs
+    headers = buffers.headers
+    addresses = self.addresses
+    # the arrays hold on to the strings until they are overwritten
+    for (i, (data, address)) in enumerate(datagrams):
+      name = addresses.get(address)
+      if name is None:
+        name = encode_address(address)
+        addresses[address] = name
+      iov = iovs[i]
+      iov.iov_base = data
+      iov.iov_len = len(data)
+      header = headers[i]
+      header.msg_name = name
+      header.msg_namelen = len(name)
+    sent = 0
+    while sent < len(datagrams):
+      count = sendmmsg(self.socket.fileno(), buffers.address + sent * ctypes.sizeof(send_mmsghdr), len(datagrams) - sent, 0)
+      if count <= 0:
+        err = ctypes.get_errno()
+        if err == errno.EINTR:
+          continue
+        if err not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS, errno.ECONNREFUSED):
+          raise socket.error(err, 'sendmmsg failed')
+        self.dropped += len(datagrams) - sent
+        break
+      sent += count
+    self.sent += sent
+
+  def get_stats(self):
+    '''
+    Returns:
+      a dict with the number of wakeups with data, of datagrams read, of flushes, of datagrams sent and dropped
+    '''
+    return {'reads': self.reads, 'received': self.received, 'flushes': self.flushes, 'sent': self.sent, 'dropped': self.dropped, 'mmsg': self.recv_buffers is not None}
+
+def listen_batched(port, protocol, interface = '', max_batch = 64, reactor = None):
+  '''Like reactor.listenUDP, with a BatchedUdpPort
+
+  Returns:
+    the BatchedUdpPort
+  '''
+  udp_port = BatchedUdpPort(port, protocol, interface, max_batch, reactor)
+  udp_port.startListening()
+  return udp_port
@@ -58,6 +58,41 @@ class User(object):
     '''
     return self.prefix + '/' + self.nick + '/' + self.uid + '/sdp'
 
+  def get_audio_prefix(self):
+    '''
+    Returns:
+      The prefix to be used for user's audio RTP data, when audio and video are published separately
+    '''
+    return self.get_media_prefix() + '/audio'
+
+  def get_video_prefix(self):
+    '''
+    Returns:
+      The prefix to be used for user's video RTP data, when audio and video are published separately
+    '''
+    return self.get_media_prefix() + '/video'
+
+  def get_fec_prefix(self):
+    '''
+    Returns:
+      The prefix to be used for the parity objects of the user's media data
+    '''
+    return self.prefix + '/' + self.nick + '/' + self.uid + '/fec'
+
+  def get_latest_prefix(self):
+    '''
+    Returns:
+      The prefix to be used for the pointers to the latest seqs of the user's media streams
+    '''
+    return self.prefix + '/' + self.nick + '/' + self.uid + '/latest'
+
+  def get_batch_prefix(self):
+    '''
+    Returns:
+      The prefix to be used for the signed roots of the user's batch signed media data
+    '''
+    return self.prefix + '/' + self.nick + '/' + self.uid + '/batch'
+
   def get_sync_prefix(self):
     '''
     Returns:
@@ -83,16 +118,157 @@ class User(object):
     
     return json.loads(str_user, object_hook = as_user)
 
+class SeqBitmap(object):
+  '''The set of the received seqs of a stream, kept as the bits of an integer counted from a base seq. Seqs more than span below the highest one are forgotten, and are not in the set.
+  '''
+  span = 4096
+
+  def __init__(self, base = 0, *args, **kwargs):
+    super(SeqBitmap, self).__init__()
+    self.base = base
+    self.bits = 0
+
+  def add(self, seq):
+    offset = seq - self.base
+    if offset < 0:
+      return
+    if offset >= 2 * self.__class__.span:
+      drop = offset - self.__class__.span
+      self.bits >>= drop
+      self.base += drop
+      offset -= drop
+    self.bits |= 1 << offset
+
+  def __contains__(self, seq):
+    offset = seq - self.base
+    return offset >= 0 and (self.bits >> offset) & 1 == 1
+
+class StreamState(object):
+  '''The fetching status of one media stream of a remote user. E.g. self.requested_seq and self.fetched_seq are the highest sequence numbers for data Interests that have been send and Data that has been received so far. self.timeouts record the number of consecutive timeouts.
+  The seqs whose Interests are outstanding, the seqs received, and the seqs found missing when a later one came back are tracked as well, so that a lost packet can be fetched again on its own.
+  '''
+  (Stopped, Probing, Streaming) = range(3)
+  def __init__(self, remote_user, kind, *args, **kwargs):
+    '''
+    Args:
+      remote_user (RemoteUser): the publisher of the stream
+      kind: the kind of the stream, e.g. PeetsMediaTranslator.AudioStream
+    '''
+    super(StreamState, self).__init__()
+    self.remote_user = remote_user
+    self.kind = kind
+    # the fec.FecDecoder of the stream, if parity objects are fetched; it outlives the resets, as the seqs stay the same
+    self.fec_decoder = None
+    # the number of Interests sent again for missing seqs, and of missing seqs given up as too late to play out
+    self.refetched = 0
+    self.skipped = 0
+    # the number of Interests that timed out
+    self.expired = 0
+    # the pacing.StreamClock that times the Interests, if they are paced
+    self.clock = None
+    # the DelayedCall of the next paced refill
+    self.pace_call = None
+    self.reset()
+
+  def reset(self):
+    '''Resets the data streaming related field to default. This should be called when a large number of timeouts have been experienced and the data fetch falls back to probing mode.
+    '''
+    self.requested_seq = 0
+    self.fetched_seq = 0
+    self.streaming_state = self.__class__.Stopped
+    self.timeouts = 0
+    # the seqs whose Interests are outstanding
+    self.pending = set()
+    self.received = SeqBitmap()
+    # missing seq -> the time a later seq was received
+    self.gaps = {}
+
+  def start(self, seq):
+    '''Start streaming from the seq the probe brought back
+    '''
+    self.requested_seq = seq
+    self.fetched_seq = seq
+    self.timeouts = 0
+    self.pending = set()
+    self.received = SeqBitmap(seq)
+    self.received.add(seq)
+    self.gaps = {}
+    self.streaming_state = self.__class__.Streaming
+
+  def on_data(self, seq, now):
+    '''Record the Data of a seq, and the seqs below it that are still missing
+
+    Args:
+      seq (int): the seq of the Data
+      now (float): the time it came back
+    '''
+    self.pending.discard(seq)
+    self.received.add(seq)
+    self.gaps.pop(seq, None)
+    if seq > self.fetched_seq:
+      for missing in xrange(max(self.fetched_seq + 1, seq - SeqBitmap.span), seq):
+        if missing not in self.received:
+          self.gaps.setdefault(missing, now)
+      self.fetched_seq = seq
+    self.timeouts = 0
+
+  def on_recovered(self, seq):
+    '''Record a seq that has been rebuilt from the other packets, so that it is not fetched again
+    '''
+    self.received.add(seq)
+    self.gaps.pop(seq, None)
+
+  def get_outstanding(self):
+    '''
+    Returns:
+      the number of Interests of the stream in the fetching window
+    '''
+    return len(self.pending) if self.streaming_state == self.__class__.Streaming else 0
+
+class CtrlState(object):
+  '''The fetching status of the ctrl stream (STUN and RTCP) a remote user sends to a local user. Unlike the media, the ctrl packets come now and then, so most of the Interests of its window wait at the publisher for packets not produced yet.
+  self.next_seq is the lowest seq not requested yet and self.fetched_seq the highest seq received; self.pending maps the seqs whose Interests are outstanding to the number of times they were sent again.
+  '''
+  def __init__(self, key, *args, **kwargs):
+    '''
+    Args:
+      key: the key of the ctrl stream in the NameCache, (id of the remote user, PeetsMediaTranslator.CtrlStream, id of the local user)
+    '''
+    super(CtrlState, self).__init__()
+    self.key = key
+    self.next_seq = 0
+    self.fetched_seq = -1
+    self.pending = {}
+    # the number of ctrl packets received, of Interests that timed out and of seqs given up
+    self.fetched = 0
+    self.expired = 0
+    self.dropped = 0
+
+  def start(self, seq):
+    '''Start streaming after the seq the probe brought back
+    '''
+    self.next_seq = seq + 1
+    self.fetched_seq = seq
+    self.pending = {}
+
+  def on_data(self, seq):
+    self.pending.pop(seq, None)
+    self.fetched_seq = max(self.fetched_seq, seq)
+    self.fetched += 1
+
+  def get_stats(self):
+    return {'fetched': self.fetched, 'expired': self.expired, 'dropped': self.dropped}
+
 class RemoteUser(User, StateObject):
   '''Inherit from User and StateObject. This is to store information about the remote users. 
 
-  In addition to the data field in User, it adds several fields to represent the data streaming status of a remote user. E.g. self.requested_seq and self.fetched_seq are the highest sequence numbers for data Interests that have been send and Data that has been received so far. self.timeouts record the number of consecutive timeouts. 
+  In addition to the data field in User, it keeps the StreamState of each media stream of the remote user (a single media stream, or one for audio and one for video), and the fetching window and jitter buffer they share.
 
   It also records other states for the remote user, like the ice candidate msg or whether the sdp has been sent. This is required because WebRTC requires to receive sdp before ice candidate msg, but the two may be received in the reverse order.
 
   It is also an object that could be put into a list managed in softstate fashion.
   '''
-  (Stopped, Probing, Streaming) = range(3)
+  (Stopped, Probing, Streaming) = (StreamState.Stopped, StreamState.Probing, StreamState.Streaming)
   def __init__(self, user, *args, **kwargs):
     '''
 
@@ -101,10 +277,12 @@ class RemoteUser(User, StateObject):
 
     '''
     super(RemoteUser, self).__init__(user.nick, user.prefix, user.uid, *args, **kwargs)
-    self.requested_seq = 0
-    self.fetched_seq = 0
-    self.streaming_state = self.__class__.Stopped
-    self.timeouts = 0
+    # kind -> StreamState of the media streams
+    self.streams = {}
+    # the fetchwindow.FetchWindow of the media Interests, if the window is adaptive
+    self.window = None
+    # the jitterbuffer.JitterBuffer for the fetched media, if reordering is enabled
+    self.jitter_buffer = None
     self.ice_candidate_msg = None
     self.sdp_sent = False
 
@@ -118,13 +296,20 @@ class RemoteUser(User, StateObject):
     '''
     self.sdp_sent = True
 
+  def get_stream(self, kind):
+    '''Get the StreamState of a media stream, creating it if needed
+    '''
+    stream = self.streams.get(kind)
+    if stream is None:
+      stream = StreamState(self, kind)
+      self.streams[kind] = stream
+    return stream
+
   def reset(self):
-    '''Resets the data streaming related field to default. This should be called when a large number of timeouts have been experienced and the data fetch falls back to probing mode.
+    '''Resets all the media streams to default.
     '''
-    self.requested_seq = 0
-    self.fetched_seq = 0
-    self.streaming_state = self.__class__.Stopped
-    self.timeouts = 0
+    for stream in self.streams.values():
+      stream.reset()
 
   def get_prescence(self):
     '''Get the remote user presence
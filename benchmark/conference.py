@@ -0,0 +1,319 @@
+import os
+import sys
+import argparse
+from struct import pack, unpack_from
+from time import time, clock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from backend.ccnxsocket import CcnxSocket, reactor_queue
+from backend.localccn import LocalForwarder, LocalHandle, Link
+from backend.protocol import PeetsServerProtocol, PeetsMediaTranslator
+from backend.user import RemoteUser
+
+'''
+Runs a conference of N participants in one process: every participant has its own PeetsMediaTranslator, all of them talk through a LocalForwarder whose links add the given delay, jitter and loss.
+Every participant sends a stream of RTP packets as if from its browser, and the packets written back to the browsers are timestamped on arrival, so the harness reports the media delivery latency, the loss and the CPU cost per packet.
+With a video rate, every participant also sends a video stream, and the latency and the loss are reported for the audio and the video separately.
+With listeners, every translator also serves that many local users who only receive, as several browsers behind one proxy do; the media is still fetched once per remote participant.
+With a fec group, the translators publish and fetch parity objects; the harness reports the parity objects published, the packets rebuilt from them and the loss that remains, so the overhead and the recovery of a group size can be compared under the injected loss.
+The join time is the time from the start until a receiver gets the first media packet of a sender, which is the time to find the latest seq of the stream, with the pointer objects or with the probes.
+With top speakers, only the first talkers participants talk, as the audio levels in their packets say, and the translators fetch the video of the top speakers only; the video delivered from every sender is reported.
+With an rtcp rate, every participant also sends RTCP packets on its PeerConnection to every other participant, which go over the ctrl streams; their latency and loss are reported on their own.
+'''
+
+local_ip = '127.0.0.1'
+source_port_base = 5000
+sink_port_base = 6000
+# the sink ports of the n-th local user of a translator start at sink_port_base + n * sink_port_step
+sink_port_step = 100
+# RTP header, then the packet counter and the send time
+packet_format = '!BBHII'
+header_size = 12
+stamp_format = '!Id'
+audio_pt = 111
+video_pt = 100
+# an RTCP receiver report; the low 7 bits of its packet type are recorded as its pt
+rtcp_pt = 201
+# the id of the audio level header extension, and the levels (-dBov) of the talkers and of the others
+audio_level_id = 1
+talking_level = 20
+silent_level = 127
+# the RTP clock rates of the audio and the video
+audio_clock = 48000
+video_clock = 90000
+
+class StaticRoster(dict):
+  '''A roster that never changes; like FreshList, unknown ids give None
+  '''
+  def __getitem__(self, uid):
+    return self.get(uid)
+
+class SimFactory(object):
+  '''The parts of PeetsServerFactory that the translator uses
+  '''
+  def __init__(self, clients, roster):
+    super(SimFactory, self).__init__()
+    self.clients = dict([(c.id, c) for c in clients])
+    # all the local users share the roster
+    self.roster = roster
+    self.local_status_callback = lambda status: 0
+    self.client_status_callback = lambda client, status: 0
+
+  def set_local_status_callback(self, callback):
+    self.local_status_callback = callback
+
+  def set_client_status_callback(self, callback):
+    self.client_status_callback = callback
+
+  def set_remote_status_callback(self, callback):
+    pass
+
+  def set_offer_callback(self, callback):
+    pass
+
+  def get_roster(self, client):
+    return self.roster
+
+  def has_local_client(self):
+    return True
+
+  def start(self):
+    self.local_status_callback('Running')
+    for client in self.clients.values():
+      self.client_status_callback(client, 'Joined')
+
+  def stop(self):
+    for client in self.clients.values():
+      self.client_status_callback(client, 'Left')
+    self.local_status_callback('Stopped')
+
+class SinkTransport(object):
+  '''Records the packets the translator writes to the browser
+  '''
+  def __init__(self, index, stats):
+    super(SinkTransport, self).__init__()
+    self.index = index
+    self.stats = stats
+
+  def write(self, data, (host, port)):
+    now = time()
+    (count, sent) = unpack_from(stamp_format, data, get_stamp_offset(data))
+    (listener, sender) = divmod(port - sink_port_base, sink_port_step)
+    self.stats.received(sender, (self.index, listener), ord(data[1]) & 0x7f, count, now - sent)
+
+class Stats(object):
+  def __init__(self, n):
+    super(Stats, self).__init__()
+    # (sender, pt) -> number of packets sent
+    self.sent = {}
+    # (sender, receiver, pt) -> set of counters
+    self.counters = {}
+    # pt -> latencies
+    self.latencies = {}
+    self.start_time = None
+    # (sender, receiver) -> the time the first packet arrived
+    self.joined = {}
+
+  def received(self, sender, receiver, pt, count, latency):
+    self.counters.setdefault((sender, receiver, pt), set()).add(count)
+    self.latencies.setdefault(pt, []).append(latency)
+    if pt != rtcp_pt & 0x7f:
+      self.joined.setdefault((sender, receiver), time())
+
+  def get_join_times(self):
+    return [t - self.start_time for t in self.joined.values()]
+
+  def get_latencies(self, pt = None):
+    if pt is not None:
+      return self.latencies.get(pt, [])
+    return [l for latencies in self.latencies.values() for l in latencies]
+
+  def get_loss(self, pt = None):
+    '''The fraction of the packets missing between the first packet a receiver got from a sender and the last packet the sender sent
+    '''
+    expected = 0
+    got = 0
+    for ((sender, receiver, packet_pt), counters) in self.counters.items():
+      if pt is None or packet_pt == pt:
+        expected += self.sent[(sender, packet_pt)] - min(counters)
+        got += len(counters)
+    return 1 - float(got) / expected if expected > 0 else 0.0
+
+def get_packet(index, count, size, pt = audio_pt, rate = 50, level = None):
+  # the audio and the video of a participant have different ssrcs
+  ssrc = index * 2 + (pt == video_pt)
+  timestamp = int(count * (video_clock if pt == video_pt else audio_clock) / rate) & 0xffffffff
+  if level is None:
+    payload = pack(packet_format, 0x80, pt, count & 0xffff, timestamp, ssrc)
+  else:
+    # with a one-byte header extension (RFC 5285) carrying the audio level (RFC 6464)
+    payload = pack(packet_format, 0x90, pt, count & 0xffff, timestamp, ssrc) + pack('!HHBBH', 0xBEDE, 1, audio_level_id << 4, level, 0)
+  payload += pack(stamp_format, count, time())
+  return payload + 'x' * max(0, size - len(payload))
+
+def get_stamp_offset(data):
+  '''
+  Returns:
+    the offset of the packet counter and the send time, after the header extension if there is one
+  '''
+  if ord(data[0]) & 0x10:
+    return header_size + 8
+  return header_size
+
+def print_latencies(label, latencies, loss):
+  latencies = sorted(latencies)
+  n = len(latencies)
+  if n == 0:
+    print '%s: no packet delivered' % label
+    return
+  print '%s: delivered %d, loss = %.2f%%, latency: mean = %.2f ms, p50 = %.2f ms, p90 = %.2f ms, p99 = %.2f ms' % (label, n, loss * 100, sum(latencies) / n * 1000, latencies[n / 2] * 1000, latencies[n * 9 / 10] * 1000, latencies[min(n - 1, n * 99 / 100)] * 1000)
+
+def make_participants(n, forwarder, args, stats):
+  clients = [PeetsServerProtocol() for i in xrange(n)]
+  translators = []
+  for (i, client) in enumerate(clients):
+    client.media_source_port = source_port_base + i
+    roster = StaticRoster()
+    for (j, other) in enumerate(clients):
+      if j != i:
+        roster[other.id] = RemoteUser(other.local_user)
+    local_clients = [client] + [PeetsServerProtocol() for l in xrange(args.listeners)]
+    for (l, local_client) in enumerate(local_clients):
+      local_client.ip = local_ip
+      for (j, other) in enumerate(clients):
+        if j != i:
+          port = sink_port_base + l * sink_port_step + j
+          local_client.media_sink_ports[other.id] = port
+          # as set up by the ice candidate, so the ctrl packets from the port are published for the other participant
+          local_client.remote_cids[port] = other.id
+          local_client.ctrl_seqs[port] = 0
+
+    link = Link(args.delay / 1000.0, args.jitter / 1000.0, args.loss)
+    translator = PeetsMediaTranslator(SimFactory(local_clients, roster), args.pipe_size, loop = args.loop, max_window = args.max_window, jitter_delay = args.jitter_delay / 1000.0, bundle_interval = args.bundle_interval / 1000.0, split_media = args.split_media, audio_reserve = args.audio_reserve, fec_group = args.fec_group, latest_interval = args.latest_interval / 1000.0, pace_interests = args.pace_interests, playout_deadline = args.playout_deadline / 1000.0, top_speakers = args.top_speakers, ctrl_window = args.ctrl_window, ctrl_lifetime = args.ctrl_lifetime / 1000.0, handle_factory = lambda link = link: LocalHandle(forwarder, link))
+    translator.transport = SinkTransport(i, stats)
+    translators.append(translator)
+  return translators
+
+def run(args):
+  forwarder = LocalForwarder(None if args.cache < 0 else args.cache, seed = 1)
+  stats = Stats(args.participants)
+  translators = make_participants(args.participants, forwarder, args, stats)
+  senders = []
+  parities = []
+
+  def send(i, pt, size, rate):
+    count = stats.sent.get((i, pt), 0)
+    level = None
+    if pt == audio_pt and args.top_speakers > 0:
+      level = talking_level if i < args.talkers else silent_level
+    translators[i].datagramReceived(get_packet(i, count, size, pt, rate, level), (local_ip, source_port_base + i))
+    stats.sent[(i, pt)] = count + 1
+
+  def send_rtcp(i):
+    count = stats.sent.get((i, rtcp_pt & 0x7f), 0)
+    for j in xrange(len(translators)):
+      if j != i:
+        # sent on the PeerConnection to j, whose packets are written back to the same port
+        translators[i].datagramReceived(get_packet(i, count, args.size, rtcp_pt), (local_ip, sink_port_base + j))
+    stats.sent[(i, rtcp_pt & 0x7f)] = count + 1
+
+  def start():
+    stats.start_time = time()
+    for t in translators:
+      t.factory.start()
+    for i in xrange(len(translators)):
+      for (pt, rate, size) in [(audio_pt, args.rate, args.size), (video_pt, args.video_rate, args.video_size)]:
+        if rate > 0:
+          sender = LoopingCall(send, i, pt, size, rate)
+          sender.start(1.0 / rate)
+          senders.append(sender)
+      if args.rtcp_rate > 0:
+        sender = LoopingCall(send_rtcp, i)
+        sender.start(1.0 / args.rtcp_rate)
+        senders.append(sender)
+
+  def finish():
+    parities.extend([e.get_stats()['parities'] for t in translators for e in t.fec_encoders.values()])
+    for t in translators:
+      t.factory.stop()
+      t.ccnx_int_socket.stop()
+      t.ccnx_con_socket.stop()
+    reactor.stop()
+
+  def stop_sending():
+    for sender in senders:
+      sender.stop()
+    # let the packets in flight arrive
+    reactor.callLater(1 + 4 * args.delay / 1000.0, finish)
+
+  start_cpu = clock()
+  reactor.callWhenRunning(start)
+  reactor.callLater(args.duration, stop_sending)
+  reactor.run()
+  cpu = clock() - start_cpu
+
+  n = len(stats.get_latencies())
+  published = sum(stats.sent.values())
+  print 'participants = %d, listeners = %d, delay = %.1f ms, jitter = %.1f ms, loss = %.3f' % (args.participants, args.listeners, args.delay, args.jitter, args.loss)
+  if n == 0:
+    print 'no packet delivered'
+    return
+  print 'published %d' % published
+  print_latencies('all', stats.get_latencies(), stats.get_loss())
+  if args.rtcp_rate > 0:
+    print_latencies('rtcp', stats.get_latencies(rtcp_pt & 0x7f), stats.get_loss(rtcp_pt & 0x7f))
+  if args.video_rate > 0:
+    print_latencies('audio', stats.get_latencies(audio_pt), stats.get_loss(audio_pt))
+    print_latencies('video', stats.get_latencies(video_pt), stats.get_loss(video_pt))
+  if args.top_speakers > 0:
+    delivered = [sum([len(c) for ((sender, receiver, pt), c) in stats.counters.items() if sender == i and pt == video_pt]) for i in xrange(args.participants)]
+    print 'video delivered from every sender (the first %d talk): %s, top speakers changed %d times' % (args.talkers, delivered, sum([t.speakers.changes for t in translators if t.speakers is not None]))
+  joins = stats.get_join_times()
+  print 'join: first packet of a sender after mean = %.2f ms, max = %.2f ms' % (sum(joins) / len(joins) * 1000, max(joins) * 1000)
+  print 'cpu: %.1f us per published packet, %.1f us per delivered packet' % (cpu / published * 1e6, cpu / n * 1e6)
+  print 'forwarder: %s' % forwarder.get_stats()
+  handoff = reactor_queue.get_stats()
+  print 'handoff to the reactor: %d calls in %d wakeups, at most %d in one' % (handoff['handed'], handoff['drains'], handoff['max_depth'])
+  streams = [s for t in translators for u in t.factory.roster.values() for s in u.streams.values()]
+  print 'interests: %d timed out, sent again %d for missing packets, skipped %d too late' % (sum([s.expired for s in streams]), sum([s.refetched for s in streams]), sum([s.skipped for s in streams]))
+  if args.fec_group > 0:
+    decoders = [s.fec_decoder.get_stats() for t in translators for u in t.factory.roster.values() for s in u.streams.values() if s.fec_decoder is not None]
+    print 'fec: group %d, published %d parity objects (%.1f%% overhead), received %d, rebuilt %d packets, dropped %d duplicates' % (args.fec_group, sum(parities), 100.0 * sum(parities) / published, sum([x['parities'] for x in decoders]), sum([x['recovered'] for x in decoders]), sum([x['duplicates'] for x in decoders]))
+  buffers = [u.jitter_buffer for t in translators for u in t.factory.roster.values() if u.jitter_buffer is not None]
+  if buffers:
+    stats = [b.get_stats() for b in buffers]
+    print 'jitter buffers: reordered %d, max reorder depth %d, late drops %d, skipped %d' % (sum([x['reordered'] for x in stats]), max([x['max_reorder_depth'] for x in stats]), sum([x['late_drops'] for x in stats]), sum([x['skipped'] for x in stats]))
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description = 'End-to-end media delivery of N participants over an in-process forwarder')
+  parser.add_argument('-n', '--participants', action = 'store', dest = 'participants', metavar = 'participants', type = int, help = 'the number of participants', default = 3)
+  parser.add_argument('--listeners', action = 'store', dest = 'listeners', metavar = 'listeners', type = int, help = 'the number of local users of every translator who only receive', default = 0)
+  parser.add_argument('-t', '--duration', action = 'store', dest = 'duration', metavar = 'duration', type = float, help = 'the time in seconds every participant sends media', default = 10)
+  parser.add_argument('-r', '--rate', action = 'store', dest = 'rate', metavar = 'rate', type = float, help = 'the packets per second every participant sends', default = 50)
+  parser.add_argument('--size', action = 'store', dest = 'size', metavar = 'size', type = int, help = 'the size of the packets in bytes', default = 160)
+  parser.add_argument('--delay', action = 'store', dest = 'delay', metavar = 'delay', type = float, help = 'the one-way delay of every link in ms', default = 10)
+  parser.add_argument('--jitter', action = 'store', dest = 'jitter', metavar = 'jitter', type = float, help = 'the maximum jitter of every link in ms', default = 0)
+  parser.add_argument('--loss', action = 'store', dest = 'loss', metavar = 'loss', type = float, help = 'the loss rate of every link', default = 0)
+  parser.add_argument('--cache', action = 'store', dest = 'cache', metavar = 'cache', type = int, help = 'the number of objects cached by the forwarder, -1 for no limit and 0 for no caching', default = 1000)
+  parser.add_argument('-p', '--pipe-size', action = 'store', dest = 'pipe_size', metavar = 'pipe_size', type = int, help = 'the fetching window of the translators', default = 20)
+  parser.add_argument('-w', '--max-window', action = 'store', dest = 'max_window', metavar = 'max_window', type = int, help = 'if positive, the largest adaptive fetching window of the translators', default = 0)
+  parser.add_argument('-j', '--jitter-delay', action = 'store', dest = 'jitter_delay', metavar = 'ms', type = float, help = 'if positive, reorder the fetched media in a jitter buffer with this target delay', default = 0)
+  parser.add_argument('-b', '--bundle-interval', action = 'store', dest = 'bundle_interval', metavar = 'ms', type = float, help = 'if positive, publish the media in bundles of up to this many ms', default = 0)
+  parser.add_argument('--video-rate', action = 'store', dest = 'video_rate', metavar = 'rate', type = float, help = 'if positive, every participant also sends this many video packets per second', default = 0)
+  parser.add_argument('--video-size', action = 'store', dest = 'video_size', metavar = 'size', type = int, help = 'the size of the video packets in bytes', default = 1000)
+  parser.add_argument('-s', '--split-media', action = 'store_true', dest = 'split_media', help = 'publish and fetch the audio and the video as separate streams')
+  parser.add_argument('--audio-reserve', action = 'store', dest = 'audio_reserve', metavar = 'interests', type = int, help = 'with --split-media, the Interests of a fetching window kept for the audio', default = 4)
+  parser.add_argument('-f', '--fec-group', action = 'store', dest = 'fec_group', metavar = 'packets', type = int, help = 'if positive, publish a parity object for every this many media packets and rebuild the lost ones from it', default = 0)
+  parser.add_argument('-d', '--playout-deadline', action = 'store', dest = 'playout_deadline', metavar = 'ms', type = float, help = 'fetch a missing packet again for up to this long after a later one came back', default = 200)
+  parser.add_argument('--latest-interval', action = 'store', dest = 'latest_interval', metavar = 'ms', type = float, help = 'publish the pointers to the latest seqs at most this often, and start fetching from them; 0 probes with childSelector instead', default = 0)
+  parser.add_argument('-k', '--top-speakers', action = 'store', dest = 'top_speakers', metavar = 'speakers', type = int, help = 'if positive, with --split-media, only fetch the video of this many loudest remote participants', default = 0)
+  parser.add_argument('--talkers', action = 'store', dest = 'talkers', metavar = 'participants', type = int, help = 'with --top-speakers, the number of participants whose audio levels say they talk; the others are silent', default = 1)
+  parser.add_argument('--rtcp-rate', action = 'store', dest = 'rtcp_rate', metavar = 'rate', type = float, help = 'if positive, every participant also sends this many RTCP packets per second to every other participant', default = 0)
+  parser.add_argument('--ctrl-window', action = 'store', dest = 'ctrl_window', metavar = 'interests', type = int, help = 'the Interests kept outstanding for every ctrl stream', default = 8)
+  parser.add_argument('--ctrl-lifetime', action = 'store', dest = 'ctrl_lifetime', metavar = 'ms', type = float, help = 'the lifetime of the ctrl Interests', default = 1000)
+  parser.add_argument('--pace-interests', action = 'store_true', dest = 'pace_interests', help = 'send the media Interests when their packets are about to be produced')
+  parser.add_argument('-l', '--loop', action = 'store', dest = 'loop', metavar = 'loop', choices = [CcnxSocket.ThreadLoop, CcnxSocket.ReactorLoop], help = 'the event loop of the CcnxSockets', default = CcnxSocket.ThreadLoop)
+  run(parser.parse_args())
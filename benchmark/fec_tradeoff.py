@@ -0,0 +1,59 @@
+import os
+import sys
+import argparse
+import subprocess
+from time import clock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.fec import FecEncoder, FecDecoder
+
+'''
+The overhead and the recovery of the XOR parity objects for several group sizes.
+First the CPU cost of making the parity of a group and of rebuilding a packet from it; then, for every loss rate and group size, a conference over the lossy in-process forwarder (see conference.py), each in its own process, which reports the parity objects published, the packets rebuilt and the loss left.
+'''
+
+def measure_cost(group_size, size, groups):
+  payloads = ['x' * size] * group_size
+  parities = []
+  encoder = FecEncoder(lambda group, parity: parities.append(parity), group_size)
+  start = clock()
+  for seq in xrange(groups * group_size):
+    encoder.add(seq, payloads[0])
+  encode = clock() - start
+
+  rebuilt = []
+  decoder = FecDecoder(lambda seq, payload: rebuilt.append(seq))
+  start = clock()
+  for (group, parity) in enumerate(parities):
+    first = group * group_size
+    # the first packet of every group is lost
+    for seq in xrange(first + 1, first + group_size):
+      decoder.add_data(seq, payloads[0])
+    decoder.add_parity(parity)
+  decode = clock() - start
+  print 'group %d: encode %.1f us per packet, rebuild %.1f us per lost packet (rebuilt %d of %d)' % (group_size, encode / (groups * group_size) * 1e6, decode / groups * 1e6, len(rebuilt), groups)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description = 'Overhead and recovery of the XOR parity objects against the group size and the loss rate')
+  parser.add_argument('-g', '--groups', action = 'store', dest = 'groups', metavar = 'sizes', type = str, help = 'the group sizes to compare, comma separated; 0 is without parity', default = '0,2,4,8')
+  parser.add_argument('--losses', action = 'store', dest = 'losses', metavar = 'rates', type = str, help = 'the loss rates of the links, comma separated', default = '0.01,0.03,0.05')
+  parser.add_argument('-t', '--duration', action = 'store', dest = 'duration', metavar = 'duration', type = float, help = 'the time in seconds every participant sends media', default = 5)
+  parser.add_argument('-n', '--participants', action = 'store', dest = 'participants', metavar = 'participants', type = int, help = 'the number of participants', default = 3)
+  parser.add_argument('--size', action = 'store', dest = 'size', metavar = 'size', type = int, help = 'the size of the packets in bytes', default = 160)
+  parser.add_argument('--cost-only', action = 'store_true', dest = 'cost_only', help = 'only measure the CPU cost')
+  args = parser.parse_args()
+
+  group_sizes = [int(g) for g in args.groups.split(',')]
+  for group_size in group_sizes:
+    if group_size > 0:
+      measure_cost(group_size, args.size, 1000)
+  if args.cost_only:
+    sys.exit(0)
+
+  conference = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conference.py')
+  # the reactor can not be restarted, so every run gets its own process
+  for loss in args.losses.split(','):
+    for group_size in group_sizes:
+      print
+      subprocess.call([sys.executable, conference, '-n', str(args.participants), '-t', str(args.duration), '--size', str(args.size), '--loss', loss, '-f', str(group_size)])
@@ -0,0 +1,101 @@
+import os
+import sys
+import argparse
+import subprocess
+from time import time, clock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from backend.ccnxsocket import CcnxSocket
+from backend.localccn import LocalForwarder, LocalHandle, Link
+from backend.protocol import PeetsServerProtocol, PeetsMediaTranslator
+from backend.user import User, RemoteUser
+from conference import StaticRoster, SimFactory, SinkTransport, Stats, get_packet, local_ip, sink_port_base, audio_pt
+
+'''
+Compares refilling the media fetching window from the callbacks of the Interests against refilling it from the 10 ms scheduler job.
+One translator fetches the media of N remote users, each published by a plain CcnxSocket at a fixed rate over a LocalForwarder.
+Reports the delivery latency and the CPU time per delivered packet while the remote users stream, and the CPU used while they are silent.
+'''
+
+def run(args):
+  forwarder = LocalForwarder(args.cache, seed = 1)
+  link = Link(args.delay / 1000.0)
+  stats = Stats(args.users)
+  users = [User('user%d' % i, '/local/sim', 'uid%d' % i) for i in xrange(args.users)]
+
+  client = PeetsServerProtocol()
+  client.ip = local_ip
+  roster = StaticRoster()
+  for (i, user) in enumerate(users):
+    roster[user.uid] = RemoteUser(user)
+    client.media_sink_ports[user.uid] = sink_port_base + i
+  factory = SimFactory([client], roster)
+  translator = PeetsMediaTranslator(factory, args.pipe_size, loop = args.loop, fetch_interval = args.fetch_interval / 1000.0, handle_factory = lambda: LocalHandle(forwarder, link))
+  translator.transport = SinkTransport(0, stats)
+  producer = CcnxSocket(loop = args.loop, handle = LocalHandle(forwarder, link))
+  producer.start()
+
+  def send():
+    for (i, user) in enumerate(users):
+      count = stats.sent.get((i, audio_pt), 0)
+      producer.publish_content(user.get_media_prefix() + '/' + str(count), get_packet(i, count, args.size), 1)
+      stats.sent[(i, audio_pt)] = count + 1
+
+  sender = LoopingCall(send)
+  cpu = {}
+
+  def start():
+    cpu['start'] = clock()
+    factory.start()
+    sender.start(1.0 / args.rate)
+
+  def stop_sending():
+    sender.stop()
+    cpu['streaming'] = clock() - cpu['start']
+    cpu['start'] = clock()
+    reactor.callLater(args.idle, finish)
+
+  def finish():
+    cpu['idle'] = clock() - cpu['start']
+    factory.stop()
+    translator.ccnx_int_socket.stop()
+    translator.ccnx_con_socket.stop()
+    producer.stop()
+    reactor.stop()
+
+  reactor.callWhenRunning(start)
+  reactor.callLater(args.duration, stop_sending)
+  reactor.run()
+
+  latencies = sorted(stats.get_latencies())
+  n = len(latencies)
+  mode = 'tick %d ms' % args.fetch_interval if args.fetch_interval > 0 else 'event'
+  if n == 0:
+    print '%-11s users = %3d, no packet delivered' % (mode, args.users)
+    return
+  print '%-11s users = %3d, delivered %6d, loss = %5.2f%%, latency p50 = %6.2f ms, p99 = %6.2f ms, cpu = %5.1f us/packet, idle cpu = %5.1f%%' % (mode, args.users, n, stats.get_loss() * 100, latencies[n / 2] * 1000, latencies[min(n - 1, n * 99 / 100)] * 1000, cpu['streaming'] / n * 1e6, cpu['idle'] / args.idle * 100)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description = 'Event-driven against periodic refilling of the media fetching window')
+  parser.add_argument('-n', '--users', action = 'store', dest = 'users', metavar = 'users', type = int, help = 'the number of remote users; if not given, run 2, 10 and 50 users with both ways of refilling, each in its own process')
+  parser.add_argument('-f', '--fetch-interval', action = 'store', dest = 'fetch_interval', metavar = 'ms', type = int, help = 'the interval of the refilling job; 0 refills from the callbacks', default = 0)
+  parser.add_argument('-t', '--duration', action = 'store', dest = 'duration', metavar = 'duration', type = float, help = 'the time in seconds the remote users stream', default = 10)
+  parser.add_argument('--idle', action = 'store', dest = 'idle', metavar = 'idle', type = float, help = 'the time in seconds the remote users stay silent afterwards', default = 5)
+  parser.add_argument('-r', '--rate', action = 'store', dest = 'rate', metavar = 'rate', type = float, help = 'the packets per second of every remote user', default = 50)
+  parser.add_argument('--size', action = 'store', dest = 'size', metavar = 'size', type = int, help = 'the size of the packets in bytes', default = 160)
+  parser.add_argument('--delay', action = 'store', dest = 'delay', metavar = 'delay', type = float, help = 'the one-way delay of every link in ms', default = 10)
+  parser.add_argument('--cache', action = 'store', dest = 'cache', metavar = 'cache', type = int, help = 'the number of objects cached by the forwarder', default = 1000)
+  parser.add_argument('-p', '--pipe-size', action = 'store', dest = 'pipe_size', metavar = 'pipe_size', type = int, help = 'the fetching window of the translator', default = 20)
+  parser.add_argument('-l', '--loop', action = 'store', dest = 'loop', metavar = 'loop', choices = [CcnxSocket.ThreadLoop, CcnxSocket.ReactorLoop], help = 'the event loop of the CcnxSockets', default = CcnxSocket.ThreadLoop)
+  args = parser.parse_args()
+
+  if args.users is not None:
+    run(args)
+  else:
+    # the reactor can not be restarted, so every run gets its own process
+    for users in [2, 10, 50]:
+      for fetch_interval in [10, 0]:
+        subprocess.call([sys.executable, os.path.abspath(__file__), '-n', str(users), '-f', str(fetch_interval), '-t', str(args.duration), '--idle', str(args.idle), '-r', str(args.rate), '--size', str(args.size), '--delay', str(args.delay), '--cache', str(args.cache), '-p', str(args.pipe_size), '-l', args.loop])
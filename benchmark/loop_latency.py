@@ -0,0 +1,97 @@
+import os
+import sys
+import argparse
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.ccnxsocket import CcnxSocket, PeetsClosure
+from backend.localccn import LocalForwarder, LocalHandle
+
+'''
+Measures the Interest-to-Data latency of CcnxSocket driven by the polling thread loop and by the reactor loop.
+A consumer socket sends one Interest at a time to a producer socket that answers from its Interest filter; both talk through a LocalForwarder, so no ccnd is needed.
+As in the PeetsMediaTranslator, the answers and the next Interests are sent from the reactor thread. With the thread loop they wait in the handle until its select times out, up to 50 ms.
+'''
+
+prefix = '/local/bench/loop'
+
+def report(loop, latencies):
+  latencies.sort()
+  n = len(latencies)
+  mean = sum(latencies) / n
+  print '%-8s n = %d, mean = %.3f ms, p50 = %.3f ms, p90 = %.3f ms, p99 = %.3f ms' % (loop, n, mean * 1000, latencies[n / 2] * 1000, latencies[n * 9 / 10] * 1000, latencies[min(n - 1, n * 99 / 100)] * 1000)
+
+def ping_pong(loop, count, done):
+  '''Set up a producer and a consumer and return the function that sends the first Interest
+
+  Args:
+    loop (str): CcnxSocket.ThreadLoop or CcnxSocket.ReactorLoop
+    count (int): the number of Interests to send
+    done: called with the list of latencies after the last Data comes back
+  '''
+  forwarder = LocalForwarder()
+  producer = CcnxSocket(loop = loop, handle = LocalHandle(forwarder))
+  consumer = CcnxSocket(loop = loop, handle = LocalHandle(forwarder))
+  payload = 'x' * 160
+  latencies = []
+  state = {'seq': 0, 'sent': 0}
+
+  def answer(interest):
+    producer.publish_content(str(interest.name), payload, 1)
+
+  def send():
+    state['sent'] = time()
+    consumer.send_interest(prefix + '/' + str(state['seq']), closure)
+
+  def received(interest, data):
+    latencies.append(time() - state['sent'])
+    state['seq'] += 1
+    if state['seq'] < count:
+      send()
+    else:
+      producer.stop()
+      consumer.stop()
+      done(latencies)
+
+  closure = PeetsClosure(msg_callback = received, in_reactor = True)
+  producer.register_prefix(prefix, PeetsClosure(incoming_interest_callback = answer, in_reactor = True))
+  producer.start()
+  consumer.start()
+  return send
+
+def run_loops(loops, count):
+  '''Measure the loops one after the other in a single run of the reactor, which can not be restarted
+
+  Returns:
+    loop -> list of latencies
+  '''
+  from twisted.internet import reactor
+  result = {}
+
+  def run_next(left):
+    if not left:
+      reactor.stop()
+      return
+
+    def done(latencies):
+      result[left[0]] = latencies
+      # let the loops stop before the next one starts
+      reactor.callLater(0.1, run_next, left[1:])
+
+    send = ping_pong(left[0], count, done)
+    send()
+
+  reactor.callWhenRunning(run_next, loops)
+  reactor.run()
+  return result
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description = 'Interest-to-Data latency of the CcnxSocket event loops')
+  parser.add_argument('-n', '--count', action = 'store', dest = 'count', metavar = 'count', type = int, help = 'the number of Interests per loop', default = 2000)
+  args = parser.parse_args()
+
+  loops = [CcnxSocket.ThreadLoop, CcnxSocket.ReactorLoop]
+  result = run_loops(loops, args.count)
+  for loop in loops:
+    report(loop, result[loop])
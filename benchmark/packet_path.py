@@ -0,0 +1,105 @@
+import os
+import sys
+import argparse
+from threading import RLock
+from time import clock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pyccn
+from backend.ccnxsocket import NameCache
+from backend.connstate import ConnectionIndex
+from backend.user import User, RemoteUser
+
+'''
+Measures the per-packet overhead of looking up the connection state on the packet path, before and after the ConnectionIndex.
+Send: a ctrl packet from the browser is mapped from its local port to the remote user and gets its name.
+Receive: the name of a fetched packet is mapped back to the remote user.
+'''
+
+prefix = '/local/bench'
+ctrl_stream = 2
+
+class LockedRoster(object):
+  '''The lookup of FreshList: a dict behind a recursive lock
+  '''
+  def __init__(self):
+    self.lock = RLock()
+    self.instances = {}
+
+  def __getitem__(self, k):
+    with self.lock:
+      return self.instances.get(k, None)
+
+class LocalClient(object):
+  '''The part of PeetsServerProtocol the ConnectionIndex uses
+  '''
+  def __init__(self, id):
+    super(LocalClient, self).__init__()
+    self.id = id
+
+def setup(peers):
+  users = [RemoteUser(User('user%d' % i, prefix, 'uid%d' % i)) for i in xrange(peers)]
+  local_user = User('local', prefix, 'localuid')
+  client = LocalClient(local_user.uid)
+  roster = LockedRoster()
+  ctrl_seqs = {}
+  remote_cids = {}
+  index = ConnectionIndex()
+  names = NameCache()
+  for (i, user) in enumerate(users):
+    port = 10000 + i
+    roster.instances[user.uid] = user
+    ctrl_seqs[port] = 0
+    remote_cids[port] = user.uid
+    index.subscribe(user.uid, client).remote_user = user
+    conn = index.connect(client, user.uid, port)
+    conn.ctrl_prefix = names.add_prefix((user.uid, ctrl_stream, client.id), local_user.get_ctrl_prefix() + '/' + user.uid)
+    names.add_prefix((user.uid, 0), user.get_media_prefix())
+  return (users, local_user, roster, ctrl_seqs, remote_cids, index, names)
+
+def send_old(state, port):
+  (users, local_user, roster, ctrl_seqs, remote_cids, index, names) = state
+  ctrl_seq = ctrl_seqs[port]
+  cid = remote_cids[port]
+  name = pyccn.Name(local_user.get_ctrl_prefix() + '/' + cid + '/' + str(ctrl_seq))
+  ctrl_seqs[port] = ctrl_seq + 1
+  return name
+
+def send_new(state, port):
+  index = state[5]
+  conn = index.get_by_port(port)
+  name = conn.ctrl_prefix.append(str(conn.ctrl_seq))
+  conn.ctrl_seq += 1
+  return name
+
+def receive_old(state, name):
+  roster = state[2]
+  comps = str(name).split('/')
+  cid = comps[-3]
+  seq = int(comps[-1])
+  return roster[cid], seq
+
+def receive_new(state, name):
+  (index, names) = state[5:7]
+  key, seq = names.parse(name)
+  peer = index.get(key[0])
+  return peer.remote_user, seq
+
+def measure(f, args, count):
+  start = clock()
+  for i in xrange(count):
+    f(*args[i % len(args)])
+  return (clock() - start) / count
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description = 'Per-packet overhead of the connection state lookups')
+  parser.add_argument('-n', '--count', action = 'store', dest = 'count', metavar = 'count', type = int, help = 'the number of packets', default = 200000)
+  parser.add_argument('-p', '--peers', action = 'store', dest = 'peers', metavar = 'peers', type = int, help = 'the number of remote users', default = 10)
+  args = parser.parse_args()
+
+  state = setup(args.peers)
+  ports = [(state, 10000 + i) for i in xrange(args.peers)]
+  received = [(state, name) for name in [state[6].get_name((u.uid, 0), 1234) for u in state[0]]]
+  for (label, f, f_args) in [('send old', send_old, ports), ('send new', send_new, ports), ('recv old', receive_old, received), ('recv new', receive_new, received)]:
+    print '%-8s %.2f us/packet' % (label, measure(f, f_args, args.count) * 1e6)
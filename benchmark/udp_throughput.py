@@ -0,0 +1,216 @@
+import os
+import sys
+import socket
+import argparse
+import resource
+import subprocess
+from struct import pack
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from twisted.internet import reactor
+from twisted.internet.protocol import DatagramProtocol
+from backend.localccn import LocalForwarder, LocalHandle
+from backend.protocol import PeetsServerProtocol, PeetsMediaTranslator
+from backend.udpbatch import BatchedUdpPort
+import backend.udpbatch
+
+'''
+The packets per second per core of the UDP path between the browser and the proxy, with one datagram per wakeup and with batches.
+Receive: a blaster process sends RTP packets as fast as it can to a port served by a BatchedUdpPort, from the port of the media source of a local user. The packets go to a counting protocol, or to a PeetsMediaTranslator that publishes them to an in-process forwarder. The CPU time of the receiving process, all threads included, gives the packets handled per second of one core.
+Send: the packets are written to the port in bursts, one burst per reactor iteration as the deliveries of fetched media are, and sent to a socket nobody reads.
+A max batch of 1 is the path before the batching: one upcall and one system call per packet. With --twisted, the receive side uses reactor.listenUDP instead.
+'''
+
+local_ip = '127.0.0.1'
+source_port = 5000
+rtp_format = '!BBHII'
+
+def get_cpu():
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  return usage.ru_utime + usage.ru_stime
+
+def blast(port, count, size):
+  sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  sock.bind((local_ip, source_port))
+  for i in xrange(count):
+    packet = pack(rtp_format, 0x80, 111, i & 0xffff, (i * 960) & 0xffffffff, 1)
+    sock.sendto(packet + 'x' * max(0, size - len(packet)), (local_ip, port))
+
+class CountingProtocol(DatagramProtocol):
+  def __init__(self):
+    self.received = 0
+
+  def datagramReceived(self, data, address):
+    self.received += 1
+
+  def datagramsReceived(self, datagrams):
+    self.received += len(datagrams)
+
+class CountingHandle(LocalHandle):
+  '''Counts the packets the translator publishes
+  '''
+  published = 0
+
+  def put(self, co):
+    CountingHandle.published += 1
+    return LocalHandle.put(self, co)
+
+class SimFactory(object):
+  def __init__(self, client):
+    super(SimFactory, self).__init__()
+    self.clients = {client.id: client}
+    self.roster = {}
+    self.local_status_callback = lambda status: 0
+    self.client_status_callback = lambda client, status: 0
+
+  def set_local_status_callback(self, callback):
+    self.local_status_callback = callback
+
+  def set_client_status_callback(self, callback):
+    self.client_status_callback = callback
+
+  def set_remote_status_callback(self, callback):
+    pass
+
+  def set_offer_callback(self, callback):
+    pass
+
+  def get_roster(self, client):
+    return self.roster
+
+  def has_local_client(self):
+    return True
+
+def make_translator(args):
+  client = PeetsServerProtocol()
+  client.ip = local_ip
+  client.media_source_port = source_port
+  factory = SimFactory(client)
+  forwarder = LocalForwarder(0)
+  translator = PeetsMediaTranslator(factory, 20, batch_size = args.sign_batch, handle_factory = lambda: CountingHandle(forwarder))
+  def start():
+    factory.local_status_callback('Running')
+    factory.client_status_callback(client, 'Joined')
+  def stop():
+    factory.client_status_callback(client, 'Left')
+    factory.local_status_callback('Stopped')
+    translator.ccnx_int_socket.stop()
+    translator.ccnx_con_socket.stop()
+  return (translator, start, stop)
+
+def run_receive(args):
+  if args.translator:
+    (protocol, start, stop) = make_translator(args)
+    get_count = lambda: CountingHandle.published
+  else:
+    protocol = CountingProtocol()
+    (start, stop) = (lambda: 0, lambda: 0)
+    get_count = lambda: protocol.received
+
+  if args.twisted:
+    port = reactor.listenUDP(0, protocol, interface = local_ip)
+    port_number = port.getHost().port
+  else:
+    port = BatchedUdpPort(0, protocol, interface = local_ip, max_batch = args.max_batch)
+    port.startListening()
+    port_number = port.port
+  result = {}
+
+  def finish():
+    result['cpu'] = get_cpu() - result['cpu']
+    result['count'] = get_count()
+    stop()
+    reactor.stop()
+
+  def wait(blaster, last):
+    count = get_count()
+    if blaster.poll() is not None and count == last:
+      # nothing came in since the blaster exited
+      result['elapsed'] = time() - result['start']
+      finish()
+    else:
+      reactor.callLater(0.2, wait, blaster, count)
+
+  def begin():
+    start()
+    result['start'] = time()
+    result['cpu'] = get_cpu()
+    blaster = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--blast', str(port_number), '-c', str(args.count), '--size', str(args.size)])
+    reactor.callLater(0.2, wait, blaster, -1)
+
+  reactor.callWhenRunning(begin)
+  reactor.run()
+  label = 'twisted' if args.twisted else 'max batch %d' % args.max_batch
+  target = 'translator' if args.translator else 'counter'
+  print 'receive, %s, %s: %d of %d packets, %.0f packets/s per core' % (label, target, result['count'], args.count, result['count'] / result['cpu'])
+  if not args.twisted:
+    stats = port.get_stats()
+    print '  %d wakeups, %.1f packets per wakeup, recvmmsg: %s' % (stats['reads'], float(stats['received']) / max(1, stats['reads']), stats['mmsg'])
+
+def run_send(args):
+  sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+  sink.bind((local_ip, 0))
+  address = sink.getsockname()
+  port = BatchedUdpPort(0, CountingProtocol(), interface = local_ip, max_batch = args.max_batch)
+  port.startListening()
+  packet = pack(rtp_format, 0x80, 111, 0, 0, 1)
+  packet += 'x' * max(0, args.size - len(packet))
+  result = {}
+
+  def burst(left):
+    for i in xrange(min(left, args.burst)):
+      port.write(packet, address)
+    left -= args.burst
+    if left > 0:
+      reactor.callLater(0, burst, left)
+    else:
+      reactor.callLater(0, finish)
+
+  def finish():
+    result['cpu'] = get_cpu() - result['cpu']
+    port.stopListening()
+    reactor.stop()
+
+  def begin():
+    result['cpu'] = get_cpu()
+    burst(args.count)
+
+  reactor.callWhenRunning(begin)
+  reactor.run()
+  stats = port.get_stats()
+  print 'send, max batch %d: %d packets, %.0f packets/s per core, %d flushes, %d dropped, sendmmsg: %s' % (args.max_batch, stats['sent'], args.count / result['cpu'], stats['flushes'], stats['dropped'], stats['mmsg'])
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description = 'Packets per second per core of the UDP path of the proxy, one packet or a batch per wakeup')
+  parser.add_argument('-m', '--mode', action = 'store', dest = 'mode', choices = ['receive', 'send', 'compare'], help = 'measure the receive path, the send path, or both with a max batch of 1 and of --max-batch, each in its own process', default = 'compare')
+  parser.add_argument('-B', '--max-batch', action = 'store', dest = 'max_batch', metavar = 'packets', type = int, help = 'the most packets read or sent per wakeup', default = 64)
+  parser.add_argument('-c', '--count', action = 'store', dest = 'count', metavar = 'packets', type = int, help = 'the number of packets', default = 200000)
+  parser.add_argument('--size', action = 'store', dest = 'size', metavar = 'size', type = int, help = 'the size of the packets in bytes', default = 160)
+  parser.add_argument('--burst', action = 'store', dest = 'burst', metavar = 'packets', type = int, help = 'the packets written per reactor iteration when sending', default = 64)
+  parser.add_argument('--translator', action = 'store_true', dest = 'translator', help = 'hand the received packets to a PeetsMediaTranslator that publishes them, rather than only counting them')
+  parser.add_argument('--sign-batch', action = 'store', dest = 'sign_batch', metavar = 'packets', type = int, help = 'with --translator, sign the media in batches of up to this many packets', default = 0)
+  parser.add_argument('--twisted', action = 'store_true', dest = 'twisted', help = 'receive with reactor.listenUDP')
+  parser.add_argument('--no-mmsg', action = 'store_true', dest = 'no_mmsg', help = 'use the recvfrom and sendto loops even where recvmmsg and sendmmsg are available')
+  parser.add_argument('--blast', action = 'store', dest = 'blast', metavar = 'port', type = int, help = argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.blast is not None:
+    blast(args.blast, args.count, args.size)
+  elif args.mode == 'compare':
+    # the reactor can not be restarted, so every run gets its own process
+    common = ['-c', str(args.count), '--size', str(args.size), '--burst', str(args.burst), '--sign-batch', str(args.sign_batch)]
+    common += ['--translator'] if args.translator else []
+    common += ['--no-mmsg'] if args.no_mmsg else []
+    for mode in ['receive', 'send']:
+      for max_batch in [1, args.max_batch]:
+        subprocess.call([sys.executable, os.path.abspath(__file__), '-m', mode, '-B', str(max_batch)] + common)
+  else:
+    if args.no_mmsg:
+      backend.udpbatch.recvmmsg = None
+      backend.udpbatch.sendmmsg = None
+    if args.mode == 'receive':
+      run_receive(args)
+    else:
+      run_send(args)
@@ -6,6 +6,8 @@ from twisted.web.static import File
 from twisted.python import log
 from autobahn.websocket import listenWS
 from backend.protocol import PeetsServerProtocol, PeetsServerFactory, PeetsMediaTranslator
+from backend.ccnxsocket import CcnxSocket
+from backend.udpbatch import listen_batched
 import argparse
 from string import Template
 
@@ -37,6 +39,26 @@ if __name__ == '__main__':
   parser.add_argument('-t', '--tcp', action = 'store', dest = 'tcp', metavar = 'port', type = int, help = 'the port for http', default = 8888)
   parser.add_argument('-w', '--ws', action = 'store', dest = 'ws', metavar = 'port', type = int, help = 'the port for websocket', default = 8000)
   parser.add_argument('-u', '--udp', action = 'store', dest = 'udp', metavar = 'port', type = int,  help = 'the port for udp traffice', default = 9000)
+  parser.add_argument('-b', '--batch-size', action = 'store', dest = 'batch_size', metavar = 'packets', type = int, help = 'sign the media in batches of up to this many packets with one signature per batch; 0 signs every packet', default = 0)
+  parser.add_argument('--batch-interval', action = 'store', dest = 'batch_interval', metavar = 'ms', type = int, help = 'the longest a media packet waits for its batch to be signed', default = 20)
+  parser.add_argument('--cache-size', action = 'store', dest = 'cache_size', metavar = 'KB', type = int, help = 'the memory cap of the in-process store of recently published packets; 0 disables it', default = 4096)
+  parser.add_argument('-s', '--sign-workers', action = 'store', dest = 'sign_workers', metavar = 'processes', type = int, help = 'sign outgoing packets in this many worker processes; 0 signs in the reactor thread, -1 uses one process per core', default = 0)
+  parser.add_argument('--handles', action = 'store', dest = 'handles', metavar = 'count', type = int, help = 'the number of ccnx handles to shard the media streams over', default = 1)
+  parser.add_argument('-l', '--loop', action = 'store', dest = 'loop', choices = [CcnxSocket.ThreadLoop, CcnxSocket.ReactorLoop], help = 'the event loop for the media ccnx sockets: poll in a separate thread, or run in the twisted reactor', default = CcnxSocket.ThreadLoop)
+  parser.add_argument('--fetch-interval', action = 'store', dest = 'fetch_interval', metavar = 'ms', type = int, help = 'refill the media fetching windows from a periodic job with this interval; 0 refills them as soon as data comes back', default = 0)
+  parser.add_argument('--max-window', action = 'store', dest = 'max_window', metavar = 'interests', type = int, help = 'size the media fetching windows from the measured RTT and timeouts, up to this many Interests; 0 keeps a fixed window of 20', default = 0)
+  parser.add_argument('--jitter-delay', action = 'store', dest = 'jitter_delay', metavar = 'ms', type = int, help = 'restore the RTP order of the fetched media, waiting at most this long for a missing packet; 0 writes the packets as they arrive', default = 0)
+  parser.add_argument('--bundle-interval', action = 'store', dest = 'bundle_interval', metavar = 'ms', type = int, help = 'publish the local media in bundles of the packets of up to this long, or of one video frame; 0 publishes every packet on its own', default = 0)
+  parser.add_argument('--split-media', action = 'store_true', dest = 'split_media', help = 'publish and fetch the audio and the video as separate streams, filling the fetching windows with audio first')
+  parser.add_argument('--audio-reserve', action = 'store', dest = 'audio_reserve', metavar = 'interests', type = int, help = 'with --split-media, the Interests of a fetching window kept for the audio', default = 4)
+  parser.add_argument('--fec-group', action = 'store', dest = 'fec_group', metavar = 'packets', type = int, help = 'publish a XOR parity object for every this many media packets and rebuild a lost packet from it; all participants must use the same value; 0 disables it', default = 0)
+  parser.add_argument('--playout-deadline', action = 'store', dest = 'playout_deadline', metavar = 'ms', type = int, help = 'fetch a lost media packet again for up to this long after a later packet of its stream came back', default = 200)
+  parser.add_argument('--latest-interval', action = 'store', dest = 'latest_interval', metavar = 'ms', type = int, help = 'publish a pointer to the latest seq of every media stream at most this often, and start fetching a remote stream from its pointer; 0 probes with childSelector instead. All participants must agree', default = 0)
+  parser.add_argument('--pace-interests', action = 'store_true', dest = 'pace_interests', help = 'send the media Interests when their packets are about to be produced, as estimated from the RTP timestamps, rather than as soon as the fetching window has room')
+  parser.add_argument('--ctrl-window', action = 'store', dest = 'ctrl_window', metavar = 'interests', type = int, help = 'the Interests kept outstanding for the stun and rtcp packets of every PeerConnection', default = 8)
+  parser.add_argument('--ctrl-lifetime', action = 'store', dest = 'ctrl_lifetime', metavar = 'ms', type = int, help = 'the lifetime of the Interests for the stun and rtcp packets, after which they are sent again', default = 1000)
+  parser.add_argument('--top-speakers', action = 'store', dest = 'top_speakers', metavar = 'speakers', type = int, help = 'with --split-media, only fetch the video of this many remote users who talked the most lately, and fetch the others audio only; 0 fetches the video of everyone', default = 0)
+  parser.add_argument('--udp-batch', action = 'store', dest = 'udp_batch', metavar = 'packets', type = int, help = 'read and write up to this many udp packets per wakeup, with recvmmsg and sendmmsg where available; 0 uses the twisted udp port, one packet per call', default = 0)
 
   results = parser.parse_args()
 
@@ -48,7 +70,11 @@ if __name__ == '__main__':
   setattr(resource, 'port', results.ws)
   factory = Site(resource)
   reactor.listenTCP(results.tcp, factory)
-  reactor.listenUDP(results.udp, PeetsMediaTranslator(peets_factory, 20))
+  translator = PeetsMediaTranslator(peets_factory, 20, loop = results.loop, batch_size = results.batch_size, batch_interval = results.batch_interval / 1000.0, sign_workers = results.sign_workers, cache_bytes = results.cache_size * 1024, handles = results.handles, fetch_interval = results.fetch_interval / 1000.0, max_window = results.max_window, jitter_delay = results.jitter_delay / 1000.0, bundle_interval = results.bundle_interval / 1000.0, split_media = results.split_media, audio_reserve = results.audio_reserve, fec_group = results.fec_group, playout_deadline = results.playout_deadline / 1000.0, latest_interval = results.latest_interval / 1000.0, pace_interests = results.pace_interests, ctrl_window = results.ctrl_window, ctrl_lifetime = results.ctrl_lifetime / 1000.0, top_speakers = results.top_speakers)
+  if results.udp_batch > 0:
+    listen_batched(results.udp, translator, max_batch = results.udp_batch)
+  else:
+    reactor.listenUDP(results.udp, translator)
   print 'Listening on:'
   print '\t[port %s] for Http' % results.tcp
   print '\t[port %s] for Udp' % results.udp
@@ -0,0 +1,149 @@
+import os
+import sys
+import thread
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pyccn
+from threading import Thread
+from struct import pack
+from twisted.internet import reactor
+from backend import batchsign
+from backend.batchsign import BatchVerifier
+from backend.ccnxsocket import PeetsClosure
+
+class FakeName(object):
+  def __init__(self, uri):
+    self.uri = uri
+
+  def __str__(self):
+    return self.uri
+
+class FakeInterest(object):
+  def __init__(self, uri):
+    self.name = FakeName(uri)
+
+class FakeContentObject(object):
+  def __init__(self, content):
+    self.content = content
+
+class UpcallInfo(object):
+  def __init__(self, interest, co):
+    self.Interest = interest
+    self.ContentObject = co
+
+class FakeSocket(object):
+  '''Records the Interests instead of sending them
+  '''
+  def __init__(self):
+    self.sent = []
+
+  def send_interest(self, name, closure, template = None):
+    self.sent.append((name, closure))
+
+def make_batch(names, payloads):
+  '''
+  Returns:
+    (root hash, the content of every packet)
+  '''
+  levels = batchsign.get_levels([batchsign.get_leaf_hash(names[i], payloads[i]) for i in xrange(len(names))])
+  contents = [batchsign.wrap(1, 0, i, batchsign.get_proof(levels, i), payloads[i]) for i in xrange(len(names))]
+  return (levels[-1][0], contents)
+
+class BatchVerifierTest(unittest.TestCase):
+
+  def setUp(self):
+    self.socket = FakeSocket()
+    self.verifier = BatchVerifier(self.socket)
+    self.names = ['/alice/media/%d' % i for i in xrange(3)]
+    self.payloads = ['packet %d' % i for i in xrange(3)]
+    (self.root, self.contents) = make_batch(self.names, self.payloads)
+
+  def test_deliver_in_reactor_thread(self):
+    '''The root comes back in a ccnx thread, but the held packets are delivered in the reactor thread
+    '''
+    delivered = []
+    def deliver(payload):
+      delivered.append((payload, thread.get_ident()))
+      reactor.stop()
+
+    self.verifier.verify('/alice/batch', self.names[0], self.contents[0], deliver)
+    (root_name, closure) = self.socket.sent[0]
+    self.assertEqual(root_name, '/alice/batch/1/0')
+    upcall = lambda: closure.upcall(pyccn.UPCALL_CONTENT, UpcallInfo(FakeInterest(root_name), FakeContentObject(self.root + pack('!H', 3))))
+    ccnx_thread = []
+    def start():
+      t = Thread(target = upcall)
+      t.start()
+      ccnx_thread.append(t.ident)
+
+    reactor.callWhenRunning(start)
+    reactor.callLater(5, reactor.stop)
+    reactor.run()
+    self.assertEqual(delivered, [(self.payloads[0], thread.get_ident())])
+    self.assertNotEqual(ccnx_thread[0], thread.get_ident())
+
+  def test_reject_wrong_root(self):
+    delivered = []
+    self.verifier.verify('/alice/batch', self.names[1], self.contents[1], delivered.append)
+    # the packet claims another name than it was signed for
+    self.verifier.verify('/alice/batch', self.names[2], self.contents[1], delivered.append)
+    self.verifier.root_callback(FakeInterest('/alice/batch/1/0'), FakeContentObject(self.root))
+    self.assertEqual(delivered, [self.payloads[1]])
+    self.assertEqual((self.verifier.verified, self.verifier.rejected), (1, 1))
+    # the root is remembered, so the next packet is checked right away
+    self.verifier.verify('/alice/batch', self.names[2], self.contents[2], delivered.append)
+    self.assertEqual(delivered, [self.payloads[1], self.payloads[2]])
+    self.assertEqual(len(self.socket.sent), 1)
+
+class CcnbTest(unittest.TestCase):
+
+  def test_encode_name(self):
+    self.assertEqual(batchsign.encode_name(['a']), '\xf2\xfa\x8da\x00\x00')
+    self.assertEqual(batchsign.encode_name(['abc', '']), '\xf2\xfa\x9dabc\x00\xfa\x00\x00')
+    # the headers of the Content Object and of its Signature take two bytes
+    self.assertEqual(batchsign.encode_header(batchsign.dtag_content_object, batchsign.ccnb_dtag), '\x04\x82')
+    self.assertEqual(batchsign.encode_header(batchsign.dtag_signature, batchsign.ccnb_dtag), '\x02\xaa')
+
+  def test_headers(self):
+    for value in [0, 15, 16, 300, 70000]:
+      header = batchsign.encode_header(value, batchsign.ccnb_blob)
+      self.assertEqual(batchsign.decode_header(header + 'rest', 0), (value, batchsign.ccnb_blob, len(header)))
+
+  def test_splice_template(self):
+    '''A packet put together from a template has the Signature and SignedInfo of the template, and its own name and content
+    '''
+    dtag = lambda value: batchsign.encode_header(value, batchsign.ccnb_dtag)
+    signature = dtag(batchsign.dtag_signature) + batchsign.encode_blob_element(54, 'b' * 64) + '\x00'
+    # a SignedInfo with a nested element and an attribute
+    signed_info = dtag(batchsign.dtag_signed_info) + batchsign.encode_blob_element(60, 'k' * 32) + dtag(28) + batchsign.encode_header(3, batchsign.ccnb_dattr) + batchsign.encode_header(0, batchsign.ccnb_udata) + batchsign.encode_blob_element(27, 'key') + '\x00\x00'
+    template = dtag(batchsign.dtag_content_object) + signature + batchsign.encode_name(['alice', 'batch']) + signed_info + batchsign.encode_blob_element(batchsign.dtag_content, '') + '\x00'
+    (head, si) = batchsign.split_template(template)
+    self.assertEqual(head, dtag(batchsign.dtag_content_object) + signature)
+    self.assertEqual(si, signed_info)
+    content = 'x' * 1100
+    packet = head + batchsign.encode_name(['alice', 'media', '7']) + si + batchsign.encode_blob_element(batchsign.dtag_content, content) + '\x00'
+    self.assertEqual(batchsign.skip_item(packet, 0), len(packet))
+    self.assertEqual(batchsign.split_template(packet), (head, si))
+    self.assertTrue(packet.endswith(content + '\x00\x00'))
+
+  def test_not_a_content_object(self):
+    self.assertRaises(ValueError, batchsign.split_template, batchsign.encode_name(['a']))
+
+class AcceptUnverifiedTest(unittest.TestCase):
+
+  def test_only_batched_content_is_taken(self):
+    got = []
+    closure = PeetsClosure(msg_callback = lambda interest, data: got.append(data.content), accept_unverified = batchsign.is_batched)
+    (root, contents) = make_batch(['/a/0'], ['packet'])
+    closure.upcall(pyccn.UPCALL_CONTENT_BAD, UpcallInfo(None, FakeContentObject(contents[0])))
+    closure.upcall(pyccn.UPCALL_CONTENT_BAD, UpcallInfo(None, FakeContentObject('\x80 an RTP packet')))
+    closure.upcall(pyccn.UPCALL_CONTENT_UNVERIFIED, UpcallInfo(None, FakeContentObject('\x80 an RTP packet')))
+    self.assertEqual(got, [contents[0]])
+    strict = PeetsClosure(msg_callback = lambda interest, data: got.append(data.content))
+    strict.upcall(pyccn.UPCALL_CONTENT_BAD, UpcallInfo(None, FakeContentObject(contents[0])))
+    self.assertEqual(got, [contents[0]])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+from struct import pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import bundle
+from backend.bundle import Bundler
+
+def rtp(seq, marker = False, size = 100):
+  return pack('!BBHII', 0x80, 100 | (0x80 if marker else 0), seq, seq * 3000, 43) + 'x' * size
+
+class FakeCall(object):
+  def __init__(self, f, args):
+    self.f = f
+    self.args = args
+    self.done = False
+
+  def active(self):
+    return not self.done
+
+  def cancel(self):
+    self.done = True
+
+class FakeReactor(object):
+  def __init__(self):
+    self.calls = []
+
+  def callLater(self, delay, f, *args):
+    call = FakeCall(f, args)
+    self.calls.append(call)
+    return call
+
+  def run(self):
+    calls = [call for call in self.calls if call.active()]
+    self.calls = []
+    for call in calls:
+      call.done = True
+      call.f(*call.args)
+
+class BundleTest(unittest.TestCase):
+
+  def test_round_trip(self):
+    packets = [rtp(1), rtp(2, size = 0), rtp(3, size = 1000)]
+    content = bundle.bundle(packets)
+    self.assertTrue(bundle.is_bundled(content))
+    self.assertEqual(bundle.unbundle(content), packets)
+
+  def test_truncated(self):
+    packets = [rtp(1), rtp(2)]
+    content = bundle.bundle(packets)
+    # cut off in the second packet, in its length, and right after the header
+    self.assertEqual(bundle.unbundle(content[:-1]), packets[:1])
+    self.assertEqual(bundle.unbundle(content[:bundle.header_size + bundle.length_size + len(packets[0]) + 1]), packets[:1])
+    self.assertEqual(bundle.unbundle(content[:bundle.header_size]), [])
+
+  def test_not_a_bundle(self):
+    packet = rtp(1)
+    self.assertFalse(bundle.is_bundled(packet))
+    self.assertEqual(bundle.unbundle(packet), [packet])
+
+class BundlerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.reactor = FakeReactor()
+    self.published = []
+    self.bundler = Bundler(self.published.append, 0.01, 500, self.reactor)
+
+  def test_flush_on_marker(self):
+    self.bundler.add(rtp(1))
+    self.assertEqual(self.published, [])
+    self.bundler.add(rtp(2, marker = True))
+    self.assertEqual([bundle.unbundle(content) for content in self.published], [[rtp(1), rtp(2, marker = True)]])
+    # the timer of the flushed bundle is cancelled
+    self.reactor.run()
+    self.assertEqual(len(self.published), 1)
+
+  def test_flush_on_interval(self):
+    self.bundler.add(rtp(1))
+    self.reactor.run()
+    # a single packet is published as it is
+    self.assertEqual(self.published, [rtp(1)])
+
+  def test_flush_before_max_bytes(self):
+    for seq in xrange(5):
+      self.bundler.add(rtp(seq))
+    self.assertEqual([len(bundle.unbundle(content)) for content in self.published], [4])
+    self.reactor.run()
+    self.assertEqual(self.published[1], rtp(4))
+    self.assertEqual(self.bundler.get_stats(), {'packets': 5, 'bundles': 2})
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.connstate import ConnectionIndex
+
+class FakeClient(object):
+  def __init__(self, id):
+    self.id = id
+
+class ConnectionIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.index = ConnectionIndex()
+    self.alice = FakeClient('alice')
+    self.carol = FakeClient('carol')
+
+  def test_subscribe_once_per_remote_user(self):
+    peer = self.index.subscribe('bob', self.alice)
+    self.assertIs(self.index.subscribe('bob', self.carol), peer)
+    self.assertIs(self.index.get('bob'), peer)
+    self.assertEqual(sorted(peer.clients), ['alice', 'carol'])
+    self.assertEqual(len(self.index), 1)
+
+  def test_connect_before_and_after_subscribe(self):
+    early = self.index.connect(self.alice, 'bob', 5000)
+    peer = self.index.subscribe('bob', self.alice)
+    self.index.subscribe('bob', self.carol)
+    late = self.index.connect(self.carol, 'bob', 5001)
+    self.assertEqual(peer.connections, [early, late])
+    self.assertIs(self.index.get_by_port(5001), late)
+    self.assertIs(self.index.connect(self.carol, 'bob', 5001), late)
+
+  def test_unsubscribe_last_client(self):
+    peer = self.index.subscribe('bob', self.alice)
+    self.index.subscribe('bob', self.carol)
+    self.index.connect(self.alice, 'bob', 5000)
+    self.assertIs(self.index.unsubscribe('bob', 'alice'), peer)
+    self.assertEqual(peer.connections, [])
+    self.assertEqual(self.index.unsubscribe('bob', 'carol'), None)
+    self.assertEqual(self.index.get('bob'), None)
+
+  def test_readers_keep_their_copy(self):
+    self.index.subscribe('bob', self.alice)
+    by_cid = self.index.by_cid
+    self.index.subscribe('dave', self.alice)
+    self.assertEqual(sorted(by_cid), ['bob'])
+
+  def test_disconnect_and_remove(self):
+    peer = self.index.subscribe('bob', self.alice)
+    self.index.connect(self.alice, 'bob', 5000)
+    self.index.disconnect('alice')
+    self.assertEqual(self.index.get_by_port(5000), None)
+    self.assertEqual(peer.connections, [])
+    self.index.connect(self.alice, 'bob', 5000)
+    self.index.remove('bob')
+    self.assertEqual(self.index.get('bob'), None)
+    self.assertEqual(self.index.get_by_port(5000), None)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import contentstore
+from backend.contentstore import ContentStore
+
+class FakeContentObject(object):
+  def __init__(self, name, content):
+    self.name = name
+    self.content = content
+
+class ContentStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.now = 100.0
+    self.saved_time = contentstore.time
+    contentstore.time = lambda: self.now
+    # room for two objects of 100 bytes of content
+    self.size = len('/peets/alice/media/0') + 100 + ContentStore.object_overhead
+    self.store = ContentStore(2 * self.size, 5.0)
+
+  def tearDown(self):
+    contentstore.time = self.saved_time
+
+  def add(self, seq):
+    co = FakeContentObject('/peets/alice/media/%d' % seq, 'x' * 100)
+    self.store.add(co)
+    return co
+
+  def test_lookup(self):
+    co = self.add(0)
+    self.assertIs(self.store.lookup('/peets/alice/media/0'), co)
+    self.assertEqual(self.store.lookup('/peets/alice/media/1'), None)
+    self.assertEqual(self.store.get_stats()['hits'], 1)
+    self.assertEqual(self.store.get_stats()['misses'], 1)
+
+  def test_evict_oldest_over_max_bytes(self):
+    for seq in xrange(3):
+      self.add(seq)
+    self.assertEqual(len(self.store), 2)
+    self.assertEqual(self.store.lookup('/peets/alice/media/0'), None)
+    self.assertNotEqual(self.store.lookup('/peets/alice/media/2'), None)
+    self.assertEqual(self.store.get_stats()['evicted'], 1)
+    self.assertEqual(self.store.get_stats()['bytes'], 2 * self.size)
+
+  def test_replace_same_name(self):
+    self.add(0)
+    co = self.add(0)
+    self.assertEqual(len(self.store), 1)
+    self.assertEqual(self.store.get_stats()['bytes'], self.size)
+    self.assertIs(self.store.lookup('/peets/alice/media/0'), co)
+
+  def test_evict_older_than_max_age(self):
+    self.add(0)
+    self.now += 5.0
+    self.assertEqual(self.store.lookup('/peets/alice/media/0'), None)
+    self.assertEqual(len(self.store), 0)
+
+  def test_rightmost_child(self):
+    self.add(0)
+    latest = self.add(1)
+    self.assertIs(self.store.lookup('/peets/alice/media', 1), latest)
+    self.assertEqual(self.store.lookup('/peets/alice/media'), None)
+    self.assertEqual(self.store.lookup('/peets/alice/med', 1), None)
+
+if __name__ == '__main__':
+  unittest.main()
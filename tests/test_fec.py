@@ -0,0 +1,67 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import fec
+from backend.fec import FecDecoder, FecEncoder
+
+class FecTest(unittest.TestCase):
+
+  def setUp(self):
+    # payloads of different lengths, so that the length of the missing one has to be rebuilt as well
+    self.payloads = ['a' * 10, 'bc' * 20, '', 'd' * 7]
+    self.parities = []
+    encoder = FecEncoder(lambda group, parity: self.parities.append((group, parity)), 4)
+    for (i, payload) in enumerate(self.payloads):
+      encoder.add(8 + i, payload)
+    self.delivered = []
+    self.decoder = FecDecoder(lambda seq, payload: self.delivered.append((seq, payload)))
+
+  def test_encode_group(self):
+    self.assertEqual(len(self.parities), 1)
+    (group, parity) = self.parities[0]
+    self.assertEqual(group, 2)
+    for i in xrange(len(self.payloads)):
+      others = self.payloads[:i] + self.payloads[i + 1:]
+      self.assertEqual(fec.decode(parity, others), self.payloads[i])
+
+  def test_partial_group(self):
+    parities = []
+    encoder = FecEncoder(lambda group, parity: parities.append(parity), 4)
+    encoder.add(1, 'x')
+    encoder.add(2, 'y')
+    # a gap in the seqs ends the group
+    encoder.add(5, 'z')
+    self.assertEqual(len(parities), 1)
+    self.assertEqual(fec.decode(parities[0], ['x']), 'y')
+
+  def test_recover_one_loss(self):
+    for (i, payload) in enumerate(self.payloads):
+      if i != 1:
+        self.assertTrue(self.decoder.add_data(8 + i, payload))
+    self.decoder.add_parity(self.parities[0][1])
+    self.assertEqual(self.delivered, [(9, self.payloads[1])])
+    # the fetched packet comes after all
+    self.assertFalse(self.decoder.add_data(9, self.payloads[1]))
+    self.assertEqual(self.decoder.get_stats(), {'parities': 1, 'recovered': 1, 'duplicates': 1})
+
+  def test_recover_when_the_parity_comes_first(self):
+    self.decoder.add_parity(self.parities[0][1])
+    for (i, payload) in enumerate(self.payloads[1:]):
+      self.decoder.add_data(9 + i, payload)
+    self.assertEqual(self.delivered, [(8, self.payloads[0])])
+
+  def test_two_losses(self):
+    self.decoder.add_data(8, self.payloads[0])
+    self.decoder.add_data(11, self.payloads[3])
+    self.decoder.add_parity(self.parities[0][1])
+    self.assertEqual(self.delivered, [])
+    self.assertEqual(self.decoder.get_stats()['recovered'], 0)
+    # one of them comes after all, and the other one can be rebuilt
+    self.decoder.add_data(10, self.payloads[2])
+    self.assertEqual(self.delivered, [(9, self.payloads[1])])
+
+if __name__ == '__main__':
+  unittest.main()
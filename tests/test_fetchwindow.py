@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import fetchwindow
+from backend.fetchwindow import FetchWindow
+
+class FetchWindowTest(unittest.TestCase):
+
+  def setUp(self):
+    self.now = 100.0
+    self.saved_time = fetchwindow.time
+    fetchwindow.time = lambda: self.now
+    self.window = FetchWindow(16, 4, 2)
+
+  def tearDown(self):
+    fetchwindow.time = self.saved_time
+
+  def test_slow_start_then_additive_increase(self):
+    for i in xrange(4):
+      self.window.on_data(0.1)
+    self.assertEqual(self.window.get_size(), 8)
+    self.window.on_timeout(self.now - 0.1)
+    self.assertEqual(self.window.get_size(), 4)
+    # one per window past the slow start threshold
+    for i in xrange(4):
+      self.window.on_data(0.1)
+    self.assertEqual(self.window.get_size(), 4)
+    self.window.on_data(0.1)
+    self.assertEqual(self.window.get_size(), 5)
+
+  def test_halve_once_per_burst(self):
+    sent = self.now - 0.1
+    self.window.on_timeout(sent)
+    self.now += 0.5
+    # sent before the decrease
+    self.window.on_timeout(sent)
+    self.assertEqual(self.window.get_size(), 2)
+    self.assertEqual(self.window.decreases, 1)
+
+  def test_clamp_window(self):
+    for i in xrange(100):
+      self.window.on_data(0.1)
+    self.assertEqual(self.window.get_size(), 16)
+    for i in xrange(10):
+      self.now += 1
+      self.window.on_timeout(self.now - 0.1)
+    self.assertEqual(self.window.get_size(), 2)
+
+  def test_clamp_rto(self):
+    self.assertEqual(self.window.get_lifetime(), FetchWindow.initial_rto)
+    self.window.on_data(0.001)
+    self.assertEqual(self.window.get_lifetime(), FetchWindow.min_rto)
+    window = FetchWindow(16)
+    window.on_data(10.0)
+    self.assertEqual(window.get_lifetime(), FetchWindow.max_rto)
+
+  def test_back_off_rto(self):
+    self.window.on_data(0.2)
+    sent = self.now - 0.1
+    self.window.on_timeout(sent)
+    self.assertAlmostEqual(self.window.get_lifetime(), 1.2)
+    # once per burst
+    self.window.on_timeout(sent)
+    self.assertAlmostEqual(self.window.get_lifetime(), 1.2)
+    for i in xrange(3):
+      self.now += 1
+      self.window.on_timeout(self.now - 0.1)
+    self.assertEqual(self.window.get_lifetime(), FetchWindow.max_rto)
+    # the next Data measures the RTT again
+    self.window.on_data(0.2)
+    self.assertTrue(self.window.get_lifetime() < 1.0)
+
+  def test_smoothed_rtt(self):
+    self.window.on_data(0.2)
+    self.assertAlmostEqual(self.window.srtt, 0.2)
+    self.assertAlmostEqual(self.window.rttvar, 0.1)
+    self.assertAlmostEqual(self.window.get_lifetime(), 0.6)
+    self.window.on_data(0.4)
+    self.assertAlmostEqual(self.window.rttvar, 0.125)
+    self.assertAlmostEqual(self.window.srtt, 0.225)
+
+  def test_restart_keeps_rtt(self):
+    self.window.on_data(0.2)
+    self.window.restart()
+    self.assertEqual(self.window.get_size(), 4)
+    self.assertAlmostEqual(self.window.srtt, 0.2)
+
+if __name__ == '__main__':
+  unittest.main()
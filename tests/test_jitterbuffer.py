@@ -0,0 +1,125 @@
+import os
+import sys
+import unittest
+from struct import pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import jitterbuffer
+from backend.jitterbuffer import JitterBuffer
+
+def rtp(seq, ssrc = 42):
+  return pack('!BBHII', 0x80, 111, seq & 0xFFFF, seq * 960, ssrc) + 'payload'
+
+class FakeCall(object):
+  def __init__(self, f, args):
+    self.f = f
+    self.args = args
+    self.done = False
+
+  def active(self):
+    return not self.done
+
+  def cancel(self):
+    self.done = True
+
+class FakeReactor(object):
+  def __init__(self):
+    self.calls = []
+
+  def callLater(self, delay, f, *args):
+    call = FakeCall(f, args)
+    self.calls.append(call)
+    return call
+
+  def run(self):
+    calls = [call for call in self.calls if call.active()]
+    self.calls = []
+    for call in calls:
+      call.done = True
+      call.f(*call.args)
+
+class JitterBufferTest(unittest.TestCase):
+
+  def setUp(self):
+    self.now = 100.0
+    self.saved_time = jitterbuffer.time
+    jitterbuffer.time = lambda: self.now
+    self.reactor = FakeReactor()
+    self.delivered = []
+    self.buffer = JitterBuffer(self.delivered.append, 0.05, self.reactor)
+
+  def tearDown(self):
+    jitterbuffer.time = self.saved_time
+
+  def seqs(self):
+    return [(ord(data[2]) << 8) | ord(data[3]) for data in self.delivered]
+
+  def start(self, seq):
+    # the first packet of a stream is held for the target delay, as the ones before it may still come
+    self.buffer.push(rtp(seq))
+    self.assertEqual(self.delivered, [])
+    self.now += 0.05
+    self.reactor.run()
+    self.assertEqual(self.seqs(), [seq])
+
+  def test_reorder(self):
+    self.start(1)
+    self.buffer.push(rtp(3))
+    self.buffer.push(rtp(4))
+    self.assertEqual(self.seqs(), [1])
+    self.buffer.push(rtp(2))
+    self.assertEqual(self.seqs(), [1, 2, 3, 4])
+    stats = self.buffer.get_stats()
+    self.assertEqual(stats['reordered'], 1)
+    self.assertEqual(stats['max_reorder_depth'], 2)
+
+  def test_skip_gap_and_drop_late(self):
+    self.start(1)
+    self.buffer.push(rtp(3))
+    self.now += 0.05
+    self.reactor.run()
+    self.assertEqual(self.seqs(), [1, 3])
+    self.buffer.push(rtp(2))
+    self.assertEqual(self.seqs(), [1, 3])
+    stats = self.buffer.get_stats()
+    self.assertEqual(stats['skipped'], 1)
+    self.assertEqual(stats['late_drops'], 1)
+
+  def test_duplicate(self):
+    self.start(1)
+    self.buffer.push(rtp(1))
+    self.buffer.push(rtp(2))
+    self.buffer.push(rtp(2))
+    self.assertEqual(self.seqs(), [1, 2])
+
+  def test_seq_wraparound(self):
+    self.start(0xFFFF)
+    self.buffer.push(rtp(0x10001))
+    self.buffer.push(rtp(0x10000))
+    self.assertEqual(self.seqs(), [0xFFFF, 0, 1])
+
+  def test_flush(self):
+    self.start(1)
+    self.buffer.push(rtp(3))
+    self.buffer.flush()
+    self.assertEqual(self.seqs(), [1, 3])
+    self.assertEqual([call for call in self.reactor.calls if call.active()], [])
+    # the stream starts over
+    self.buffer.push(rtp(100))
+    self.assertEqual(self.seqs(), [1, 3])
+
+  def test_clear(self):
+    self.start(1)
+    self.buffer.push(rtp(3))
+    self.buffer.clear()
+    self.assertEqual([call for call in self.reactor.calls if call.active()], [])
+    self.assertEqual(self.seqs(), [1])
+    self.assertEqual(self.buffer.streams, {})
+
+  def test_not_rtp(self):
+    self.buffer.push('\x00\x01stun')
+    self.assertEqual(self.delivered, ['\x00\x01stun'])
+
+if __name__ == '__main__':
+  unittest.main()
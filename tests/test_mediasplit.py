@@ -0,0 +1,48 @@
+import os
+import sys
+import unittest
+from struct import pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.mediasplit import MediaClassifier
+
+sdp = '\r\n'.join([
+  'v=0',
+  'm=audio 1 RTP/SAVPF 120 0',
+  'a=rtpmap:120 opus/48000/2',
+  'a=ssrc:42 cname:alice',
+  'm=video 1 RTP/SAVPF 100',
+  'a=rtpmap:100 VP8/90000',
+  'a=ssrc:43 cname:alice',
+  ''])
+
+def rtp(pt, ssrc):
+  return pack('!BBHII', 0x80, pt, 1, 960, ssrc) + 'payload'
+
+class MediaClassifierTest(unittest.TestCase):
+
+  def test_default_audio_types(self):
+    classifier = MediaClassifier()
+    self.assertTrue(classifier.is_audio(rtp(111, 1)))
+    self.assertFalse(classifier.is_audio(rtp(100, 2)))
+
+  def test_learn_sdp(self):
+    classifier = MediaClassifier(sdp)
+    self.assertEqual(classifier.audio_types, frozenset([120, 0]))
+    self.assertEqual(classifier.ssrcs, {42: True, 43: False})
+    # by the ssrc, whatever the payload type
+    self.assertTrue(classifier.is_audio(rtp(100, 42)))
+    self.assertFalse(classifier.is_audio(rtp(120, 43)))
+    # an unknown ssrc by the payload types of the sdp
+    self.assertTrue(classifier.is_audio(rtp(120, 44)))
+    self.assertFalse(classifier.is_audio(rtp(111, 45)))
+
+  def test_remember_ssrc(self):
+    classifier = MediaClassifier()
+    self.assertTrue(classifier.is_audio(rtp(111, 7)))
+    # the ssrc is remembered from its first packet
+    self.assertTrue(classifier.is_audio(rtp(100, 7)))
+
+if __name__ == '__main__':
+  unittest.main()
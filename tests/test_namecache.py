@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pyccn import Name
+from backend.ccnxsocket import NameCache
+
+class NameCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cache = NameCache()
+    self.key = ('alice', 'media')
+    self.prefix = self.cache.add_prefix(self.key, u'/peets/alice/media')
+
+  def test_add_prefix_once(self):
+    self.assertIs(self.cache.add_prefix(self.key, '/peets/alice/media'), self.prefix)
+    self.assertIs(self.cache.get_prefix(self.key), self.prefix)
+    self.assertEqual(self.cache.get_prefix('bob'), None)
+
+  def test_get_name_and_parse(self):
+    name = self.cache.get_name(self.key, 7)
+    self.assertEqual(list(name.components), list(self.prefix.components) + ['7'])
+    self.assertEqual(self.cache.parse(name), (self.key, 7))
+
+  def test_parse_unknown(self):
+    self.assertEqual(self.cache.parse(Name('/peets/bob/media/7')), (None, None))
+    self.assertEqual(self.cache.parse(Name('/peets/alice/media/latest')), (None, None))
+
+  def test_remove_prefix(self):
+    name = self.cache.get_name(self.key, 7)
+    self.cache.remove_prefix(self.key)
+    self.assertEqual(self.cache.get_prefix(self.key), None)
+    self.assertEqual(self.cache.parse(name), (None, None))
+
+if __name__ == '__main__':
+  unittest.main()
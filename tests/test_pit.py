@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pyccn
+from backend.ccnxsocket import PendingInterestTable
+
+class FakeName(object):
+  def __init__(self, uri):
+    self.components = uri.strip('/').split('/')
+
+class FakeInterest(object):
+  def __init__(self, lifetime):
+    self.childSelector = None
+    self.interestLifetime = lifetime
+
+class Waiter(object):
+  '''A closure that records its upcalls and may re-express from its timeout upcall, as a DeferredClosure does with the reactor loop
+  '''
+  def __init__(self, result = pyccn.RESULT_OK, on_timeout = None):
+    self.result = result
+    self.on_timeout = on_timeout
+    self.upcalls = []
+
+  def upcall(self, kind, upcallInfo):
+    self.upcalls.append(kind)
+    if kind == pyccn.UPCALL_INTEREST_TIMED_OUT and self.on_timeout is not None:
+      self.on_timeout()
+    return self.result
+
+class PendingInterestTableTest(unittest.TestCase):
+
+  def setUp(self):
+    self.pit = PendingInterestTable()
+    self.name = FakeName('/peets/alice/media/7')
+
+  def test_reexpress_from_timeout_upcall(self):
+    again = Waiter()
+    first = Waiter(on_timeout = lambda: self.pit.add(self.name, again, None))
+    pit_closure = self.pit.add(self.name, first, None)
+    self.assertEqual(pit_closure.upcall(pyccn.UPCALL_INTEREST_TIMED_OUT, None), pyccn.RESULT_REEXPRESS)
+    # the waiter added from the upcall has not timed out
+    self.assertEqual(first.upcalls, [pyccn.UPCALL_INTEREST_TIMED_OUT])
+    self.assertEqual(again.upcalls, [])
+    self.assertEqual(self.pit.entries[pit_closure.key], [again])
+    pit_closure.upcall(pyccn.UPCALL_CONTENT, None)
+    self.assertEqual(again.upcalls, [pyccn.UPCALL_CONTENT])
+    self.assertEqual(self.pit.get_outstanding(), {})
+
+  def test_reexpress_for_waiters_that_ask(self):
+    keep = Waiter(pyccn.RESULT_REEXPRESS)
+    drop = Waiter()
+    pit_closure = self.pit.add(self.name, keep, None)
+    self.assertEqual(self.pit.add(self.name, drop, None), None)
+    self.assertEqual(pit_closure.upcall(pyccn.UPCALL_INTEREST_TIMED_OUT, None), pyccn.RESULT_REEXPRESS)
+    self.assertEqual(self.pit.entries[pit_closure.key], [keep])
+
+  def test_remove_when_nobody_asks(self):
+    pit_closure = self.pit.add(self.name, Waiter(), None)
+    self.assertEqual(pit_closure.upcall(pyccn.UPCALL_INTEREST_TIMED_OUT, None), pyccn.RESULT_OK)
+    self.assertEqual(self.pit.entries, {})
+    self.assertEqual(self.pit.get_outstanding(), {})
+
+  def test_aggregate_same_lifetime_only(self):
+    short = self.pit.add(self.name, Waiter(), FakeInterest(0.5))
+    self.assertNotEqual(short, None)
+    self.assertEqual(self.pit.add(self.name, Waiter(), FakeInterest(0.5)), None)
+    # a longer lived Interest must not ride on the short one, or it would time out too early
+    longer = self.pit.add(self.name, Waiter(), FakeInterest(4.0))
+    self.assertNotEqual(longer, None)
+    self.assertNotEqual(short.key, longer.key)
+    self.assertEqual(self.pit.expressed, 2)
+    self.assertEqual(self.pit.aggregated, 1)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.publisher import PublishPipeline
+
+(Ctrl, Audio, Video) = (PublishPipeline.Ctrl, PublishPipeline.Audio, PublishPipeline.Video)
+
+class PublishPipelineTest(unittest.TestCase):
+
+  def setUp(self):
+    self.pipeline = PublishPipeline(None, 1, 3, object())
+    # stop the workers first, so that the queue is only changed by the test
+    self.pipeline.stop()
+    for t in self.pipeline.threads:
+      t.join()
+
+  def publish(self, name, priority):
+    self.pipeline.publish_content(name, 'x', priority = priority)
+
+  def queued(self):
+    return [item[2] for item in self.pipeline.queues[0]]
+
+  def test_drop_lowest_class_oldest_first(self):
+    self.publish('v1', Video)
+    self.publish('a1', Audio)
+    self.publish('v2', Video)
+    self.publish('c1', Ctrl)
+    self.assertEqual(self.queued(), ['a1', 'v2', 'c1'])
+    self.publish('a2', Audio)
+    self.assertEqual(self.queued(), ['a1', 'c1', 'a2'])
+    self.publish('c2', Ctrl)
+    self.assertEqual(self.queued(), ['c1', 'a2', 'c2'])
+    self.assertEqual(self.pipeline.get_stats(), {'queued': 3, 'dropped_ctrl': 0, 'dropped_audio': 1, 'dropped_video': 2})
+
+  def test_drop_new_packet(self):
+    for name in ('c1', 'c2', 'a1'):
+      self.publish(name, Ctrl if name[0] == 'c' else Audio)
+    # nothing queued is less important than a new video packet but the video itself
+    self.publish('v1', Video)
+    self.publish('c3', Ctrl)
+    self.publish('c4', Ctrl)
+    self.assertEqual(self.queued(), ['c2', 'c3', 'c4'])
+    self.assertEqual(self.pipeline.get_stats(), {'queued': 3, 'dropped_ctrl': 1, 'dropped_audio': 1, 'dropped_video': 1})
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import unittest
+from struct import pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend import speakers
+from backend.speakers import SpeakerRanking
+
+def rtp(extension = None, payload = 'x' * 40):
+  '''An RTP packet with a header extension of (profile, elements), padded to 32-bit words
+  '''
+  if extension is None:
+    return pack('!BBHII', 0x80, 111, 1, 960, 42) + payload
+  (profile, elements) = extension
+  elements += '\x00' * (-len(elements) % 4)
+  return pack('!BBHIIHH', 0x90, 111, 1, 960, 42, profile, len(elements) / 4) + elements + payload
+
+class AudioLevelTest(unittest.TestCase):
+
+  def test_one_byte_header(self):
+    # a 2-byte element with id 2 before the audio level with id 3 and the voice activity bit set
+    packet = rtp((0xBEDE, '\x21ab' + '\x30' + chr(0x80 | 25)))
+    self.assertEqual(speakers.get_audio_level(packet, 3), 25)
+    self.assertEqual(speakers.get_audio_level(packet, 1), None)
+
+  def test_two_byte_header(self):
+    packet = rtp((0x1000, '\x02\x02ab' + '\x00' + '\x01\x01' + chr(60)))
+    self.assertEqual(speakers.get_audio_level(packet, 1), 60)
+
+  def test_no_extension(self):
+    self.assertEqual(speakers.get_audio_level(rtp()), None)
+    self.assertEqual(speakers.get_audio_level('\x90' + 'x' * 10), None)
+
+  def test_truncated_extension(self):
+    packet = rtp((0xBEDE, '\x10' + chr(25)), payload = '')
+    self.assertEqual(speakers.get_audio_level(packet[:-3]), None)
+
+  def test_payload_size(self):
+    self.assertEqual(speakers.get_payload_size(rtp()), 40)
+    self.assertEqual(speakers.get_payload_size(rtp((0xBEDE, '\x10\x19'))), 40)
+
+  def test_audio_level_id(self):
+    sdp = 'm=audio 1 RTP/SAVPF 111\r\na=extmap:3/sendrecv urn:ietf:params:rtp-hdrext:ssrc-audio-level\r\n'
+    self.assertEqual(speakers.get_audio_level_id(sdp), 3)
+    self.assertEqual(speakers.get_audio_level_id('m=audio 1 RTP/SAVPF 111\r\n'), speakers.default_audio_level_id)
+    self.assertEqual(speakers.get_audio_level_id(None), speakers.default_audio_level_id)
+
+class SpeakerRankingTest(unittest.TestCase):
+
+  def setUp(self):
+    self.ranking = SpeakerRanking(1)
+    for uid in ('bob', 'carol'):
+      self.ranking.add(uid)
+
+  def test_loudness(self):
+    loud = rtp((0xBEDE, '\x10' + chr(0)))
+    silent = rtp((0xBEDE, '\x10' + chr(127)))
+    self.assertEqual(self.ranking.get_loudness(loud), 1.0)
+    self.assertEqual(self.ranking.get_loudness(silent), 0.0)
+    self.assertEqual(self.ranking.get_loudness(rtp(payload = 'x' * 50)), 0.5)
+
+  def test_rank_with_hold(self):
+    self.ranking.update('bob', 1.0, 0.0)
+    self.assertTrue(self.ranking.rank(0.0))
+    self.assertTrue(self.ranking.is_top('bob'))
+    self.ranking.update('carol', 1.0, 1.0)
+    # bob is held for SpeakerRanking.hold seconds
+    self.assertFalse(self.ranking.rank(1.0))
+    self.assertTrue(self.ranking.is_top('bob'))
+    self.ranking.update('carol', 1.0, 2.5)
+    self.assertTrue(self.ranking.rank(2.5))
+    self.assertEqual(self.ranking.top, ['carol'])
+
+  def test_remove(self):
+    self.ranking.update('bob', 1.0, 0.0)
+    self.ranking.rank(0.0)
+    self.ranking.remove('bob')
+    self.ranking.rank(0.5)
+    self.assertEqual(self.ranking.top, ['carol'])
+
+if __name__ == '__main__':
+  unittest.main()
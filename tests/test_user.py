@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from backend.user import SeqBitmap, StreamState
+
+class SeqBitmapTest(unittest.TestCase):
+
+  def test_add(self):
+    bitmap = SeqBitmap(10)
+    bitmap.add(10)
+    bitmap.add(12)
+    # below the base
+    bitmap.add(9)
+    self.assertEqual([seq for seq in xrange(8, 14) if seq in bitmap], [10, 12])
+
+  def test_slide(self):
+    span = SeqBitmap.span
+    bitmap = SeqBitmap()
+    bitmap.add(0)
+    bitmap.add(span + 10)
+    high = 2 * span + 5
+    bitmap.add(high)
+    # the base moves up to span below the highest seq, and what is below it is forgotten
+    self.assertEqual(bitmap.base, high - span)
+    self.assertFalse(0 in bitmap)
+    self.assertTrue(span + 10 in bitmap)
+    self.assertTrue(high in bitmap)
+    self.assertFalse(high - 1 in bitmap)
+    self.assertTrue(bitmap.bits < 1 << (span + 1))
+
+  def test_slide_far(self):
+    bitmap = SeqBitmap()
+    bitmap.add(1)
+    bitmap.add(1000000)
+    self.assertFalse(1 in bitmap)
+    self.assertTrue(1000000 in bitmap)
+
+class StreamStateTest(unittest.TestCase):
+
+  def setUp(self):
+    self.stream = StreamState(None, 'audio')
+    self.stream.start(100)
+
+  def test_gaps(self):
+    self.stream.on_data(103, 1.0)
+    self.assertEqual(self.stream.gaps, {101: 1.0, 102: 1.0})
+    self.stream.on_data(102, 1.5)
+    self.stream.on_recovered(101)
+    self.assertEqual(self.stream.gaps, {})
+    self.assertEqual(self.stream.fetched_seq, 103)
+
+  def test_gaps_after_slide(self):
+    # the gaps of a long jump are bounded by the span of the bitmap
+    high = 100 + 3 * SeqBitmap.span
+    self.stream.on_data(high, 1.0)
+    self.assertEqual(len(self.stream.gaps), SeqBitmap.span)
+    self.assertEqual(min(self.stream.gaps), high - SeqBitmap.span)
+    self.stream.on_data(high + 2, 2.0)
+    self.assertEqual(self.stream.gaps[high + 1], 2.0)
+    self.assertTrue(high in self.stream.received)
+
+  def test_reset(self):
+    self.stream.pending.add(101)
+    self.stream.on_data(102, 1.0)
+    self.stream.reset()
+    self.assertEqual(self.stream.streaming_state, StreamState.Stopped)
+    self.assertEqual((self.stream.pending, self.stream.gaps, self.stream.get_outstanding()), (set(), {}, 0))
+
+if __name__ == '__main__':
+  unittest.main()